@@ -1,11 +1,18 @@
 # agents/assembly_agent.py
 import json
-import time
-from typing import Dict, Any, Optional, List
+import os
+from typing import Dict, Any, Optional, List, Iterable, Tuple
 
 from .base_agent import BaseAgent
+from utils.checkpoint import RunCheckpoint
+from utils.dimensions import asset_scale, format_dimensions
 from utils.llm_utils import call_llm_api
-from utils.gs_utils import gaussian_splatting_merge, gaussian_splatting_snapshot
+from utils.retry_policy import REMEDIATION_PROMPT_TWEAK, RetryPolicy
+from utils.scene_store import SceneStore
+from utils.scheduler import AssetStream
+from utils.tracing import traced
+from utils.workspace import RunWorkspace
+from utils.gs_utils import gaussian_splatting_snapshot
 from utils.vlm_utils import call_vlm_api
 
 class SceneAssemblyAgent(BaseAgent):
@@ -14,41 +21,106 @@ class SceneAssemblyAgent(BaseAgent):
     职责：通过迭代、视觉验证和多模态决策的循环，智能地将资产逐一放置到场景中。
     """
 
-    def run(self, city_plan: Dict, asset_library: Dict[str, Dict], max_placement_retries: int = 5) -> Optional[Dict[str, Any]]:
+    def __init__(self, backend_pool=None, workspace: Optional[RunWorkspace] = None, retry_policy: Optional[RetryPolicy] = None):
+        super().__init__(backend_pool)
+        # 场景以只追加的清单记录 (SceneStore)，内存中的场景只用于渲染，最终合并PLY在组装结束时导出一次；
+        # 快照与最终场景写入运行独占的工作目录，用过的快照会被释放，超出配额时回收
+        self.workspace = workspace or RunWorkspace("assembly")
+        self.scene_dir = self.workspace.subdir("scene")
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def run(self, city_plan: Dict, asset_library: Dict[str, Dict], asset_instances: Optional[List[Dict[str, str]]] = None, max_placement_retries: Optional[int] = None,
+            checkpoint: Optional[RunCheckpoint] = None, resume: bool = False) -> Optional[Dict[str, Any]]:
         """
         执行详细的、基于视觉反馈的场景组装流程。
+
+        asset_library 中每个唯一资产只生成一次；asset_instances 是指向资产库的轻量实例记录
+        ({"instance_id": ..., "asset_id": ...})，同一资产的多个实例共享同一个高斯模型文件。
+        未提供 asset_instances 时，资产库中的每个条目视为一个实例。
+        提供 checkpoint 时，每个实例处理完毕后都会持久化场景状态；resume 为 True 时从检查点恢复并跳过已处理的实例，
+        否则清空检查点中遗留的场景，从空场景开始组装。
+        """
+        if asset_instances is None:
+            asset_instances = [{"instance_id": asset_id, "asset_id": asset_id} for asset_id in asset_library]
+
+        instances_sorted = sorted(asset_instances, key=lambda inst: "BUILDING" not in inst["asset_id"])
+
+        def iter_instances():
+            for instance in instances_sorted:
+                asset_info = asset_library.get(instance["asset_id"])
+                if asset_info is None:
+                    print(f"\n   🚨 警告：实例 '{instance['instance_id']}' 引用的资产 '{instance['asset_id']}' 不在资产库中，已跳过。")
+                    continue
+                yield instance, asset_info
+
+        return self._assemble(city_plan, iter_instances(), len(instances_sorted), max_placement_retries, checkpoint, resume)
+
+    def run_streaming(self, city_plan: Dict, asset_stream: AssetStream, max_placement_retries: Optional[int] = None,
+                      checkpoint: Optional[RunCheckpoint] = None, resume: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        流式组装：资产生成阶段每通过QA一个资产，其实例就会进入 asset_stream，
+        组装与生成并行进行，不必等待整个资产目录生成完毕。建筑仍然优先放置。
         """
+        return self._assemble(city_plan, iter(asset_stream), None, max_placement_retries, checkpoint, resume)
+
+    @traced("assembly.run", "assembly")
+    def _assemble(self, city_plan: Dict, instance_iter: Iterable[Tuple[Dict[str, str], Dict]], total: Optional[int],
+                  max_placement_retries: Optional[int], checkpoint: Optional[RunCheckpoint],
+                  resume: bool = False) -> Optional[Dict[str, Any]]:
+        """逐个消费 (实例记录, 资产信息)，完成放置、检查点和最终快照。"""
         print("\n" + "="*50)
         print("💡 阶段三：启动视觉增强型场景组装流程")
         print("="*50)
 
+        # store 是只追加的场景存储 (资产原始PLY + 变换清单)，有检查点时位于运行目录内，重启后据此恢复；
+        # scene 是由清单构建的内存场景，只用于渲染快照
+        store = SceneStore(checkpoint.scene_store_dir if checkpoint else self.workspace.subdir("scene_store"))
+        if not resume and len(store):
+            # 复用了已有的运行目录但不是恢复模式: 上一次运行的放置记录不属于本次规划
+            print(f"🧹 运行目录中遗留 {len(store)} 个上一次运行的放置记录，非恢复模式，已清空。")
+            store.clear()
         scene_state = {
-            "merged_ply_path": None,
-            "placed_assets": []
+            "scene": store.build_scene(),
+            "store": store,
+            "placed_assets": store.placed_assets()
         }
+        skipped_instances = []
 
-        asset_ids_sorted = sorted(asset_library.keys(), key=lambda x: "BUILDING" not in x)
+        saved_state = checkpoint.load_scene_state() if checkpoint and resume else None
+        if resume and (saved_state or len(store)):
+            skipped_instances = saved_state["skipped_instances"] if saved_state else []
+            print(f"♻️  从检查点恢复场景: 已放置 {len(scene_state['placed_assets'])} 个实例，已跳过 {len(skipped_instances)} 个实例。")
+        done_instances = {placed["instance_id"] for placed in scene_state["placed_assets"]} | set(skipped_instances)
 
-        for i, asset_id in enumerate(asset_ids_sorted):
-            asset_info = asset_library[asset_id]
-            print(f"\n--- 正在处理资产 {i+1}/{len(asset_ids_sorted)}: '{asset_id}' ---")
+        for i, (instance, asset_info) in enumerate(instance_iter):
+            instance_id = instance["instance_id"]
+            if instance_id in done_instances:
+                continue
+            progress = f"{i+1}/{total}" if total is not None else f"{i+1}"
+            print(f"\n--- 正在处理资产实例 {progress}: '{instance_id}' ---")
 
             placement_success, updated_scene_state = self._place_and_verify_asset_multimodal(
-                asset_id, asset_info, scene_state, city_plan, max_placement_retries
+                instance, asset_info, scene_state, city_plan, max_placement_retries
             )
 
             if placement_success:
                 scene_state = updated_scene_state
-                print(f"   ✅ 资产 '{asset_id}' 已成功放置并合并到场景中。")
+                print(f"   ✅ 资产实例 '{instance_id}' 已成功放置并合并到场景中。")
             else:
-                print(f"   🚨 警告：资产 '{asset_id}' 在 {max_placement_retries} 次尝试后仍无法成功放置，已跳过。")
+                print(f"   🚨 警告：资产实例 '{instance_id}' 在重试预算内仍无法成功放置，已跳过。")
+                skipped_instances.append(instance_id)
+
+            if checkpoint:
+                checkpoint.save_scene_state(scene_state, skipped_instances)
         
         print("\n--- 🚀 所有资产处理完毕，生成最终场景快照 ---")
-        if scene_state["merged_ply_path"]:
-            final_snapshot = gaussian_splatting_snapshot(scene_state["merged_ply_path"], "panoramic", "final_beauty_shot")
+        if len(store):
+            # 最终合并PLY只在这里按清单流式写出一次
+            final_scene_ply = self.workspace.track(store.export(os.path.join(self.scene_dir, "scene_final.ply")))
+            final_snapshot = self._snapshot(scene_state["scene"], "panoramic", "final_beauty_shot")
             print(f"🎉 场景组装完成！最终快照: {final_snapshot}")
             return {
-                "final_scene_ply": scene_state["merged_ply_path"],
+                "final_scene_ply": final_scene_ply,
                 "final_snapshot_path": final_snapshot,
                 "placed_assets_info": scene_state["placed_assets"]
             }
@@ -56,24 +128,37 @@ class SceneAssemblyAgent(BaseAgent):
             print("❌ 场景中没有任何资产被成功放置，组装失败。")
             return None
 
-    def _place_and_verify_asset_multimodal(self, asset_id: str, asset_info: Dict, current_scene_state: Dict, city_plan: Dict, max_retries: int) -> (bool, Dict):
+    @traced("assembly.place", "assembly",
+            attributes=lambda self, instance, *a, **kw: {"asset_id": instance["asset_id"], "instance_id": instance["instance_id"]})
+    def _place_and_verify_asset_multimodal(self, instance: Dict[str, str], asset_info: Dict, current_scene_state: Dict, city_plan: Dict,
+                                           max_retries: Optional[int]) -> (bool, Dict):
         """
-        单个资产的放置、合并、验证循环（多模态增强版）。
+        单个资产实例的放置、合并、验证循环（多模态增强版）。
+        重试预算由 retry_policy 按资产类型的放置通过率决定；QA失败原因会反馈到下一次的布局prompt中。
+        每次尝试把资产暂存进内存场景，QA通过后确认并向场景清单追加一条放置记录，否则回滚，不产生任何中间PLY文件。
         """
+        asset_id = instance["asset_id"]
+        instance_id = instance["instance_id"]
+        scene = current_scene_state["scene"]
+        scale = asset_scale(asset_info.get("estimated_dimensions"))
+
         # 1. 拍摄放置前的全景图，为布局决策提供视觉上下文
         print("   - 📸 正在拍摄当前场景全景图 (用于布局决策)...")
-        panoramic_before_path = gaussian_splatting_snapshot(
-            current_scene_state["merged_ply_path"], "panoramic", f"before_{asset_id}"
-        )
+        panoramic_before = self._snapshot(scene, "panoramic", f"before_{instance_id}")
+
+        budget = self.retry_policy.budget("placement", asset_info['type'], max_retries)
+        history = []
+        feedback = []
 
-        for attempt in range(1, max_retries + 1):
-            print(f"\n   [尝试 {attempt}/{max_retries}] for '{asset_id}':")
+        for attempt in range(1, budget + 1):
+            print(f"\n   [尝试 {attempt}/{budget}] for '{instance_id}':")
             
             # 2. 调用多模态模型决定放置位置（VLM nyní přijímá obraz)
             print("   - 🧠 请求VLM规划放置坐标 (附带场景视觉)...")
-            placement_prompt = self._create_multimodal_placement_prompt(asset_id, asset_info, current_scene_state, city_plan)
+            placement_prompt = self._create_multimodal_placement_prompt(instance, asset_info, current_scene_state, city_plan, feedback)
             # 假设qwen_api可以处理多模态输入
-            placement_str = call_llm_api(placement_prompt, image_path=panoramic_before_path)
+            with self._backend("qwen_next", "llm.placement", instance_id=instance_id, attempt=attempt):
+                placement_str = call_llm_api(placement_prompt, image_path=panoramic_before)
             
             try:
                 placement_data = json.loads(placement_str)
@@ -84,63 +169,89 @@ class SceneAssemblyAgent(BaseAgent):
 
             # 3. 拍摄放置前的“局部”快照
             print(f"   - 📸 正在拍摄目标区域 {target_pos} 的局部快照 (放置前)...")
-            local_before_path = gaussian_splatting_snapshot(
-                current_scene_state["merged_ply_path"], "local", f"before_{asset_id}_local_retry_{attempt}", target_pos
-            )
+            local_before = self._snapshot(scene, "local", f"before_{instance_id}_local_retry_{attempt}", target_pos)
 
-            # 4. 调用模拟API合并高斯模型
+            # 4. 把资产暂存进内存场景 (开销只与资产大小有关)
             print(f"   - 🔗 正在合并模型到场景中... (at {target_pos})")
-            newly_merged_ply = gaussian_splatting_merge(
-                base_scene_ply=current_scene_state["merged_ply_path"],
-                new_asset_ply=asset_info["gaussian_splatting_path"],
+            scene.add(
+                asset_info["gaussian_splatting_path"],
                 position=target_pos,
                 rotation=placement_data["rotation"],
-                step=len(current_scene_state["placed_assets"]) + 1
+                scale=scale
             )
 
             # 5. 拍摄放置后的“局部”和“全景”快照
             print(f"   - 📸 正在拍摄目标区域 {target_pos} 的局部快照 (放置后)...")
-            local_after_path = gaussian_splatting_snapshot(
-                newly_merged_ply, "local", f"after_{asset_id}_local_retry_{attempt}", target_pos
-            )
+            local_after = self._snapshot(scene, "local", f"after_{instance_id}_local_retry_{attempt}", target_pos)
             print("   - 📸 正在拍摄新场景的全景快照 (放置后)...")
-            panoramic_after_path = gaussian_splatting_snapshot(
-                newly_merged_ply, "panoramic", f"after_{asset_id}_pano_retry_{attempt}"
-            )
+            panoramic_after = self._snapshot(scene, "panoramic", f"after_{instance_id}_pano_retry_{attempt}")
             
             # 将所有视觉证据打包
             visual_evidence = {
-                "panoramic_before": panoramic_before_path,
-                "local_before": local_before_path,
-                "panoramic_after": panoramic_after_path,
-                "local_after": local_after_path,
+                "panoramic_before": panoramic_before,
+                "local_before": local_before,
+                "panoramic_after": panoramic_after,
+                "local_after": local_after,
             }
 
             # 6. 调用VLM评估放置质量（使用四张对比图）
             print("   - 🧐 请求VLM进行差分对比，评估放置质量...")
             qa_prompt = self._create_differential_qa_prompt(asset_id, asset_info, placement_data)
-            qa_result_str = call_vlm_api(visual_evidence, qa_prompt)
+            with self._backend("qwen_vl", "qa.placement", instance_id=instance_id, attempt=attempt) as span:
+                qa_result_str = call_vlm_api(visual_evidence, qa_prompt)
+                span.set("response", qa_result_str)
 
             try:
                 qa_result = json.loads(qa_result_str)
+                self.retry_policy.record("placement", asset_info['type'], qa_result.get("pass") is True)
                 if qa_result.get("pass") is True:
+                    scene.commit()
+                    current_scene_state["store"].place(instance_id, asset_id, asset_info["gaussian_splatting_path"],
+                                                       target_pos, placement_data["rotation"], scale)
                     updated_state = current_scene_state.copy()
-                    updated_state["merged_ply_path"] = newly_merged_ply
-                    updated_state["placed_assets"].append({"asset_id": asset_id, **placement_data})
+                    updated_state["placed_assets"].append({"asset_id": asset_id, "instance_id": instance_id, **placement_data})
+                    # 对比快照已完成使命
+                    self._release_snapshots(*visual_evidence.values())
                     return True, updated_state
                 else:
                     print(f"     ❌ 放置质量校验失败: {qa_result.get('reason', '未知原因')}")
             except json.JSONDecodeError:
                 print("     ❌ VLM评估返回了无效的JSON。")
+                qa_result = None
+            # 撤销被拒绝的合并，释放本次尝试的快照
+            scene.rollback()
+            self._release_snapshots(local_before, local_after, panoramic_after)
 
-            if attempt < max_retries:
-                print("      即将重试放置...")
-                time.sleep(1)
+            decision = self.retry_policy.on_failure("placement", asset_info['type'], attempt, budget, qa_result, history)
+            history.append(qa_result)
+            if not decision.retry:
+                print(f"      🛑 停止放置重试: {decision.reason}")
+                break
+            if decision.remediation == REMEDIATION_PROMPT_TWEAK:
+                feedback = decision.hints
+            print(f"      即将重试放置 ({decision.remediation})...")
+            self.retry_policy.wait(decision)
 
+        self._release_snapshots(panoramic_before)
         return False, current_scene_state
 
-    def _create_multimodal_placement_prompt(self, asset_id: str, asset_info: Dict, scene_state: Dict, city_plan: Dict) -> str:
-        """【已升级】为多模态模型创建用于决定资产位置的Prompt。"""
+    def _snapshot(self, scene, camera_mode: str, info: str, target_pos: Optional[Dict] = None) -> Dict[str, str]:
+        """渲染场景快照 (视角名称 -> 图片路径)，每张图片都登记到工作目录。"""
+        views = gaussian_splatting_snapshot(scene, camera_mode, info, target_pos, output_dir=self.scene_dir) or {}
+        for path in views.values():
+            self.workspace.track(path)
+        return views
+
+    def _release_snapshots(self, *snapshots: Dict[str, str]):
+        """释放若干快照 (视角名称 -> 图片路径) 中的所有图片。"""
+        self.workspace.release(*(path for views in snapshots for path in views.values()))
+
+    def _create_multimodal_placement_prompt(self, instance: Dict[str, str], asset_info: Dict, scene_state: Dict, city_plan: Dict,
+                                            feedback: Optional[List[str]] = None) -> str:
+        """【已升级】为多模态模型创建用于决定资产位置的Prompt。feedback 为上一次放置QA失败后的修正要求。"""
+        asset_id = instance["asset_id"]
+        placed_count = sum(1 for placed in scene_state['placed_assets'] if placed['asset_id'] == asset_id)
+        feedback_section = "".join(f"\n**修正要求:** {hint}\n" for hint in feedback or [])
         return f"""
 你是一名专业的虚拟城市布局师。请仔细观察提供的**场景全景图**，并结合以下信息，为新资产决定一个最佳放置位置。
 
@@ -152,15 +263,16 @@ class SceneAssemblyAgent(BaseAgent):
 
 **当前待放置的资产:**
 - ID: {asset_id}
+- 实例ID: {instance['instance_id']} (同一资产已放置 {placed_count} 个实例)
 - 类型: {asset_info['type']}
 - 描述: {asset_info.get('description', 'N/A')}
-- 估算尺寸: {asset_info['estimated_dimensions']}
+- 估算尺寸: {format_dimensions(asset_info.get('estimated_dimensions'))}
 
 **你的任务:**
 1.  **观察图像**: 分析图像中的空闲区域、道路位置和现有建筑布局。
 2.  **结合规划**: 根据场景规划，将资产放置在合适的区域（如，车辆在道路上，建筑在住宅区）。
 3.  **避免碰撞**: 在图像中寻找一个足够大的空地，确保新资产不会与已有物体发生视觉上的重叠。
-
+{feedback_section}
 **输出格式:**
 请严格按照以下JSON格式返回，不要包含任何额外说明：
 {{
@@ -2,134 +2,647 @@
 
 import json
 import os
-import time
+import shutil
+import threading
+import uuid
 import zipfile
-from typing import Dict, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterable, Optional, Tuple
 
 from .base_agent import BaseAgent
+from utils.asset_cache import AssetCache, file_digest
+from utils.dimensions import measure_asset_dimensions, parse_dimension_text
+from utils.gs_utils import gaussian_splatting_contact_sheet
+from utils.model_package import ModelPackage, split_member_ref
+from utils.pre_qa import GaussianPreQA, ImagePreQA
+from utils.prompt_memo import PromptMemo
+from utils.qa_batcher import QABatcher
+from utils.retry_policy import REMEDIATION_PROMPT_TWEAK, RetryPolicy
+from utils.scheduler import BackendPool
+from utils.tracing import current_span, trace_span, traced
+from utils.workspace import RunWorkspace
 from utils.llm_utils import call_llm_api
-from utils.gen_image_utils import call_gen_image_api
-from utils.vlm_utils import call_vlm_api
+from utils.gen_image_utils import call_gen_image_api, call_gen_images_api
+from utils.edit_image_utils import call_edit_image_api
+from utils.vlm_utils import call_vlm_api, call_vlm_batch_api
 from utils.gen_3d_utils import call_gen_3d_api
 
+# 影响生成结果的参数，参与资产缓存的内容寻址
+DEFAULT_GENERATION_PARAMS = {
+    "image_model": "Qwen-Image",
+    "image_seed": 5678,
+    "image_steps": 50,
+    "model_3d": "TRELLIS-image-large",
+    "model_3d_seed": 1,
+}
+
+# 批量QA的共享评估说明 (与 _create_2d_qa_prompt / _create_3d_qa_prompt 的标准一致)，每个检查项只附带自己的主体与风格
+QA_2D_BATCH_INSTRUCTION = """
+你是一个为程序化内容生成（PCG）流水线服务的自动化QA机器人。下面有若干个相互独立的检查项，
+每个检查项给出目标风格关键词、核心主体和一张待评估的概念图。请按以下标准分别评估每张图像。
+
+### 评估标准清单
+1. **风格一致性**: 图像的艺术风格是否符合该检查项的风格关键词？
+2. **内容准确性**: 图像是否准确描绘了该检查项的核心主体？
+3. **3D适用性 - 视角**: 图像是否为清晰的等轴测或3/4视角，能清楚展示物体结构，无严重遮挡？
+4. **3D适用性 - 光照**: 光照是否均匀、全局，且没有明显的投射阴影？
+
+### 每个检查项的输出字段
+"pass" (布尔值), "failed_criteria" (未通过标准编号的数组), "reason" (字符串), "score" (0-10的整数)
+"""
+
+QA_3D_BATCH_INSTRUCTION = """
+你是一位资深的3D艺术质量总监。下面有若干个相互独立的检查项，每个检查项给出源图像主体和一段360度模型渲染视频。
+请按以下标准分别评估每个模型。
+
+### 评估标准清单
+1. **模型完整性**: 模型是否存在非常明显的破洞、缺失的面或悬浮的零碎几何体？
+2. **几何准确性**: 模型的整体形状和结构是否与该检查项的源图像主体保持高度一致？
+3. **渲染质量**: 视频中是否存在非常严重的渲染瑕疵、闪烁或伪影？
+
+### 每个检查项的输出字段
+"pass" (布尔值), "reason" (字符串)
+"""
+
+# 联系表模式的共享评估说明：每个检查项附带一张由多个环绕视角拼接而成的图片，代替渲染视频
+QA_3D_SHEET_BATCH_INSTRUCTION = """
+你是一位资深的3D艺术质量总监。下面有若干个相互独立的检查项，每个检查项给出源图像主体和一张联系表图片，
+联系表由同一个模型的多个环绕视角 (水平一周与俯视) 拼接而成。请按以下标准分别评估每个模型。
+
+### 评估标准清单
+1. **模型完整性**: 各视角中模型是否存在非常明显的破洞、缺失的面或悬浮的零碎几何体？
+2. **几何准确性**: 模型的整体形状和结构是否与该检查项的源图像主体保持高度一致？
+3. **渲染质量**: 各视角中是否存在非常严重的渲染瑕疵或伪影？
+
+### 每个检查项的输出字段
+"pass" (布尔值), "reason" (字符串)
+"""
+
+# 资产包中指向生成文件的字段
+ASSET_FILE_FIELDS = ("source_image_path", "model_3d_zip_path", "gaussian_splatting_path", "render_video_path")
+
+# 3D QA 的媒体: contact_sheet (本地渲染环绕视角并拼成一张图) | video (服务端渲染的视频，逐帧发送)
+DEFAULT_3D_QA_MODE = os.environ.get("BUILDING_AGENT_3D_QA_MODE", "contact_sheet")
+
+# 改写2D prompt 的模型，与模板内容一起作为改写缓存的 key
+PROMPT_REWRITE_MODEL = os.environ.get("BUILDING_AGENT_REWRITE_MODEL", "Qwen3-Next-80B-A3B-Thinking-FP8")
+
+# 2D阶段每轮并行采样的候选数；1 表示逐次重试
+DEFAULT_2D_CANDIDATES = int(os.environ.get("BUILDING_AGENT_2D_CANDIDATES", 1))
+# 并行采样时的候选选择方式: first (最先通过) | best (本轮评分最高)
+DEFAULT_CANDIDATE_SELECTION = os.environ.get("BUILDING_AGENT_CANDIDATE_SELECTION", "first")
+
+# 改款资产 (variant_of) 在原资产已通过QA的概念图上编辑派生，只做小幅修改，推理步数远少于文生图
+VARIANT_EDIT_MODEL = "Qwen-Image-Edit-2509"
+DEFAULT_VARIANT_STEPS = int(os.environ.get("BUILDING_AGENT_VARIANT_STEPS", 16))
+
 class AssetGenerationAgent(BaseAgent):
     """
     阶段二：资产原子化生成 Agent
     职责：通过一个清晰、分阶段且带有多重重试校验的流程，处理单个资产的完整生成任务。
     """
 
+    def __init__(self, backend_pool: Optional[BackendPool] = None, asset_cache: Optional[AssetCache] = None,
+                 generation_params: Optional[Dict[str, Any]] = None, num_2d_candidates: int = DEFAULT_2D_CANDIDATES,
+                 candidate_selection: str = DEFAULT_CANDIDATE_SELECTION, retry_policy: Optional[RetryPolicy] = None,
+                 workspace: Optional[RunWorkspace] = None, prompt_memo: Optional[PromptMemo] = None,
+                 qa_3d_mode: str = DEFAULT_3D_QA_MODE, pre_qa_2d: Optional[ImagePreQA] = None,
+                 pre_qa_3d: Optional[GaussianPreQA] = None, variant_steps: int = DEFAULT_VARIANT_STEPS):
+        super().__init__(backend_pool)
+        self.asset_cache = asset_cache
+        # 相同的2D模板 (例如同一种路灯的多个实例、跨运行的相同任务) 只改写一次
+        self.prompt_memo = prompt_memo or PromptMemo()
+        # 生成的图像、模型包与解包文件都放在运行独占的工作目录中，未通过QA的尝试会被释放
+        self.workspace = workspace or RunWorkspace("asset_agent")
+        # 并发到达的2D/3D QA合并为批量请求，共享的评估说明只发送一次
+        self.qa_batcher = QABatcher(
+            lambda media, prompt: call_vlm_api(media, prompt),
+            lambda instruction, items: call_vlm_batch_api(instruction, items),
+            lambda kind, items: self._backend("qwen_vl", f"qa.{kind}.request", items=items),
+        )
+        # 非白背景、投射阴影、模糊、裁切等机械性问题先在本地拒绝，VLM只做语义判断
+        self.pre_qa_2d = pre_qa_2d or ImagePreQA()
+        # 空模型、大量悬浮碎片、退化高斯和破洞在渲染之前按几何统计拒绝；少量碎片剔除后继续QA
+        self.pre_qa_3d = pre_qa_3d or GaussianPreQA()
+        # 重试预算与补救方式由策略根据各资产类型的QA通过率决定
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.generation_params = {**DEFAULT_GENERATION_PARAMS, **(generation_params or {})}
+        if candidate_selection not in ("first", "best"):
+            raise ValueError(f"未知的候选选择方式: {candidate_selection}")
+        if qa_3d_mode not in ("contact_sheet", "video"):
+            raise ValueError(f"未知的3D QA模式: {qa_3d_mode}")
+        self.qa_3d_mode = qa_3d_mode
+        self.num_2d_candidates = max(1, num_2d_candidates)
+        self.candidate_selection = candidate_selection
+        self.variant_steps = max(1, variant_steps)
+        # 原资产ID -> 其通过QA的概念图 (失败时为 None)；只为有改款等待的原资产登记 (见 expect_concepts)
+        self._concepts: Dict[str, Future] = {}
+        self._concepts_lock = threading.Lock()
+
     # --- 主流程 Orchestrator ---
 
-    def run(self, asset_task: Dict[str, Any], max_2d_retries: int = 3, max_3d_retries: int = 3) -> Optional[Dict[str, Any]]:
+    @traced("asset.run", "asset", attributes=lambda self, asset_task, *a, **kw: {"asset_id": asset_task["asset_id"]})
+    def run(self, asset_task: Dict[str, Any], max_2d_retries: Optional[int] = None,
+            max_3d_retries: Optional[int] = None, concept_channel=None) -> Optional[Dict[str, Any]]:
         """
         执行完整的资产生成流程，从2D概念到最终的3D资产包。
-        每个质量校验环节都包含独立的重试机制。
+        每个质量校验环节都包含独立的重试机制；重试次数由 retry_policy 决定，max_*_retries 仅作为上限。
+        改款资产 (带 variant_of) 优先由原资产的概念图编辑派生 (见 run_variant)，原资产不可用时完整生成。
+        concept_channel 用于跨进程交接概念图 (分布式 worker 中为 SharedConceptChannel)：
+        本资产的概念图通过QA后经它发布，改款资产在本进程没有登记原资产时经它等待。
         """
         print("\n" + "="*50)
         print(f"🚀 阶段二：启动资产生成流程 for '{asset_task['asset_id']}'")
         print("="*50)
+        try:
+            return self._run(asset_task, max_2d_retries, max_3d_retries, concept_channel)
+        finally:
+            # 生成失败或异常时通知等待的改款资产 (已发布的概念图不受影响)
+            self._publish_concept(asset_task['asset_id'], None, concept_channel)
+
+    def run_variant(self, asset_task: Dict[str, Any], parent_image_path: str, max_2d_retries: Optional[int] = None,
+                    max_3d_retries: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        由已通过2D QA的原资产概念图派生改款资产：用图像编辑接口以少量推理步数按 variant_edit 修改主体，
+        不再改写prompt，也不再重复原图已经通过的视角/光照VLM QA (只做本地预检)，随后照常生成并校验3D模型。
+        """
+        verified_image = self._generate_variant_2d_image(asset_task, parent_image_path, max_2d_retries)
+        if not verified_image:
+            print(f"🚨 流程终止：未能由原资产派生合格的改款概念图。")
+            return None
+        return self._finish_asset(asset_task, verified_image, max_3d_retries, parent_image_path)
+
+    def expect_concepts(self, asset_ids: Iterable[str]):
+        """登记有改款资产等待其概念图的原资产，必须在提交这些改款任务之前调用。"""
+        with self._concepts_lock:
+            for asset_id in asset_ids:
+                self._concepts.setdefault(asset_id, Future())
+
+    def publish_concept(self, asset_id: str, image_path: Optional[str]):
+        """
+        发布原资产通过QA的概念图 (复制到工作目录，不受原资产文件释放的影响)，唤醒等待它的改款资产。
+        没有改款等待的资产、或已经发布过的资产直接忽略；image_path 为 None 表示原资产生成失败。
+        """
+        with self._concepts_lock:
+            pending = self._concepts.get(asset_id)
+            if pending is None or pending.done():
+                return
+            if image_path:
+                concept_path = os.path.join(self.workspace.subdir("concepts"), f"{asset_id}{os.path.splitext(image_path)[1]}")
+                shutil.copyfile(image_path, concept_path)
+                image_path = self.workspace.track(concept_path)
+            pending.set_result(image_path)
+
+    def _publish_concept(self, asset_id: str, image_path: Optional[str], concept_channel=None):
+        self.publish_concept(asset_id, image_path)
+        if concept_channel is not None:
+            concept_channel.publish(image_path)
+
+    def _wait_for_concept(self, parent_id: str, concept_channel=None) -> Optional[str]:
+        """
+        等待原资产的概念图；原资产在本进程中登记时等待本进程发布，否则经 concept_channel 等待其他进程发布。
+        两者都没有或原资产生成失败时返回 None。
+        """
+        with self._concepts_lock:
+            pending = self._concepts.get(parent_id)
+        if pending is None and concept_channel is None:
+            return None
+        if pending is None or not pending.done():
+            print(f"   ⏳ 等待原资产 '{parent_id}' 的概念图通过QA...")
+        with trace_span("asset.wait_concept", "asset", parent=parent_id):
+            return pending.result() if pending is not None else concept_channel.wait_parent()
+
+    def _run(self, asset_task: Dict[str, Any], max_2d_retries: Optional[int],
+             max_3d_retries: Optional[int], concept_channel=None) -> Optional[Dict[str, Any]]:
+        # 改款资产的缓存地址包含原资产概念图的内容，因此先等待概念图
+        parent_id = asset_task.get('variant_of')
+        parent_image_path = self._wait_for_concept(parent_id, concept_channel) if parent_id else None
+        if parent_id and not parent_image_path:
+            print(f"   ⚠️ 原资产 '{parent_id}' 的概念图不可用，改款资产改为完整生成。")
+            asset_task = {key: value for key, value in asset_task.items() if key not in ("variant_of", "variant_edit")}
+
+        # 阶段 2.0: 查询跨运行的资产缓存
+        if self.asset_cache is not None:
+            cached_asset = self.asset_cache.get(asset_task, self._cache_params(asset_task, parent_image_path))
+            if cached_asset:
+                print(f"⚡ 资产缓存命中 ({cached_asset['cache_key'][:12]})，跳过生成流程。")
+                current_span().set("cache_hit", True)
+                self._publish_concept(asset_task['asset_id'], cached_asset.get('source_image_path'), concept_channel)
+                return cached_asset
+
+        if parent_image_path:
+            current_span().set("variant_of", parent_id)
+            return self.run_variant(asset_task, parent_image_path, max_2d_retries, max_3d_retries)
 
         # 阶段 2.1: 生成并验证合格的2D图像 (带重试)
-        verified_image_path = self._generate_and_verify_2d_image(asset_task, max_2d_retries)
-        if not verified_image_path:
+        verified_image = self._generate_and_verify_2d_image(asset_task, max_2d_retries)
+        if not verified_image:
             print(f"🚨 流程终止：未能生成合格的2D图像。")
             return None
+        # 概念图一经通过即发布，改款资产的派生与本资产的3D生成并行进行
+        self._publish_concept(asset_task['asset_id'], verified_image[0], concept_channel)
+        return self._finish_asset(asset_task, verified_image, max_3d_retries)
+
+    def _finish_asset(self, asset_task: Dict[str, Any], verified_image: Tuple[str, Dict],
+                      max_3d_retries: Optional[int], parent_image_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """由通过校验的概念图生成3D模型、测量尺寸并打包资产。改款资产需提供其派生自的原资产概念图。"""
+        verified_image_path, image_qa_result = verified_image
 
         # 阶段 2.2: 生成并验证3D模型 (带重试)
         model_files = self._generate_and_verify_3d_model(asset_task, verified_image_path, max_3d_retries)
         if not model_files:
             print(f"🚨 流程终止：生成的3D模型未能通过质量评估。")
+            self.workspace.release(verified_image_path)
             return None
 
-        # 阶段 2.3: 估算物理尺寸 (通常无需重试，除非API可能失败)
-        estimated_dimensions = self._estimate_dimensions(asset_task)
+        # 阶段 2.3: 由高斯模型的包围盒与目录级参考尺寸得到物理尺寸
+        estimated_dimensions = self._estimate_dimensions(asset_task, model_files["model_file"])
         
         # 阶段 2.4: 打包最终资产
         final_asset = self._package_final_asset(asset_task, verified_image_path, model_files, estimated_dimensions)
+        final_asset["qa_verdicts"] = {"2d": image_qa_result, "3d": model_files["qa_result"]}
+
+        if self.asset_cache is not None:
+            final_asset["cache_key"] = self.asset_cache.put(asset_task, self._cache_params(asset_task, parent_image_path),
+                                                            final_asset)
         
         print(f"\n🎉 资产 '{asset_task['asset_id']}' 已成功生成并打包！")
         return final_asset
 
+    def _cache_params(self, asset_task: Dict[str, Any], parent_image_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        参与缓存寻址的生成参数；改款资产还包括编辑模型、步数、修改描述以及所派生自的原资产概念图的内容哈希
+        (原资产重新生成后，或同样的修改作用于不同的原资产时，不会命中由其他概念图派生的资产)。
+        """
+        if not asset_task.get('variant_of'):
+            return self.generation_params
+        return {**self.generation_params, "variant": {
+            "edit_model": VARIANT_EDIT_MODEL, "steps": self.variant_steps, "edit": asset_task.get('variant_edit'),
+            "parent_image": file_digest(parent_image_path) if parent_image_path else None,
+        }}
+
+    def release_asset_files(self, asset: Dict[str, Any]):
+        """资产文件已被检查点、缓存或共享存储复制后调用，释放工作目录中的原件。"""
+        self.workspace.release(*(asset.get(field) for field in ASSET_FILE_FIELDS))
+
     # --- 私有辅助方法 (Private Helper Methods) ---
 
-    def _generate_and_verify_2d_image(self, asset_task: Dict[str, Any], max_retries: int) -> Optional[str]:
-        """负责2D图像的生成和质量校验，包含重试逻辑。"""
+    @traced("asset.2d", "asset", attributes=lambda self, asset_task, *a, **kw: {"asset_id": asset_task["asset_id"]})
+    def _generate_and_verify_2d_image(self, asset_task: Dict[str, Any], max_retries: Optional[int]) -> Optional[Tuple[str, Dict]]:
+        """负责2D图像的生成和质量校验，包含重试逻辑。返回 (图像路径, QA结论)。"""
         print("\n--- 📝 Phase 2.1: 生成并校验2D概念图 (带重试) ---")
+        base_prompt = self._rewrite_2d_prompt(asset_task)
+        qa_prompt = self._create_2d_qa_prompt(asset_task)
+        budget = self.retry_policy.budget("2d", asset_task['type'], max_retries)
+        current_span().set("budget", budget)
+
+        if self.num_2d_candidates > 1:
+            return self._sample_2d_candidates(asset_task, base_prompt, qa_prompt, budget)
+
+        image_prompt = base_prompt
+        history = []
+        for attempt in range(1, budget + 1):
+            print(f"\n   Attempt {attempt}/{budget} for 2D Image:")
+            result = self._generate_2d_candidate(asset_task, image_prompt, qa_prompt, attempt)
+            qa_result = result[1] if result is not None else None
+            if qa_result is not None and qa_result.get("pass") is True:
+                return result
+
+            decision = self.retry_policy.on_failure("2d", asset_task['type'], attempt, budget, qa_result, history)
+            history.append(qa_result)
+            if not decision.retry:
+                print(f"   🛑 停止2D重试: {decision.reason}")
+                break
+            if decision.remediation == REMEDIATION_PROMPT_TWEAK:
+                image_prompt = self._apply_qa_hints(base_prompt, decision.hints)
+            print(f"      即将重试 ({decision.remediation})...")
+            self.retry_policy.wait(decision)
+
+        print(f"\n   🚨 在 {len(history)} 次尝试后，仍无法通过2D质量校验。")
+        return None
+
+    def _rewrite_2d_prompt(self, asset_task: Dict[str, Any]) -> Optional[str]:
+        """用LLM把2D模板改写为最终的文生图prompt；模板与模型相同时复用改写缓存。"""
         image_prompt_template = self._create_2d_image_prompt_template(asset_task)
-        image_prompt = call_llm_api(image_prompt_template)  # 生成最终prompt
-        
-        for attempt in range(1, max_retries + 1):
-            print(f"\n   Attempt {attempt}/{max_retries} for 2D Image:")
-            
-            image_path = call_gen_image_api(image_prompt, attempt)
-            
-            qa_prompt = self._create_2d_qa_prompt(asset_task)
-            qa_result_str = call_vlm_api(image_path, qa_prompt)
-            
+
+        def rewrite():
+            with self._backend("qwen_next", "llm.rewrite_2d_prompt", asset_id=asset_task['asset_id']):
+                return call_llm_api(image_prompt_template)  # 生成最终prompt
+
+        base_prompt, source = self.prompt_memo.get_or_compute(image_prompt_template, PROMPT_REWRITE_MODEL, rewrite)
+        current_span().set("rewrite_source", source)
+        if source != "llm":
+            print(f"   ⚡ 复用已缓存的2D prompt改写结果 ({source})。")
+        return base_prompt
+
+    def _sample_2d_candidates(self, asset_task: Dict[str, Any], base_prompt: str, qa_prompt: str,
+                              max_retries: int) -> Optional[Tuple[str, Dict]]:
+        """
+        并行候选采样：每轮以不同种子在一次文生图请求中生成 K 张候选图 (一个队列槽位、一次文本编码)，再并行送检。
+        总尝试次数仍不超过 max_retries，因此 K >= max_retries 时只需一轮往返。
+        selection 为 "first" 时采用最先通过的候选并跳过其余候选的QA；为 "best" 时等待本轮全部完成，取评分最高者。
+        """
+        k = self.num_2d_candidates
+        image_prompt = base_prompt
+        history = []
+        for round_start in range(1, max_retries + 1, k):
+            attempts = list(range(round_start, min(round_start + k, max_retries + 1)))
+            print(f"\n   并行采样 {len(attempts)} 个2D候选 (attempt {attempts[0]}-{attempts[-1]}/{max_retries})...")
+            seeds = [self._image_seed(attempt) for attempt in attempts]
+            output_paths = [self._new_image_path(f"gen_img_attempt_{attempt}") for attempt in attempts]
+            with self._backend("qwen_image", "gen_images", asset_id=asset_task['asset_id'], images=len(attempts)):
+                images = call_gen_images_api(image_prompt, seeds, output_paths)
+            # 客户端把第 i 张图保存到 output_paths[i]；请求失败时返回空列表，旧版服务只返回一张
+            image_paths = [self.workspace.track(path) for path in output_paths[:len(images)]]
+            if len(image_paths) < len(attempts):
+                print(f"   ⚠️ 文生图只返回了 {len(image_paths)}/{len(attempts)} 张候选图。")
+
+            cancel = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=len(attempts), thread_name_prefix=f"2d-{asset_task['asset_id']}")
+            futures = {
+                executor.submit(self._qa_2d_candidate, asset_task, image_path, qa_prompt, attempt, seed, cancel): attempt
+                for attempt, seed, image_path in zip(attempts, seeds, image_paths)
+            }
+            passed, failed = [], []
+            consumed = set()
+            for future in as_completed(futures):
+                consumed.add(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"   ❌ 候选 {futures[future]} 执行异常: {e}")
+                    continue
+                if result is None:
+                    continue
+                if result[1].get("pass") is True:
+                    passed.append((futures[future], result))
+                    if self.candidate_selection == "first":
+                        break
+                else:
+                    failed.append(result[1])
+            # 通知其余候选放弃，不等待它们结束：尚未开始的候选被取消，尚未发出的QA请求被批处理器丢弃；
+            # 未被采纳的候选 (包括已在VLM上、之后才通过的) 结束时由回调释放其图像
+            cancel.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            for future, path in zip(futures, image_paths):
+                if future not in consumed:
+                    future.add_done_callback(lambda _, path=path: self.workspace.release(path))
+
+            if passed:
+                attempt, (image_path, qa_result) = max(
+                    passed, key=lambda item: (item[1][1].get("score", 0), -item[0])
+                )
+                print(f"   🏆 采用候选 {attempt} (共 {len(passed)} 个通过): {image_path}")
+                self.workspace.release(*(path for _, (path, _) in passed if path != image_path))
+                return image_path, qa_result
+
+            # 整轮失败：合并本轮所有候选的未通过标准，交给重试策略决定下一轮的补救方式
+            round_qa = {
+                "pass": False,
+                "failed_criteria": sorted({c for qa in failed for c in qa.get("failed_criteria") or []}),
+                "reason": "; ".join(qa.get("reason", "") for qa in failed),
+            } if failed else None
+            decision = self.retry_policy.on_failure("2d", asset_task['type'], attempts[-1], max_retries, round_qa, history)
+            history.append(round_qa)
+            if not decision.retry:
+                print(f"   🛑 停止2D采样: {decision.reason}")
+                break
+            if decision.remediation == REMEDIATION_PROMPT_TWEAK:
+                image_prompt = self._apply_qa_hints(base_prompt, decision.hints)
+            self.retry_policy.wait(decision)
+
+        print(f"\n   🚨 在 {max_retries} 个候选预算内，没有任何一个通过2D质量校验。")
+        return None
+
+    def _image_seed(self, attempt: int) -> int:
+        """每次尝试使用不同的种子，重试不会重复生成同一张图。"""
+        return self.generation_params["image_seed"] + attempt - 1
+
+    def _generate_2d_candidate(self, asset_task: Dict[str, Any], image_prompt: str, qa_prompt: str,
+                               attempt: int) -> Optional[Tuple[str, Dict]]:
+        """生成一张候选图并完成QA，返回 (图像路径, QA结论)；生成失败或QA输出无效时返回 None。"""
+        seed = self._image_seed(attempt)
+        image_path = self._new_image_path(f"gen_img_attempt_{attempt}")
+        with self._backend("qwen_image", "gen_image", asset_id=asset_task['asset_id'], attempt=attempt, seed=seed):
+            image = call_gen_image_api(image_prompt, image_path, seed=seed)
+        if image is None:
+            print(f"   ❌ [候选 {attempt}] 文生图请求失败。")
+            return None
+        return self._qa_2d_candidate(asset_task, self.workspace.track(image_path), qa_prompt, attempt, seed)
+
+    def _new_image_path(self, prefix: str) -> str:
+        """工作目录 images/ 下的新图像路径，随机后缀避免并发生成的候选互相覆盖。"""
+        return os.path.join(self.workspace.subdir("images"), f"{prefix}_{uuid.uuid4().hex[:8]}.png")
+
+    def _qa_2d_candidate(self, asset_task: Dict[str, Any], image_path: str, qa_prompt: str, attempt: int, seed: int,
+                         cancel: Optional[threading.Event] = None) -> Optional[Tuple[str, Dict]]:
+        """对一张候选图做本地预检与VLM QA，返回 (图像路径, QA结论)；被取消或QA输出无效时释放图像并返回 None。"""
+        asset_id = asset_task['asset_id']
+        if cancel is not None and cancel.is_set():
+            self.workspace.release(image_path)
+            return None
+
+        # 先做本地预检，明显不合格的候选不占用VLM
+        qa_result = self._run_2d_pre_qa(image_path, asset_id, attempt)
+        if qa_result is None:
+            with trace_span("qa.2d", "qa", asset_id=asset_id, attempt=attempt) as span:
+                # 其他候选已胜出时，尚未发出的QA请求不再占用VLM
+                qa_result_str = self.qa_batcher.check(
+                    "2d", QA_2D_BATCH_INSTRUCTION, self._create_2d_qa_item(asset_task), image_path, qa_prompt, cancel
+                )
+                span.set("response", qa_result_str)
+            if qa_result_str is None:
+                self.workspace.release(image_path)
+                return None
+
             try:
                 qa_result = json.loads(qa_result_str)
-                if qa_result.get("pass") is True:
-                    print(f"   ✅ 2D图像质量校验通过！ -> {image_path}")
-                    return image_path
-                else:
-                    print(f"   ❌ 2D图像质量校验失败: {qa_result.get('reason', '未知原因')}")
             except json.JSONDecodeError:
-                print("   ❌ QA模型返回了无效的JSON格式。")
+                print(f"   ❌ [候选 {attempt}] QA模型返回了无效的JSON格式。")
+                self.workspace.release(image_path)
+                return None
+
+        self.retry_policy.record("2d", asset_task['type'], qa_result.get("pass") is True, qa_result.get("failed_criteria"))
+        if qa_result.get("pass") is True:
+            print(f"   ✅ [候选 {attempt}] 2D图像质量校验通过！ -> {image_path}")
+        else:
+            print(f"   ❌ [候选 {attempt}] 2D图像质量校验失败: {qa_result.get('reason', '未知原因')}")
+            self.workspace.release(image_path)
+        qa_result["seed"] = seed
+        return image_path, qa_result
+
+    @traced("asset.variant_2d", "asset", attributes=lambda self, asset_task, *a, **kw: {"asset_id": asset_task["asset_id"]})
+    def _generate_variant_2d_image(self, asset_task: Dict[str, Any], parent_image_path: str,
+                                   max_retries: Optional[int]) -> Optional[Tuple[str, Dict]]:
+        """在原资产的概念图上编辑出改款概念图，只经过本地预检。返回 (图像路径, QA结论)。"""
+        print("\n--- 🖌️ Phase 2.1: 由原资产概念图派生改款 ---")
+        asset_id = asset_task['asset_id']
+        edit_prompt = self._create_variant_edit_prompt(asset_task)
+        budget = self.retry_policy.budget("2d", asset_task['type'], max_retries)
+        current_span().set("budget", budget)
 
-            if attempt < max_retries:
-                print("      即将重试...")
-                time.sleep(1)
+        for attempt in range(1, budget + 1):
+            seed = self._image_seed(attempt)
+            image_path = self._new_image_path(f"edit_img_v{attempt}")
+            with self._backend("qwen_image_edit", "edit_image", asset_id=asset_id, attempt=attempt, seed=seed):
+                image = call_edit_image_api(edit_prompt, [parent_image_path], image_path, seed=seed,
+                                            num_inference_steps=self.variant_steps)
+            if image is None:
+                print(f"   ❌ [改款 {attempt}] 图像编辑请求失败。")
+                continue
+            self.workspace.track(image_path)
+            pre_qa_result = self._run_2d_pre_qa(image_path, asset_id, attempt)
+            if pre_qa_result is None:
+                print(f"   ✅ [改款 {attempt}] 概念图派生完成 (沿用原资产 '{asset_task['variant_of']}' 的2D QA结论) -> {image_path}")
+                return image_path, {
+                    "pass": True, "failed_criteria": [], "seed": seed, "variant_of": asset_task['variant_of'],
+                    "reason": "由已通过2D QA的原资产概念图编辑派生，视角与光照沿用原图的结论。",
+                }
+            print(f"   ❌ [改款 {attempt}] 本地预检未通过: {pre_qa_result['reason']}")
+            self.workspace.release(image_path)
 
-        print(f"\n   🚨 在 {max_retries} 次尝试后，仍无法通过2D质量校验。")
+        print(f"\n   🚨 在 {budget} 次编辑后，仍未得到合格的改款概念图。")
         return None
 
-    def _generate_and_verify_3d_model(self, asset_task: Dict[str, Any], image_path: str, max_retries: int) -> Optional[Dict[str, str]]:
+    def _run_2d_pre_qa(self, image_path: str, asset_id: str, attempt: int) -> Optional[Dict[str, Any]]:
+        """执行2D本地预检。未通过时返回与VLM结论同格式的失败结论 (记录失败原因与指标)，通过或未启用时返回 None。"""
+        if not self.pre_qa_2d.enabled:
+            return None
+        with trace_span("pre_qa.2d", "qa", asset_id=asset_id, attempt=attempt) as span:
+            pre_qa = self.pre_qa_2d.run(image_path)
+            span.update(passed=pre_qa.passed, metrics=pre_qa.metrics)
+        return None if pre_qa.passed else pre_qa.as_qa_result()
+
+    @traced("asset.3d", "asset", attributes=lambda self, asset_task, *a, **kw: {"asset_id": asset_task["asset_id"]})
+    def _generate_and_verify_3d_model(self, asset_task: Dict[str, Any], image_path: str,
+                                      max_retries: Optional[int]) -> Optional[Dict[str, str]]:
         """负责3D模型的生成、解包和基于视频的质量评估，包含完整的重试逻辑。"""
         print("\n--- 📦 Phase 2.2: 生成并校验3D模型 (带重试) ---")
-        
-        for attempt in range(1, max_retries + 1):
-            print(f"\n   Attempt {attempt}/{max_retries} for 3D Model:")
-            
-            model_zip_path = call_gen_3d_api(image_path, attempt)
-            
-            print("   📁 正在解包3D资产...")
-            unpacked_files = self._unpack_zip_mock(model_zip_path)
-            render_video_path = unpacked_files["render_video"]
+        budget = self.retry_policy.budget("3d", asset_task['type'], max_retries)
+        current_span().set("budget", budget)
+        history = []
+
+        for attempt in range(1, budget + 1):
+            print(f"\n   Attempt {attempt}/{budget} for 3D Model:")
             
-            qa_prompt = self._create_3d_qa_prompt(asset_task)
-            qa_result_str = call_vlm_api(render_video_path, qa_prompt)
+            with self._backend("trellis", "gen_3d", asset_id=asset_task['asset_id'], attempt=attempt):
+                model_zip_path = self.workspace.adopt(call_gen_3d_api(image_path, attempt), "models")
             
-            try:
-                qa_result = json.loads(qa_result_str)
-                if qa_result.get("pass"):
-                    print("   ✅ 3D模型视频评估通过！")
-                    return {"model_zip_path": model_zip_path, **unpacked_files}
+            print("   📁 正在读取3D资产包目录...")
+            package, qa_result = self._open_model_package(model_zip_path)
+            cleaned_ply = None
+            if package is not None:
+                qa_result, cleaned_ply = self._run_3d_pre_qa(package, asset_task['asset_id'], attempt)
+            if package is not None and qa_result is None:
+                # QA媒体直接从压缩包中读取，未通过QA的尝试不解压任何文件
+                qa_media, instruction, qa_prompt = self._prepare_3d_qa_media(asset_task, package, cleaned_ply)
+                with trace_span("qa.3d", "qa", asset_id=asset_task['asset_id'], attempt=attempt) as span:
+                    qa_result_str = self.qa_batcher.check(
+                        "3d", instruction, self._create_3d_qa_item(asset_task), qa_media, qa_prompt
+                    )
+                    span.set("response", qa_result_str)
+                if split_member_ref(qa_media) is None:
+                    # 联系表只用于本次QA
+                    self.workspace.release(qa_media)
+                if qa_result_str is None:
+                    print("   ❌ 3D QA请求失败，未得到结论。")
+                    qa_result = None
                 else:
-                    print(f"   ❌ 3D模型质量校验失败: {qa_result.get('reason', '未知原因')}")
-            except json.JSONDecodeError:
-                print("   ❌ 3D QA模型返回了无效的JSON格式。")
+                    try:
+                        qa_result = json.loads(qa_result_str)
+                    except json.JSONDecodeError:
+                        print("   ❌ 3D QA模型返回了无效的JSON格式。")
+                        qa_result = None
+
+            if qa_result is not None:
+                self.retry_policy.record("3d", asset_task['type'], bool(qa_result.get("pass")), qa_result.get("failed_criteria"))
+                if qa_result.get("pass"):
+                    print("   ✅ 3D模型质量评估通过！")
+                    return {"model_zip_path": model_zip_path, "qa_result": qa_result,
+                            **self._extract_approved_files(package, model_file=cleaned_ply)}
+                print(f"   ❌ 3D模型质量校验失败: {qa_result.get('reason', '未知原因')}")
+            self.workspace.release(model_zip_path)
+            if cleaned_ply:
+                self.workspace.release(cleaned_ply)
 
-            if attempt < max_retries:
-                print("      即将重试...")
-                time.sleep(1)
+            decision = self.retry_policy.on_failure("3d", asset_task['type'], attempt, budget, qa_result, history)
+            history.append(qa_result)
+            if not decision.retry:
+                print(f"   🛑 停止3D重试: {decision.reason}")
+                break
+            print(f"      即将重试 ({decision.remediation})...")
+            self.retry_policy.wait(decision)
 
-        print(f"\n   🚨 在 {max_retries} 次尝试后，仍无法通过3D质量校验。")
+        print(f"\n   🚨 在 {len(history)} 次尝试后，仍无法通过3D质量校验。")
         return None
 
-    def _estimate_dimensions(self, asset_task: Dict[str, Any]) -> str:
+    def _run_3d_pre_qa(self, package: ModelPackage, asset_id: str,
+                       attempt: int) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        对包内高斯PLY执行3D几何预检，返回 (失败结论或 None, 剔除悬浮碎片后的PLY路径或 None)。
+        清理后的PLY写入该尝试的解包目录，后续的联系表与装配都使用它。
+        """
+        if not self.pre_qa_3d.enabled:
+            return None, None
+        stem = os.path.splitext(os.path.basename(package.gaussian_ply))[0]
+        cleaned_path = os.path.join(self._unpack_dir(package), f"{stem}_cleaned.ply")
+        with trace_span("pre_qa.3d", "qa", asset_id=asset_id, attempt=attempt) as span:
+            pre_qa = self.pre_qa_3d.run(package.ref(package.gaussian_ply), cleaned_path)
+            span.update(passed=pre_qa.passed, metrics=pre_qa.metrics)
+        if not pre_qa.passed:
+            return pre_qa.as_qa_result(), None
+        if pre_qa.cleaned_path:
+            print(f"   🧹 已剔除 {pre_qa.metrics['removed_floaters']} 个悬浮高斯 -> {pre_qa.cleaned_path}")
+            return None, self.workspace.track(pre_qa.cleaned_path)
+        return None, None
+
+    def _prepare_3d_qa_media(self, asset_task: Dict[str, Any], package: ModelPackage,
+                             ply_path: Optional[str] = None) -> Tuple[str, str, str]:
+        """
+        返回 (QA媒体路径, 批量评估说明, 单项QA prompt)。
+        联系表模式在本地渲染高斯PLY (ply_path，默认为包内PLY) 的环绕视角并拼成一张图，VLM只需编码一张图片；
+        渲染失败时退回到渲染视频。
+        """
+        if self.qa_3d_mode == "contact_sheet":
+            sheet_name = os.path.splitext(os.path.basename(package.zip_path))[0] + "_contact_sheet.png"
+            sheet_path = gaussian_splatting_contact_sheet(
+                ply_path or package.ref(package.gaussian_ply), os.path.join(self.workspace.subdir("qa"), sheet_name)
+            )
+            if sheet_path:
+                return (self.workspace.track(sheet_path), QA_3D_SHEET_BATCH_INSTRUCTION,
+                        self._create_3d_qa_prompt(asset_task, contact_sheet=True))
+            print("   ⚠️ 联系表渲染失败，改用渲染视频进行3D QA。")
+        return package.ref(package.qa_video), QA_3D_BATCH_INSTRUCTION, self._create_3d_qa_prompt(asset_task)
+
+    def _estimate_dimensions(self, asset_task: Dict[str, Any], model_file: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        由通过QA的高斯模型测量包围盒 (忽略漂浮点)，并按规划阶段给出的参考尺寸确定比例尺，返回结构化尺寸。
+        任务不带参考尺寸时 (旧检查点中的规划) 退回到单独调用LLM估算。
+        """
+        print("\n--- 📏 Phase 2.3: 测量物理尺寸 ---")
+        reference = asset_task.get("reference_dimensions")
+        if not reference:
+            reference = parse_dimension_text(self._estimate_dimensions_with_llm(asset_task))
+        dimensions = measure_asset_dimensions(model_file, reference)
+        current_span().set("dimensions_source", dimensions["source"] if dimensions else None)
+        print(f"   -> 尺寸: {json.dumps(dimensions, ensure_ascii=False)}")
+        return dimensions
+
+    def _estimate_dimensions_with_llm(self, asset_task: Dict[str, Any]) -> str:
         """调用LLM估算资产在真实世界中的物理尺寸。"""
-        print("\n--- 📏 Phase 2.3: 估算物理尺寸 ---")
         dimension_prompt = f"""
 你是一个经验丰富的场景设计师。根据以下描述估算其真实世界尺寸。
 描述: "{asset_task['description']}"
 类型: "{asset_task['type']}"
 请以 "Length: Xm, Width: Ym, Height: Zm" 的格式给出合理估算。
 """
-        estimation = call_llm_api(dimension_prompt)
-        print(f"   -> 估算结果: {estimation}")
+        with self._backend("qwen_next", "llm.estimate_dimensions", asset_id=asset_task['asset_id']):
+            estimation = call_llm_api(dimension_prompt)
+        print(f"   -> LLM估算结果: {estimation}")
         return estimation
 
-    def _package_final_asset(self, asset_task: Dict[str, Any], image_path: str, model_files: Dict, dimensions: str) -> Dict:
+    def _package_final_asset(self, asset_task: Dict[str, Any], image_path: str, model_files: Dict,
+                             dimensions: Optional[Dict[str, Any]]) -> Dict:
         """将所有生成的信息和路径整合到一个最终的资产字典中。"""
         print("\n--- 🎁 Phase 2.4: 打包最终资产 ---")
         final_package = {
@@ -147,6 +660,11 @@ class AssetGenerationAgent(BaseAgent):
         return final_package
 
     # --- Prompt模板和工具函数 ---
+
+    @staticmethod
+    def _apply_qa_hints(image_prompt: str, hints) -> str:
+        """把重试策略给出的修正要求追加到文生图prompt末尾。"""
+        return image_prompt.rstrip() + "\n## 修正要求 (上次QA未通过): " + "；".join(hints) + "\n"
     
     def _create_2d_image_prompt_template(self, asset_task: Dict[str, Any]) -> str:
         """【已中文化】创建用于生成2D概念图的Prompt模板。"""
@@ -159,6 +677,14 @@ class AssetGenerationAgent(BaseAgent):
 ## 光照: 无阴影的全局光照 (shadowless global illumination)，柔和的影棚灯光 (soft studio lighting)，无任何投射阴影 (no cast shadows)。
 ## 质量: 杰作 (masterpiece), 最佳画质 (best quality), 4K, 超高细节 (ultra detailed), 线条清晰 (clean lineart)。
 ## 负面提示: --no blurry, shadows, complex background, atmospheric perspective, lens flare
+"""
+
+    def _create_variant_edit_prompt(self, asset_task: Dict[str, Any]) -> str:
+        """创建由原资产概念图派生改款的图像编辑指令。"""
+        return f"""
+{asset_task['variant_edit']}。
+只修改上述内容，主体的造型、视角、构图、光照与纯白色背景保持不变，不要添加阴影或其他物体。
+修改后的主体: {asset_task['description']}
 """
 
     def _create_2d_qa_prompt(self, asset_task: Dict[str, Any]) -> str:
@@ -179,20 +705,35 @@ class AssetGenerationAgent(BaseAgent):
 {{
   "pass": (布尔值),
   "failed_criteria": (一个包含未通过标准编号的数组，例如 [3, 4]),
-  "reason": (字符串, 简要说明失败原因)
+  "reason": (字符串, 简要说明失败原因),
+  "score": (0-10的整数, 图像作为3D建模参考的整体质量评分)
 }}
 """
 
-    def _create_3d_qa_prompt(self, asset_task: Dict[str, Any]) -> str:
-        """【已中文化】创建用于3D模型视频质量校验的Prompt。"""
+    def _create_2d_qa_item(self, asset_task: Dict[str, Any]) -> str:
+        """批量QA中单个2D检查项特有的说明，评估标准见 QA_2D_BATCH_INSTRUCTION。"""
+        return f"风格关键词: `{', '.join(asset_task['style'])}`\n核心主体: `{asset_task['description']}`"
+
+    def _create_3d_qa_item(self, asset_task: Dict[str, Any]) -> str:
+        """批量QA中单个3D检查项特有的说明，评估标准见 QA_3D_BATCH_INSTRUCTION。"""
+        return f"源图像主体: `{asset_task['description']}`"
+
+    def _create_3d_qa_prompt(self, asset_task: Dict[str, Any], contact_sheet: bool = False) -> str:
+        """【已中文化】创建用于3D模型质量校验的Prompt。contact_sheet=True 时评估对象为环绕视角联系表而非视频。"""
+        if contact_sheet:
+            media_intro = "请仔细观察这张联系表图片 (同一个模型的多个环绕视角，包括水平一周与俯视)，并评估模型质量。"
+            artifact_check = "各视角中是否存在非常严重的渲染瑕疵或伪影？"
+        else:
+            media_intro = "请仔细观看这段360度模型渲染视频，并评估其质量。"
+            artifact_check = "视频中是否存在非常严重的渲染瑕疵、闪烁或伪影？"
         return f"""
-你是一位资深的3D艺术质量总监。请仔细观看这段360度模型渲染视频，并评估其质量。
+你是一位资深的3D艺术质量总监。{media_intro}
 你的回答必须是格式化的JSON对象，不含任何其它说明性文本。
 
 ### 评估标准清单
 1. **模型完整性**: 模型是否存在非常明显的破洞、缺失的面或悬浮的零碎几何体？
 2. **几何准确性**: 模型的整体形状和结构是否与源图像的主体（`{asset_task['description']}`）保持高度一致？
-3. **渲染质量**: 视频中是否存在非常严重的渲染瑕疵、闪烁或伪影？
+3. **渲染质量**: {artifact_check}
 
 ### 输出格式
 请严格按照以下格式输出JSON：
@@ -202,16 +743,33 @@ class AssetGenerationAgent(BaseAgent):
 }}
 """
 
-    def _unpack_zip_mock(self, zip_path: str) -> Dict[str, str]:
-        """辅助函数，解压ZIP文件并返回已知内部文件的路径。"""
-        extract_dir = os.path.join("tmp", "unpacked_" + os.path.basename(zip_path).replace('.zip', ''))
-        if not os.path.exists(extract_dir):
-            os.makedirs(extract_dir)
-        
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-            
+    @staticmethod
+    def _open_model_package(zip_path: str) -> Tuple[Optional[ModelPackage], Optional[Dict[str, Any]]]:
+        """
+        读取3D结果包的目录并定位高斯PLY与QA视频。
+        结果包损坏或缺少所需成员时返回 (None, 失败结论)，该次尝试按未通过QA处理。
+        """
+        try:
+            package = ModelPackage(zip_path)
+        except (zipfile.BadZipFile, OSError) as e:
+            print(f"   ❌ 3D结果包无法读取: {e}")
+            return None, {"pass": False, "reason": f"3D结果包损坏: {e}"}
+        missing = [name for name, member in (("高斯PLY", package.gaussian_ply), ("渲染视频", package.qa_video)) if not member]
+        if missing:
+            print(f"   ❌ 3D结果包缺少 {'、'.join(missing)}，包内文件: {package.members}")
+            return None, {"pass": False, "reason": f"3D结果包缺少{'、'.join(missing)}"}
+        return package, None
+
+    def _unpack_dir(self, package: ModelPackage) -> str:
+        return self.workspace.subdir("unpacked", os.path.splitext(os.path.basename(package.zip_path))[0])
+
+    def _extract_approved_files(self, package: ModelPackage, model_file: Optional[str] = None) -> Dict[str, str]:
+        """
+        只把通过QA的高斯PLY与渲染视频写入工作目录 (网格与其他视频保留在压缩包中)，返回其路径。
+        model_file 为预检剔除悬浮碎片后的PLY时直接使用它，不再解压包内的原始PLY。
+        """
+        extract_dir = self._unpack_dir(package)
         return {
-            "model_file": os.path.join(extract_dir, "model.ply"),
-            "render_video": os.path.join(extract_dir, "render.mp4")
+            "model_file": model_file or self.workspace.track(package.extract(package.gaussian_ply, extract_dir)),
+            "render_video": self.workspace.track(package.extract(package.qa_video, extract_dir)),
         }
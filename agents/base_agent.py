@@ -1,16 +1,39 @@
 # agents/base_agent.py
 from abc import ABC, abstractmethod
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, Optional, Union
+
+from utils.scheduler import BackendPool, TenantBackendPool
+from utils.tracing import trace_span
 
 class BaseAgent(ABC):
     """
     所有Agent的抽象基类。
     强制要求每个Agent都必须实现一个 run 方法。
     """
+    def __init__(self, backend_pool: Optional[Union[BackendPool, TenantBackendPool]] = None):
+        # 可选的后端并发池 (或其租户视图)；为 None 时模型调用不受限流
+        self.backend_pool = backend_pool
+
+    @contextmanager
+    def _backend(self, name: str, span: Optional[str] = None, **attributes: Any):
+        """
+        占用指定模型后端的槽位，并为这次调用记录一个追踪span (包含排队等待时间)。
+        attributes 会作为span属性记录，例如 asset_id、attempt。
+        """
+        tenant = getattr(self.backend_pool, "tenant_name", None)
+        if tenant is not None:
+            attributes["tenant"] = tenant
+        with trace_span(span or name, name, backend=name, **attributes) as current:
+            if self.backend_pool is None:
+                yield current
+            else:
+                with self.backend_pool.slot(name):
+                    yield current
+
     @abstractmethod
     def run(self, *args, **kwargs) -> Any:
         """
         每个Agent执行其核心逻辑的入口点。
         """
         pass
-
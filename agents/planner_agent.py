@@ -10,13 +10,16 @@ import json
 from typing import Dict, List, Any, Tuple
 
 from .base_agent import BaseAgent
+from utils.dimensions import create_reference_dimensions_prompt, parse_reference_dimensions
 from utils.llm_utils import call_llm_api
+from utils.tracing import traced
 
 class CityPlannerAgent(BaseAgent):
     """
     阶段一：规划与设计 Agent (专家版)
     职责：接收用户概念，生成一个包含世界观、布局规则、区域规划和详细资产目录的深度城市规划方案。
     """
+    @traced("planner.run", "planner")
     def run(self, user_concept: Dict[str, str]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
         print("\n" + "="*50)
         print("====== 阶段一：规划与设计 (专家模式) ======")
@@ -69,12 +72,16 @@ class CityPlannerAgent(BaseAgent):
         *   `allowed_districts` (数组): **必须准确**指定此资产所属的区域类型列表。
         *   `placement_type` (枚举): `primary_building`, `facade_prop` (如空调、雨棚), `street_level_prop` (如消防栓、长椅、柏油路), `rooftop_prop` (如水箱、天线)。
     *   `quantity_required` (整数): 需求数量。注意，只有完全一样的资产才能算作一种，计入需求数量，否则必须单独成为一种资产。
+    *   `variant_of` (字符串, 可选): 如果该资产只是目录中另一种资产的小幅改款 (例如同一款轿车的不同车漆颜色)，填写那种资产的 `asset_id`；被引用的资产本身不能是改款。
+    *   `variant_edit` (字符串, 可选): 与 `variant_of` 一起给出，用一句话描述相对原资产的修改，如 "把车身颜色改为天蓝色"。
 
 请严格按照上述流程和规范，立即开始生成这个规划方案。
 """
 
         
-        response_str = call_llm_api(prompt)
+        with self._backend("qwen_next", "llm.plan") as span:
+            response_str = call_llm_api(prompt)
+            span.set("prompt_chars", len(prompt))
         plan_data = json.loads(response_str)
         
         # 根据新的、更丰富的结构来解析数据
@@ -84,6 +91,8 @@ class CityPlannerAgent(BaseAgent):
             "districts": plan_data.get("districts", [])
         }
         asset_queue = plan_data.get("asset_catalogue", [])
+        self._link_variants(asset_queue)
+        self._attach_reference_dimensions(asset_queue)
         
         print("\n✅ 深度城市规划生成完毕！")
         print(f"城市名称: {city_plan['profile'].get('name', 'N/A')}")
@@ -91,3 +100,39 @@ class CityPlannerAgent(BaseAgent):
         
         return city_plan, asset_queue
 
+    @staticmethod
+    def _link_variants(asset_queue: List[Dict[str, Any]]):
+        """
+        校验改款关系：variant_of 必须指向目录中另一种非改款资产，且带有 variant_edit；
+        不满足时去掉这两个字段，该资产按普通资产完整生成。
+        """
+        originals = {task['asset_id'] for task in asset_queue if not task.get('variant_of')}
+        linked = 0
+        for task in asset_queue:
+            parent_id = task.get('variant_of')
+            if not parent_id:
+                continue
+            if parent_id in originals and parent_id != task['asset_id'] and task.get('variant_edit'):
+                linked += 1
+                continue
+            print(f"   ⚠️ 资产 '{task['asset_id']}' 的改款关系无效 (variant_of={parent_id})，按普通资产生成。")
+            task.pop('variant_of', None)
+            task.pop('variant_edit', None)
+        if linked:
+            print(f"🎨 资产目录中有 {linked} 种资产将由原资产的概念图编辑派生。")
+
+    def _attach_reference_dimensions(self, asset_queue: List[Dict[str, Any]]):
+        """
+        一次LLM调用估算整个资产目录的真实尺寸，写入每个条目的 reference_dimensions。
+        资产Agent据此为生成的高斯模型确定比例尺，不再为每个资产单独调用LLM。
+        """
+        if not asset_queue:
+            return
+        prompt = create_reference_dimensions_prompt(asset_queue)
+        with self._backend("qwen_next", "llm.reference_dimensions", assets=len(asset_queue)):
+            response = call_llm_api(prompt)
+        references = parse_reference_dimensions(response, [task['asset_id'] for task in asset_queue])
+        for task in asset_queue:
+            if task['asset_id'] in references:
+                task['reference_dimensions'] = references[task['asset_id']]
+        print(f"📏 资产目录尺寸估算完成: {len(references)}/{len(asset_queue)} 种资产获得参考尺寸。")
@@ -1,16 +1,108 @@
 # api_stubs.py (V3 - 全面升级以支持所有高级Agent)
 
 import json
+import math
 import os
 import time
+import re
 import random
+import uuid
 import zipfile
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, List, Optional, Union
+
+import numpy as np
+from PIL import Image
+from plyfile import PlyData, PlyElement
 
 # 确保tmp目录存在
 if not os.path.exists("tmp"):
     os.makedirs("tmp")
 
+# --- 模拟参数 (供离线基准测试调整) ---
+
+# 各模拟后端的平均延迟 (秒)
+DEFAULT_STUB_LATENCY = {
+    "llm": 0.5,
+    "vlm": 1.0,
+    "gen_image": 2.0,
+    "edit_image": 1.0,
+    "gen_3d": 3.0,
+    "gs_merge": 1.0,
+    "gs_snapshot": 0.5,
+}
+
+STUB_CONFIG: Dict[str, Any] = {
+    "latency": dict(DEFAULT_STUB_LATENCY),
+    "distribution": "fixed",   # fixed | uniform | exponential | lognormal
+    "jitter": 0.0,             # uniform: ±比例；lognormal: 对数标准差
+    "time_scale": 1.0,         # 所有延迟统一乘以该系数
+    # 各QA环节的失败概率；None 表示保持按文件名 (attempt_1 / retry_1) 的确定性失败
+    "failure_rates": {"qa_2d": None, "qa_3d": None, "qa_placement": None},
+    # 规划结果的资产种类数与每种资产的实例数；None 表示使用内置的4类资产目录
+    "num_assets": None,
+    "instances_per_asset": None,
+}
+
+# 批量QA时每个额外检查项相对单项请求增加的延迟比例 (共享说明的 prefill 只计一次)
+BATCH_ITEM_LATENCY_FACTOR = 0.25
+# 一次文生图请求中每张额外图像相对单张增加的延迟比例 (同一批次共享排队、文本编码与调度)
+BATCH_IMAGE_LATENCY_FACTOR = 0.6
+
+_rng = random.Random()
+
+
+def configure_stubs(latency: Optional[Dict[str, float]] = None, distribution: Optional[str] = None,
+                    jitter: Optional[float] = None, time_scale: Optional[float] = None,
+                    failure_rates: Optional[Dict[str, Optional[float]]] = None,
+                    num_assets: Optional[int] = None, instances_per_asset: Optional[int] = None,
+                    seed: Optional[int] = None):
+    """修改模拟后端的延迟分布、QA失败率和规划规模，未传入的参数保持不变。"""
+    if latency:
+        STUB_CONFIG["latency"].update(latency)
+    if distribution is not None:
+        if distribution not in ("fixed", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"未知的延迟分布: {distribution}")
+        STUB_CONFIG["distribution"] = distribution
+    if jitter is not None:
+        STUB_CONFIG["jitter"] = jitter
+    if time_scale is not None:
+        STUB_CONFIG["time_scale"] = time_scale
+    if failure_rates:
+        STUB_CONFIG["failure_rates"].update(failure_rates)
+    if num_assets is not None:
+        STUB_CONFIG["num_assets"] = num_assets
+    if instances_per_asset is not None:
+        STUB_CONFIG["instances_per_asset"] = instances_per_asset
+    if seed is not None:
+        _rng.seed(seed)
+
+
+def _simulate_latency(backend: str, scale: float = 1.0):
+    """按配置的分布采样一次延迟并休眠。scale 用于放大单次请求的工作量 (例如批量请求)。"""
+    mean = STUB_CONFIG["latency"][backend] * STUB_CONFIG["time_scale"] * scale
+    if mean <= 0:
+        return
+    distribution = STUB_CONFIG["distribution"]
+    jitter = STUB_CONFIG["jitter"]
+    if distribution == "uniform":
+        delay = _rng.uniform(mean * (1 - jitter), mean * (1 + jitter))
+    elif distribution == "exponential":
+        delay = _rng.expovariate(1 / mean)
+    elif distribution == "lognormal":
+        # 调整 mu 使分布均值等于 mean
+        delay = _rng.lognormvariate(math.log(mean) - jitter ** 2 / 2, jitter)
+    else:
+        delay = mean
+    time.sleep(max(delay, 0.0))
+
+
+def _qa_fails(stage: str, marker_fails: bool) -> bool:
+    """配置了失败率时按概率判定，否则沿用文件名标记的确定性结果。"""
+    rate = STUB_CONFIG["failure_rates"].get(stage)
+    if rate is None:
+        return marker_fails
+    return _rng.random() < rate
+
 # --- 核心大模型模拟 ---
 
 def call_llm_api(prompt: str, image_path: Optional[str] = None) -> str:
@@ -22,7 +114,7 @@ def call_llm_api(prompt: str, image_path: Optional[str] = None) -> str:
         print(f"🧠 VLM (Qwen) received prompt: '{prompt[:100]}...' AND image '{image_path}'")
     else:
         print(f"🧠 LLM (Qwen) received prompt: '{prompt[:100]}...'")
-    time.sleep(0.5)
+    _simulate_latency("llm")
     
     # 模拟 阶段一：城市规划
     if "顶级的AI世界总设计师" in prompt:
@@ -40,6 +132,18 @@ def call_llm_api(prompt: str, image_path: Optional[str] = None) -> str:
         }
         return json.dumps(response, indent=2)
 
+    # 模拟 阶段一：资产目录尺寸估算 (每个目录一次)
+    elif "估算资产目录中每种资产的真实世界尺寸" in prompt:
+        references = {}
+        for asset_id, asset_type in re.findall(r"^- (\S+) \((\w*)/", prompt, re.M):
+            if asset_type == "building":
+                references[asset_id] = {"length": 30.0, "width": 20.0, "height": 60.0}
+            elif asset_type == "vehicle":
+                references[asset_id] = {"length": 4.5, "width": 1.8, "height": 1.5}
+            else:
+                references[asset_id] = {"length": 1.0, "width": 1.0, "height": 2.0}
+        return json.dumps(references, indent=2)
+
     # 模拟 阶段二：估算尺寸
     elif "估算其真实世界尺寸" in prompt:
         if "building" in prompt.lower() or "大楼" in prompt:
@@ -87,21 +191,46 @@ def call_vlm_api(media_path: Union[str, Dict], prompt: str) -> str:
     【已升级】模拟Qwen-VL多模态模型。
     根据不同的QA任务返回结构化的JSON响应。
     """
-    time.sleep(1)
+    _simulate_latency("vlm")
+    return json.dumps(_vlm_verdict(media_path, prompt), indent=2, ensure_ascii=False)
+
+
+def call_vlm_batch_api(instruction: str, items: List[Dict[str, Any]]) -> str:
+    """
+    模拟批量QA请求：共享说明只计一次 prefill，每多一个检查项只增加少量解码时间。
+    返回按 id 标注的JSON数组。
+    """
+    print(f"👀 Qwen-VL (Batched QA) on {len(items)} items")
+    _simulate_latency("vlm", scale=1 + BATCH_ITEM_LATENCY_FACTOR * (len(items) - 1))
+    verdicts = []
+    for item in items:
+        paths = item["media_paths"]
+        media = paths[0] if len(paths) == 1 else {str(i): path for i, path in enumerate(paths)}
+        verdicts.append({"id": item["id"], **_vlm_verdict(media, instruction + item["prompt"])})
+    return json.dumps(verdicts, indent=2, ensure_ascii=False)
+
+
+def _vlm_verdict(media_path: Union[str, Dict], prompt: str) -> Dict[str, Any]:
+    """按媒体类型与文件名标记生成QA结论。"""
 
     # 模拟 阶段三：场景放置差分对比评估
-    if "差分对比" in prompt:
-        any_image_path = list(media_path.values())[0] if isinstance(media_path, dict) else ""
-        print(f"👀 Qwen-VL (Differential QA) on {len(media_path)} images for asset: '{any_image_path.split('_')[2]}'")
-        if "retry_1" in any_image_path:
+    if isinstance(media_path, dict) or "差分对比" in prompt:
+        # 场景快照为 视角名称 -> 图片路径 的映射；空场景的快照为空字典
+        snapshots = list(media_path.values()) if isinstance(media_path, dict) else []
+        any_image_path = next(iter(snapshots[0].values()), "") if snapshots and isinstance(snapshots[0], dict) \
+            else (snapshots[0] if snapshots else "")
+        image_paths = [path for views in snapshots for path in (views.values() if isinstance(views, dict) else [views])]
+        asset_name = os.path.basename(image_paths[0]).split('_')[2] if image_paths else "unknown"
+        print(f"👀 Qwen-VL (Differential QA) on {len(image_paths)} images for asset: '{asset_name}'")
+        if _qa_fails("qa_placement", "retry_1" in any_image_path):
             response = {"pass": False, "reason": "对比局部图发现，资产明显悬浮于地面之上。"}
         else:
             response = {"pass": True, "reason": "资产已稳固放置，与周围环境融合良好。"}
     
     # 模拟 阶段二：3D模型视频QA
-    elif ".mp4" in str(media_path):
-        print(f"👀 Qwen-VL (3D Video QA) on '{media_path}'")
-        if "attempt_1" in str(media_path):
+    elif ".mp4" in str(media_path) or "contact_sheet" in str(media_path):
+        print(f"👀 Qwen-VL (3D QA) on '{media_path}'")
+        if _qa_fails("qa_3d", "attempt_1" in str(media_path)):
             response = {"pass": False, "reason": "模型存在明显的悬浮碎片和破面。"}
         else:
             response = {"pass": True, "reason": "模型完整，几何准确，渲染质量达标。"}
@@ -109,66 +238,148 @@ def call_vlm_api(media_path: Union[str, Dict], prompt: str) -> str:
     # 模拟 阶段二：2D图像QA
     else:
         print(f"👀 Qwen-VL (2D Image QA) on '{media_path}'")
-        if "attempt_1" in str(media_path):
+        if _qa_fails("qa_2d", "attempt_1" in str(media_path)):
             response = {"pass": False, "failed_criteria": [4], "reason": "图像存在明显的投射阴影，不符合3D建模要求。"}
         else:
             response = {"pass": True, "failed_criteria": [], "reason": "所有标准均已满足。"}
-            
-    return json.dumps(response, indent=2, ensure_ascii=False)
+
+    return response
 
 
 # --- 核心生成模型模拟 ---
 
-def call_gen_image_api(prompt: str, attempt: int) -> str:
-    """模拟文生图API。文件名中包含尝试次数，以便QA mock进行响应。"""
-    print(f"🎨 Qwen-Image (Attempt {attempt}) processing prompt...")
-    time.sleep(2)
-    asset_name = os.path.join("tmp", f"gen_img_attempt_{attempt}_{random.randint(1000, 9999)}.png")
-    with open(asset_name, 'w') as f: f.write('fake png data')
-    print(f"  -> Generated: {asset_name}")
-    return asset_name
+def call_gen_image_api(prompt: str, output_path: str = "result.png", seed: int = 5678, **kwargs) -> Optional[Image.Image]:
+    """模拟文生图API，参数与返回值同 gen_image_utils.call_gen_image_api。文件名由调用方决定 (含尝试次数，以便QA mock进行响应)。"""
+    print(f"🎨 Qwen-Image (seed {seed}) processing prompt...")
+    _simulate_latency("gen_image")
+    image = _placeholder_concept(seed)
+    image.save(output_path, format="PNG")
+    print(f"  -> Generated: {output_path}")
+    return image
+
+
+def _placeholder_concept(seed: Optional[int]) -> Image.Image:
+    """白底 + 居中色块的小尺寸占位图 (可以通过本地预检)。"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (256, 256), (255, 255, 255))
+    image.paste(tuple(rng.randint(30, 220) for _ in range(3)), (64, 43, 192, 213))
+    return image
+
+
+def call_gen_images_api(prompt: str, seeds: List[int], output_paths: Optional[List[str]] = None,
+                        **kwargs) -> List[Image.Image]:
+    """模拟一次请求生成多张候选的文生图API (每个种子一张)，参数与返回值同 gen_image_utils.call_gen_images_api。"""
+    print(f"🎨 Qwen-Image (seeds {list(seeds)}) processing prompt in one batch...")
+    _simulate_latency("gen_image", scale=1 + BATCH_IMAGE_LATENCY_FACTOR * (len(seeds) - 1))
+    images = [_placeholder_concept(seed) for seed in seeds]
+    for image, path in zip(images, output_paths or []):
+        image.save(path, format="PNG")
+    if output_paths:
+        print(f"  -> Generated: {', '.join(output_paths)}")
+    return images
+
+
+def call_edit_image_api(prompt: str, image_paths: List[str], output_path: str = "result.png", seed: int = 0,
+                        num_inference_steps: int = 40, **kwargs) -> Optional[Image.Image]:
+    """
+    模拟图像编辑API (派生变体)，参数与返回值同 edit_image_utils.call_edit_image_api。
+    延迟按推理步数缩放，输出与主图尺寸相同的占位图。
+    """
+    print(f"🖌️ Qwen-Image-Edit (seed {seed}, {num_inference_steps} steps) editing '{image_paths[0]}'...")
+    _simulate_latency("edit_image", scale=num_inference_steps / 40)
+    with Image.open(image_paths[0]) as source:
+        image = source.convert("RGB")
+    # 只改变主体颜色，视角与构图保持不变
+    rng = random.Random(seed)
+    width, height = image.size
+    image.paste(tuple(rng.randint(30, 220) for _ in range(3)), (width // 4, height // 6, width * 3 // 4, height * 5 // 6))
+    image.save(output_path, format="PNG")
+    print(f"  -> Edited: {output_path}")
+    return image
+
+
+def _fake_gaussian_ply(path_or_stream, num_gaussians: int = 4000, seed: int = 0):
+    """写出一个合法的小型高斯PLY (单位立方体内的高斯团块)，供本地几何预检与尺寸测量读取。"""
+    rng = np.random.default_rng(seed)
+    fields = ["x", "y", "z", "f_dc_0", "f_dc_1", "f_dc_2", "opacity", "scale_0", "scale_1", "scale_2",
+              "rot_0", "rot_1", "rot_2", "rot_3"]
+    data = np.zeros(num_gaussians, dtype=[(name, "<f4") for name in fields])
+    for axis in "xyz":
+        data[axis] = rng.normal(0.0, 0.15, num_gaussians).clip(-0.5, 0.5)
+    data["opacity"] = rng.normal(2.0, 1.0, num_gaussians)
+    for i in range(3):
+        data[f"scale_{i}"] = rng.normal(-5.0, 0.5, num_gaussians)
+    data["rot_0"] = 1.0
+    PlyData([PlyElement.describe(data, "vertex")]).write(path_or_stream)
+
 
 def call_gen_3d_api(image_path: str, attempt: int) -> str:
     """模拟图生3D模型API。返回一个包含多个文件的zip包。"""
     print(f"🧊 SAM3D (Attempt {attempt}) processing image: '{image_path}'")
-    time.sleep(3)
+    _simulate_latency("gen_3d")
     base_name = os.path.basename(image_path).replace('.png', f'_3d_model_attempt_{attempt}')
     zip_path = os.path.join("tmp", f"{base_name}.zip")
     
+    unique_id = uuid.uuid4().hex[:8]
     with zipfile.ZipFile(zip_path, 'w') as zipf:
-        # 创建假的内部文件
-        ply_path = "model.ply"
-        with open(ply_path, 'w') as f: f.write('fake ply data')
-        zipf.write(ply_path)
-        os.remove(ply_path)
-
-        video_path = "render.mp4"
-        with open(video_path, 'w') as f: f.write('fake mp4 data')
-        zipf.write(video_path)
-        os.remove(video_path)
-        
+        # 与 TRELLIS 服务相同的成员命名
+        with zipf.open(f"gaussian_{unique_id}.ply", 'w') as ply_file:
+            _fake_gaussian_ply(ply_file, seed=attempt)
+        for asset_type in ["gaussian", "radiance_field", "mesh"]:
+            zipf.writestr(f"{asset_type}_{unique_id}.mp4", 'fake mp4 data')
+        zipf.writestr(f"model_{unique_id}.glb", 'fake glb data')
+
     print(f"  -> Generated 3D package: {zip_path}")
     return zip_path
 
 
 # --- 场景与高斯泼溅模拟 ---
 
-def gaussian_splatting_merge(base_scene_ply: Optional[str], new_asset_ply: str, position: Dict, rotation: Dict, step: int) -> str:
+def gaussian_splatting_merge(base_scene_ply: Optional[str], new_asset_ply: str, position: Dict, rotation: Dict, step: int,
+                             output_dir: str = "tmp") -> str:
     """模拟合并高斯模型。"""
     print(f"   - [API STUB] Merging asset into scene...")
-    time.sleep(1)
-    merged_path = os.path.join("tmp", f"scene_merged_step_{step}.ply")
+    _simulate_latency("gs_merge")
+    os.makedirs(output_dir, exist_ok=True)
+    merged_path = os.path.join(output_dir, f"scene_merged_step_{step}.ply")
     with open(merged_path, "w") as f: f.write(f"Fake merged PLY data, step {step}")
     return merged_path
 
-def gaussian_splatting_snapshot(scene_ply: Optional[str], camera_mode: str, info: str, target_pos: Optional[Dict] = None) -> str:
-    """【已升级】模拟为高斯场景生成快照。"""
-    scene_name = "empty_scene" if scene_ply is None else os.path.basename(scene_ply)
+# 与 gs_utils.gaussian_splatting_snapshot 相同的视角；未知的相机模式渲染全部视角
+SNAPSHOT_VIEWS = ("front", "top", "left", "perspective")
+
+
+def gaussian_splatting_snapshot(scene_ply, camera_mode: str, info: str, target_pos: Optional[Dict] = None,
+                                output_dir: str = "tmp") -> Dict[str, str]:
+    """
+    【已升级】模拟为高斯场景生成快照。scene_ply 可以是PLY路径或内存中的 SceneAccumulator。
+    与真实实现一样返回视角名称到图片路径的映射，场景为空时返回空字典。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if scene_ply is None or (not isinstance(scene_ply, str) and len(scene_ply) == 0):
+        print(f"   - [API STUB] 未提供场景文件，无法生成快照 ('{info}')")
+        return {}
+    elif isinstance(scene_ply, str):
+        scene_name = os.path.basename(scene_ply)
+    else:
+        scene_name = f"{scene_ply.name} ({len(scene_ply)} gaussians)"
     print(f"   - [API STUB] Taking '{camera_mode}' snapshot of '{scene_name}' for '{info}'...")
-    time.sleep(0.5)
-    snapshot_path = os.path.join("tmp", f"snapshot_{info}.png")
-    with open(snapshot_path, 'w') as f: f.write(f"Fake {camera_mode} snapshot data")
-    return snapshot_path
+    _simulate_latency("gs_snapshot")
+    views = [camera_mode.lower()] if camera_mode.lower() in SNAPSHOT_VIEWS else SNAPSHOT_VIEWS
+    snapshot_paths = {}
+    for view_name in views:
+        snapshot_path = os.path.join(output_dir, f"snapshot_{info}_{view_name}.png")
+        with open(snapshot_path, 'w') as f: f.write(f"Fake {view_name} snapshot data")
+        snapshot_paths[view_name] = snapshot_path
+    return snapshot_paths
+
+def gaussian_splatting_contact_sheet(ply_path: str, output_path: str, **kwargs) -> Optional[str]:
+    """模拟在本地渲染资产的环绕视角联系表。"""
+    print(f"   - [API STUB] Rendering contact sheet of '{os.path.basename(ply_path)}'...")
+    _simulate_latency("gs_snapshot")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, 'w') as f: f.write("Fake contact sheet data")
+    return output_path
 
 def get_planner_response():
     """返回一个符合CityPlannerAgent V3规范的、丰富的城市规划模拟数据。"""
@@ -241,8 +452,44 @@ def get_planner_response():
                     "placement_type": "street_level_prop"
                 },
                 "quantity_required": 3
+            },
+            {
+                "asset_id": "VEHICLE_SEDAN_1950S_BLUE_01",
+                "type": "vehicle",
+                "subtype": "classic_sedan",
+                "style_tags": ["1950s", "Realism", "Chrome"],
+                "description": "一辆1950年代风格的天蓝色四门轿车。车身曲线圆润，拥有大量的镀铬装饰条、巨大的圆形前灯和尾鳍设计。车漆光亮但有细微划痕。",
+                "variant_of": "VEHICLE_SEDAN_1950S_RED_01",
+                "variant_edit": "把车身颜色改为天蓝色",
+                "placement_rules": {
+                    "allowed_districts": ["financial", "commercial", "residential"],
+                    "placement_type": "street_level_prop"
+                },
+                "quantity_required": 2
             }
         ]
     }
+    if STUB_CONFIG["num_assets"] is not None or STUB_CONFIG["instances_per_asset"] is not None:
+        plan["asset_catalogue"] = _scale_catalogue(plan["asset_catalogue"])
     return json.dumps(plan, ensure_ascii=False, indent=2)
 
+
+def _scale_catalogue(catalogue: list) -> list:
+    """按配置的资产种类数循环复制内置目录，每个副本的ID与描述都不同，避免命中资产缓存。"""
+    num_assets = STUB_CONFIG["num_assets"] or len(catalogue)
+    quantity = STUB_CONFIG["instances_per_asset"]
+    scaled = []
+    for i in range(num_assets):
+        template = catalogue[i % len(catalogue)]
+        variant = i // len(catalogue)
+        asset = dict(template)
+        if variant:
+            asset["asset_id"] = f"{template['asset_id']}_V{variant:03d}"
+            asset["description"] = f"{template['description']} (变体 {variant})"
+            if template.get("variant_of"):
+                asset["variant_of"] = f"{template['variant_of']}_V{variant:03d}"
+        if quantity is not None:
+            asset["quantity_required"] = quantity
+        scaled.append(asset)
+    return scaled
+
@@ -0,0 +1,134 @@
+# asset_worker.py (分布式资产生成 worker)
+"""
+从任务队列租用资产任务，运行 AssetGenerationAgent，并把结果写入共享资产存储。
+
+任意节点上可以启动任意数量的 worker，只要它们能访问同一个队列数据库和共享存储目录:
+    python asset_worker.py --queue-db /shared/work_queue.sqlite --store /shared/asset_store --concurrency 4
+
+编排进程使用 `python urban_pipeline.py --queue-db /shared/work_queue.sqlite` 发布任务。
+worker 崩溃、失联或处理时抛出异常时任务会被重新投递给其他 worker；未通过QA的任务直接标记为失败。
+"""
+import argparse
+import re
+import threading
+import time
+import traceback
+
+from agents.asset_agent import AssetGenerationAgent
+from utils.asset_cache import AssetCache
+from utils.retry_policy import DEFAULT_RETRY_STATS_PATH, RetryPolicy
+from utils.scheduler import BackendPool
+from utils.workspace import RunWorkspace
+from utils.work_queue import (
+    DEFAULT_LEASE_SECONDS, DEFAULT_QUEUE_DB, DEFAULT_STORE_DIR,
+    LeaseHeartbeat, SharedAssetStore, SharedConceptChannel, SQLiteTaskQueue, default_worker_id,
+)
+
+
+def process_task(queue: SQLiteTaskQueue, store: SharedAssetStore, agent: AssetGenerationAgent,
+                 worker_id: str, lease_seconds: float) -> bool:
+    """租用并处理一个任务。队列为空时返回 False。"""
+    task = queue.lease(worker_id, lease_seconds)
+    if task is None:
+        return False
+
+    asset_task = task.payload["asset_task"]
+    # 原资产的概念图经共享存储交给 (可能在其他节点上的) 改款任务
+    concept_channel = SharedConceptChannel(queue, store, task.payload.get("concept_key"),
+                                           task.payload.get("parent_concept_key"))
+    print(f"\n📥 [{worker_id}] 租用任务 '{task.task_id}' (第 {task.attempts} 次投递)")
+    with LeaseHeartbeat(queue, task.task_id, worker_id, lease_seconds) as heartbeat:
+        # 只有异常才重新投递；QA失败已经由重试策略决定放弃，换一个 worker 重跑只会得到同样的结果
+        retry = False
+        try:
+            asset = agent.run(asset_task, concept_channel=concept_channel)
+            error = None if asset else "asset generation failed QA"
+        except Exception as e:
+            traceback.print_exc()
+            asset, error, retry = None, f"{type(e).__name__}: {e}", True
+
+    if heartbeat.lost:
+        # 任务已交给其他 worker，本次的产物不会被提交
+        if asset is not None:
+            agent.release_asset_files(asset)
+        return True
+    if asset is None:
+        queue.fail(task.task_id, worker_id, error, retry=retry)
+        print(f"   🚨 [{worker_id}] 任务 '{task.task_id}' 失败: {error}" + (" (将重新投递)" if retry else ""))
+        return True
+
+    stored = store.put(task.task_id, asset)
+    # 共享存储已有副本 (缓存命中时文件本就不在工作目录中，release 会忽略)
+    agent.release_asset_files(asset)
+    if queue.complete(task.task_id, worker_id, stored):
+        print(f"   ✅ [{worker_id}] 任务 '{task.task_id}' 已完成并写入共享存储。")
+    else:
+        print(f"   ⚠️ [{worker_id}] 任务 '{task.task_id}' 的租约已被接手，结果未提交。")
+    return True
+
+
+def worker_loop(queue: SQLiteTaskQueue, store: SharedAssetStore, agent: AssetGenerationAgent, worker_id: str,
+                lease_seconds: float, poll_interval: float, idle_exit: float, stop_event: threading.Event):
+    idle_since = time.monotonic()
+    while not stop_event.is_set():
+        if process_task(queue, store, agent, worker_id, lease_seconds):
+            idle_since = time.monotonic()
+            continue
+        if idle_exit and time.monotonic() - idle_since > idle_exit:
+            print(f"💤 [{worker_id}] 空闲超过 {idle_exit}s，退出。")
+            return
+        stop_event.wait(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式资产生成 worker")
+    parser.add_argument("--queue-db", default=DEFAULT_QUEUE_DB, help="任务队列数据库路径 (所有节点共享)")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR, help="共享资产存储目录 (所有节点共享)")
+    parser.add_argument("--worker-id", default=None, help="worker 标识，默认由主机名和进程号生成")
+    parser.add_argument("--concurrency", type=int, default=4, help="本进程内并发处理的任务数")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS, help="租约时长，心跳间隔为其1/3")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="队列为空时的轮询间隔")
+    parser.add_argument("--idle-exit", type=float, default=0, help="空闲超过该秒数后退出，0 表示常驻")
+    args = parser.parse_args()
+
+    queue = SQLiteTaskQueue(args.queue_db)
+    store = SharedAssetStore(args.store)
+    # 同一进程内的所有任务共享后端并发限制、本地资产缓存和重试统计
+    retry_policy = RetryPolicy(DEFAULT_RETRY_STATS_PATH)
+    base_id = args.worker_id or default_worker_id()
+    workspace = RunWorkspace("worker_" + re.sub(r"[^\w\-]+", "_", base_id))
+    agent = AssetGenerationAgent(BackendPool(), AssetCache(), retry_policy=retry_policy, workspace=workspace)
+
+    print(f"👷 worker '{base_id}' 启动: 队列 {args.queue_db}, 存储 {args.store}, 并发 {args.concurrency}")
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(
+            target=worker_loop,
+            args=(queue, store, agent, f"{base_id}/{i}", args.lease_seconds, args.poll_interval,
+                  args.idle_exit, stop_event),
+            name=f"worker-{i}",
+        )
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        print("\n🛑 正在停止 worker (当前任务完成后退出)...")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    workspace.close()
+    print(f"📊 队列状态: {queue.counts()}")
+    retry_policy.print_report()
+    agent.prompt_memo.print_report()
+    agent.pre_qa_2d.print_report()
+    agent.pre_qa_3d.print_report()
+    workspace.print_report()
+
+
+if __name__ == "__main__":
+    main()
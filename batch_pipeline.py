@@ -0,0 +1,158 @@
+# batch_pipeline.py (批量城市生成)
+"""
+批量模式：一次读取多个用户概念，并发运行各城市的规划、资产生成与场景组装。
+
+所有城市共享同一个 BackendPool (每个城市是一个租户，空闲槽位在城市之间公平分配)、同一个资产缓存、prompt改写缓存和重试统计，
+让 vLLM 与扩散模型服务在多个城市之间保持满载，而不是一次只服务一个城市。
+每个城市拥有独立的运行目录 <batch_dir>/<city_name>/ 与独立的工作目录 (tmp/<batch>/<city_name>-xxxx/)。
+
+概念文件可以是 JSON 数组或 JSONL，每一项为:
+    {"name": "riverside", "concept": {"theme": "...", "scale": "...", "time_of_day": "..."}, "weight": 1.0}
+或直接是概念本身 {"theme": "...", ...} (名称自动生成)。
+
+用法:
+    python batch_pipeline.py concepts.jsonl --max-cities 4 --stream
+    python batch_pipeline.py --resume runs/batch_20250101_120000
+"""
+import argparse
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+import urban_pipeline
+from utils.asset_cache import AssetCache
+from utils.checkpoint import DEFAULT_RUNS_DIR, atomic_write_json
+from utils.prompt_memo import PromptMemo
+from utils.retry_policy import DEFAULT_RETRY_STATS_PATH, RetryPolicy
+from utils.scheduler import BackendPool
+from utils.tracing import start_tracing, stop_tracing
+from utils.workspace import DEFAULT_WORKSPACE_ROOT
+
+
+def load_concepts(path: str) -> List[Dict[str, Any]]:
+    """读取概念文件，返回 [{"name", "concept", "weight"}]，名称保证唯一且可用作目录名。"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    concepts, seen = [], set()
+    for i, item in enumerate(items):
+        concept = item.get("concept", item)
+        name = re.sub(r"[^\w\-]+", "_", str(item.get("name") or f"city_{i + 1:03d}")).strip("_") or f"city_{i + 1:03d}"
+        if name in seen:
+            name = f"{name}_{i + 1:03d}"
+        seen.add(name)
+        concepts.append({"name": name, "concept": concept, "weight": float(item.get("weight", 1.0))})
+    return concepts
+
+
+def run_city(entry: Dict[str, Any], batch_dir: str, backend_pool: BackendPool, asset_cache: AssetCache,
+             retry_policy: RetryPolicy, prompt_memo: PromptMemo, stream: bool, queue_db: Optional[str], resume: bool) -> Dict[str, Any]:
+    """运行单个城市的完整流程，返回其结果摘要。"""
+    name = entry["name"]
+    run_dir = os.path.join(batch_dir, name)
+    started = time.time()
+    try:
+        final_scene = urban_pipeline.main(
+            run_dir=run_dir,
+            resume=resume and os.path.isdir(run_dir),
+            stream=stream,
+            queue_db=queue_db,
+            user_concept=entry["concept"],
+            backend_pool=backend_pool.tenant(name, entry["weight"]),
+            asset_cache=asset_cache,
+            workspace_root=os.path.join(DEFAULT_WORKSPACE_ROOT, os.path.basename(os.path.normpath(batch_dir))),
+            trace=False,
+            retry_policy=retry_policy,
+            prompt_memo=prompt_memo,
+        )
+        status = "completed" if final_scene else "failed"
+        error = None
+    except Exception as e:
+        traceback.print_exc()
+        final_scene, status, error = None, "error", f"{type(e).__name__}: {e}"
+
+    return {
+        "name": name,
+        "run_dir": run_dir,
+        "status": status,
+        "error": error,
+        "placed_instances": len(final_scene["placed_assets_info"]) if final_scene else 0,
+        "elapsed_seconds": round(time.time() - started, 1),
+    }
+
+
+def run_batch(concepts: List[Dict[str, Any]], batch_dir: str, max_cities: Optional[int] = None,
+              stream: bool = False, queue_db: Optional[str] = None, resume: bool = False) -> Dict[str, Dict[str, Any]]:
+    """并发运行所有城市，共享后端池与资产缓存。返回 城市名 -> 结果摘要。"""
+    os.makedirs(batch_dir, exist_ok=True)
+    atomic_write_json(os.path.join(batch_dir, "concepts.json"), concepts)
+
+    backend_pool = BackendPool()
+    asset_cache = AssetCache()
+    retry_policy = RetryPolicy(DEFAULT_RETRY_STATS_PATH)
+    prompt_memo = PromptMemo()
+    max_cities = max_cities or len(concepts)
+    print(f"🏙️  批量模式: {len(concepts)} 个城市, 最多 {max_cities} 个并发, 批次目录 {batch_dir}")
+
+    summary: Dict[str, Dict[str, Any]] = {}
+    start_tracing(os.path.join(batch_dir, "trace.json"))
+    try:
+        with ThreadPoolExecutor(max_workers=max_cities, thread_name_prefix="city") as executor:
+            futures = {
+                executor.submit(run_city, entry, batch_dir, backend_pool, asset_cache, retry_policy, prompt_memo, stream,
+                                queue_db, resume): entry
+                for entry in concepts
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                summary[result["name"]] = result
+                # 每完成一个城市就更新批次摘要
+                atomic_write_json(os.path.join(batch_dir, "summary.json"), summary)
+                print(f"\n🏁 城市 '{result['name']}' {result['status']}: "
+                      f"放置 {result['placed_instances']} 个实例, 用时 {result['elapsed_seconds']}s")
+    finally:
+        stop_tracing()
+
+    print("\n" + "=" * 50)
+    print("📋 批量生成结果")
+    print("=" * 50)
+    for entry in concepts:
+        result = summary.get(entry["name"], {})
+        print(f"   {entry['name']:<24}{result.get('status', 'n/a'):<12}{result.get('placed_instances', 0):>6} 实例"
+              f"{result.get('elapsed_seconds', 0):>10}s")
+    backend_pool.print_report()
+    asset_cache.print_report()
+    retry_policy.print_report()
+    prompt_memo.print_report()
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量城市生成：多个用户概念共享同一组模型服务")
+    parser.add_argument("concepts_file", nargs="?", default=None, help="概念文件 (JSON 数组或 JSONL)")
+    parser.add_argument("--batch-dir", default=None, help="批次目录，默认在 runs/ 下按时间创建")
+    parser.add_argument("--resume", default=None, metavar="BATCH_DIR", help="从批次目录恢复，已完成的城市与资产会被跳过")
+    parser.add_argument("--max-cities", type=int, default=None, help="同时运行的城市数上限，默认全部并发")
+    parser.add_argument("--stream", action="store_true", help="各城市使用流式组装模式")
+    parser.add_argument("--queue-db", default=None, help="将资产任务发布到该任务队列，由 asset_worker.py 处理")
+    args = parser.parse_args()
+
+    if args.resume:
+        batch_dir = args.resume
+        with open(os.path.join(batch_dir, "concepts.json"), "r", encoding="utf-8") as f:
+            concepts = json.load(f)
+    elif args.concepts_file:
+        batch_dir = args.batch_dir or os.path.join(DEFAULT_RUNS_DIR, time.strftime("batch_%Y%m%d_%H%M%S"))
+        concepts = load_concepts(args.concepts_file)
+    else:
+        parser.error("需要提供概念文件或 --resume BATCH_DIR")
+
+    run_batch(concepts, batch_dir, args.max_cities, args.stream, args.queue_db, resume=bool(args.resume))
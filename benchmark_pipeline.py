@@ -0,0 +1,285 @@
+# benchmark_pipeline.py (离线端到端吞吐基准)
+"""
+基于 api_stubs 的离线端到端基准测试：在纯CPU、无网络的环境下运行完整流程
+(规划 -> 资产生成 -> 场景组装)，用于衡量调度层本身的吞吐。
+
+所有模型后端与高斯泼溅工具均被替换为 api_stubs 中的模拟实现，延迟分布和QA失败率可配置。
+每次运行在独立的临时工作目录中进行 (tmp/、asset_cache/、runs/ 均相互隔离)，
+结束后读取运行目录下的 trace.json，汇总墙钟时间、各阶段耗时、重试次数和各后端实际达到的并发度。
+
+示例:
+    python benchmark_pipeline.py --assets 12 --instances 4 --time-scale 0.1
+    python benchmark_pipeline.py --assets 30 --distribution lognormal --jitter 0.5 --fail-2d 0.3 --stream
+    python benchmark_pipeline.py --limit qwen_image=4 --limit trellis=2 --repeat 3 --json-out bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import types
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 各 agent 模块中需要替换为模拟实现的后端调用
+_STUBBED_CALLS = ("call_llm_api", "call_vlm_api", "call_vlm_batch_api", "call_gen_image_api", "call_gen_images_api",
+                  "call_edit_image_api", "call_gen_3d_api")
+
+# 各阶段对应的 span 名称
+_STAGE_SPANS = {"planning": "planner.run", "asset_generation": "asset.run", "assembly": "assembly.run"}
+
+
+def install_stub_backends():
+    """
+    将所有模型后端与高斯泼溅工具替换为 api_stubs 中的模拟实现。
+    必须在导入 urban_pipeline / agents 之前调用 (utils.gs_utils 依赖 torch 与 CUDA)。
+    """
+    import api_stubs
+
+    gs_stub = types.ModuleType("utils.gs_utils")
+    gs_stub.gaussian_splatting_merge = (
+        lambda base_scene_ply, new_asset_ply, position, rotation, scale=None, step=0, output_dir="tmp":
+        api_stubs.gaussian_splatting_merge(base_scene_ply, new_asset_ply, position, rotation, step, output_dir)
+    )
+    gs_stub.gaussian_splatting_snapshot = api_stubs.gaussian_splatting_snapshot
+    gs_stub.gaussian_splatting_contact_sheet = api_stubs.gaussian_splatting_contact_sheet
+    sys.modules["utils.gs_utils"] = gs_stub
+
+    import agents.planner_agent
+    import agents.asset_agent
+    import agents.assembly_agent
+    for module in (agents.planner_agent, agents.asset_agent, agents.assembly_agent):
+        for name in _STUBBED_CALLS:
+            if hasattr(module, name):
+                setattr(module, name, getattr(api_stubs, name))
+    return api_stubs
+
+
+def _span_union_seconds(spans: List[Dict[str, Any]]) -> float:
+    """多个 span 从最早开始到最晚结束的时长 (秒)。"""
+    if not spans:
+        return 0.0
+    start = min(e["ts"] for e in spans)
+    end = max(e["ts"] + e["dur"] for e in spans)
+    return (end - start) / 1e6
+
+
+def _service_interval(e: Dict[str, Any]) -> Tuple[float, float]:
+    """后端调用实际占用槽位的区间 (微秒)，不含在信号量上的排队时间。"""
+    start = e["ts"] + e["args"].get("queue_wait_ms", 0) * 1000
+    held_ms = e["args"].get("slot_held_ms")
+    end = start + held_ms * 1000 if held_ms is not None else e["ts"] + e["dur"]
+    return start, end
+
+
+def _peak_concurrency(spans: List[Dict[str, Any]]) -> int:
+    """扫描线计算同时占用槽位的请求数峰值。"""
+    events = []
+    for e in spans:
+        start, end = _service_interval(e)
+        events.append((start, 1))
+        events.append((end, -1))
+    peak = current = 0
+    # 同一时刻先处理结束事件，避免首尾相接的请求被计为重叠
+    for _, delta in sorted(events):
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def analyze_trace(trace_path: str) -> Dict[str, Any]:
+    """从 Chrome Trace 文件中汇总各阶段耗时、重试次数和后端并发度。"""
+    with open(trace_path, "r", encoding="utf-8") as f:
+        events = [e for e in json.load(f)["traceEvents"] if e.get("ph") == "X"]
+
+    by_name: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    by_backend: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for e in events:
+        by_name[e["name"]].append(e)
+        backend = e["args"].get("backend")
+        if backend:
+            by_backend[backend].append(e)
+
+    def attempts_and_retries(span_name: str, key: str) -> Dict[str, int]:
+        spans = by_name.get(span_name, [])
+        distinct = {e["args"].get(key) for e in spans}
+        return {"attempts": len(spans), "retries": len(spans) - len(distinct)}
+
+    backends = {}
+    for backend, spans in sorted(by_backend.items()):
+        waits = [e["args"].get("queue_wait_ms", 0) for e in spans]
+        backends[backend] = {
+            "calls": len(spans),
+            "peak_concurrency": _peak_concurrency(spans),
+            "busy_seconds": round(sum(end - start for start, end in map(_service_interval, spans)) / 1e6, 3),
+            "mean_queue_wait_ms": round(statistics.mean(waits), 2) if waits else 0.0,
+            "max_queue_wait_ms": round(max(waits), 2) if waits else 0.0,
+        }
+
+    return {
+        "stages": {stage: round(_span_union_seconds(by_name.get(name, [])), 3) for stage, name in _STAGE_SPANS.items()},
+        "retries": {
+            "2d": attempts_and_retries("gen_image", "asset_id"),
+            "3d": attempts_and_retries("gen_3d", "asset_id"),
+            "placement": attempts_and_retries("llm.placement", "instance_id"),
+        },
+        "backends": backends,
+        "spans": {name: {"count": len(spans), "total_seconds": round(sum(e["dur"] for e in spans) / 1e6, 3)}
+                  for name, spans in sorted(by_name.items())},
+    }
+
+
+def run_once(index: int, stream: bool, verbose: bool) -> Dict[str, Any]:
+    """在独立的临时工作目录中运行一次完整流程并返回统计结果。"""
+    import urban_pipeline
+
+    workdir = tempfile.mkdtemp(prefix=f"bench_{index}_")
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    os.makedirs("tmp", exist_ok=True)
+    run_dir = os.path.join(workdir, "runs", "bench")
+    try:
+        log = None if verbose else io.StringIO()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(log) if log is not None else contextlib.nullcontext():
+            urban_pipeline.main(run_dir=run_dir, stream=stream)
+        wall = time.perf_counter() - started
+
+        result = analyze_trace(os.path.join(run_dir, "trace.json"))
+        with open(os.path.join(run_dir, "plan.json"), "r", encoding="utf-8") as f:
+            asset_queue = json.load(f)["asset_queue"]
+        with open(os.path.join(run_dir, "final.json"), "r", encoding="utf-8") as f:
+            final = json.load(f)
+
+        result["wall_seconds"] = round(wall, 3)
+        result["assets"] = {
+            "requested": len(asset_queue),
+            "generated": len(os.listdir(os.path.join(run_dir, "assets"))),
+        }
+        result["instances"] = {
+            "requested": sum(task["quantity_required"] for task in asset_queue),
+            "placed": len(final["placed_assets_info"]) if final else 0,
+        }
+        result["throughput_instances_per_min"] = round(result["instances"]["placed"] / wall * 60, 2)
+        return result
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _parse_key_values(items: Optional[List[str]], cast) -> Dict[str, Any]:
+    parsed = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"参数格式应为 key=value: {item}")
+        parsed[key.strip()] = cast(value)
+    return parsed
+
+
+def print_report(runs: List[Dict[str, Any]]):
+    """打印基准结果；多次重复时数值取中位数。"""
+    def median(getter):
+        return statistics.median(getter(r) for r in runs)
+
+    print("\n" + "=" * 50)
+    print(f"📈 离线基准结果 (重复 {len(runs)} 次，取中位数)")
+    print("=" * 50)
+    first = runs[0]
+    print(f"   资产: {first['assets']['generated']}/{first['assets']['requested']} 生成成功, "
+          f"实例: {first['instances']['placed']}/{first['instances']['requested']} 放置成功")
+    print(f"   墙钟时间: {median(lambda r: r['wall_seconds']):.2f}s, "
+          f"吞吐: {median(lambda r: r['throughput_instances_per_min']):.1f} 实例/分钟")
+
+    print("\n--- ⏱️ 各阶段耗时 (秒) ---")
+    for stage in _STAGE_SPANS:
+        print(f"   {stage:<18}{median(lambda r: r['stages'][stage]):>10.2f}")
+
+    print("\n--- 🔁 重试 ---")
+    for stage in first["retries"]:
+        print(f"   {stage:<18}尝试 {median(lambda r: r['retries'][stage]['attempts']):>6.0f}, "
+              f"重试 {median(lambda r: r['retries'][stage]['retries']):>6.0f}")
+
+    print("\n--- 🔀 后端并发 ---")
+    print(f"   {'backend':<16}{'calls':>7}{'peak':>6}{'busy(s)':>10}{'wait_avg(ms)':>14}{'wait_max(ms)':>14}")
+    for backend in first["backends"]:
+        present = [r["backends"][backend] for r in runs if backend in r["backends"]]
+
+        def stat(key):
+            return statistics.median(b[key] for b in present)
+        print(f"   {backend:<16}{stat('calls'):>7.0f}{stat('peak_concurrency'):>6.0f}{stat('busy_seconds'):>10.2f}"
+              f"{stat('mean_queue_wait_ms'):>14.1f}{stat('max_queue_wait_ms'):>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于 api_stubs 的离线端到端吞吐基准")
+    parser.add_argument("--assets", type=int, default=None, help="资产种类数 N (默认使用内置的3类资产)")
+    parser.add_argument("--instances", type=int, default=None, help="每种资产的实例数 M (默认使用规划中的数量)")
+    parser.add_argument("--distribution", choices=("fixed", "uniform", "exponential", "lognormal"), default="fixed",
+                        help="模拟延迟分布")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform: ±比例；lognormal: 对数标准差")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="所有模拟延迟统一乘以该系数")
+    parser.add_argument("--latency", action="append", metavar="BACKEND=SECONDS",
+                        help="覆盖单个模拟后端的平均延迟，可重复 (llm/vlm/gen_image/edit_image/gen_3d/gs_merge/gs_snapshot)")
+    parser.add_argument("--fail-2d", type=float, default=None, help="2D图像QA失败率")
+    parser.add_argument("--fail-3d", type=float, default=None, help="3D模型QA失败率")
+    parser.add_argument("--fail-placement", type=float, default=None, help="放置QA失败率")
+    parser.add_argument("--limit", action="append", metavar="BACKEND=N",
+                        help="覆盖后端并发上限，可重复 (qwen_image/qwen_image_edit/trellis/qwen_vl/qwen_next)")
+    parser.add_argument("--stream", action="store_true", help="使用流式组装模式")
+    parser.add_argument("--repeat", type=int, default=1, help="重复次数，报告取中位数")
+    parser.add_argument("--seed", type=int, default=0, help="模拟延迟与失败的随机种子")
+    parser.add_argument("--json-out", default=None, help="将每次运行的完整结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="输出流程日志")
+    args = parser.parse_args()
+
+    # 后端并发上限在导入 utils.scheduler 时读取，必须先写入环境变量
+    env_names = {"qwen_image": "QWEN_IMAGE_CONCURRENCY", "qwen_image_edit": "QWEN_IMAGE_EDIT_CONCURRENCY",
+                 "trellis": "TRELLIS_CONCURRENCY",
+                 "qwen_vl": "QWEN_VL_CONCURRENCY", "qwen_next": "QWEN_NEXT_CONCURRENCY"}
+    for backend, limit in _parse_key_values(args.limit, int).items():
+        if backend not in env_names:
+            parser.error(f"未知的模型后端: {backend}")
+        os.environ[env_names[backend]] = str(limit)
+
+    # 只要指定了任一失败率，未指定的环节按 0 处理，不再使用文件名标记
+    failure_rates = {"qa_2d": args.fail_2d, "qa_3d": args.fail_3d, "qa_placement": args.fail_placement}
+    if any(rate is not None for rate in failure_rates.values()):
+        failure_rates = {stage: rate or 0.0 for stage, rate in failure_rates.items()}
+
+    sys.path.insert(0, REPO_ROOT)
+    api_stubs = install_stub_backends()
+    api_stubs.configure_stubs(
+        latency=_parse_key_values(args.latency, float),
+        distribution=args.distribution,
+        jitter=args.jitter,
+        time_scale=args.time_scale,
+        failure_rates=failure_rates,
+        num_assets=args.assets,
+        instances_per_asset=args.instances,
+        seed=args.seed,
+    )
+
+    runs = []
+    for i in range(args.repeat):
+        print(f"🏁 基准运行 {i + 1}/{args.repeat} ...")
+        runs.append(run_once(i, args.stream, args.verbose))
+        print(f"   完成，墙钟时间 {runs[-1]['wall_seconds']:.2f}s")
+
+    print_report(runs)
+    if args.json_out:
+        config = {k: v for k, v in vars(args).items() if k not in ("json_out", "verbose")}
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "runs": runs}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 基准结果已写入: {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+"""
+本地模拟模型服务 (用于压测，不依赖GPU与模型权重)。
+
+与真实服务保持相同的 HTTP 请求/响应契约:
+    image : POST /generate          (qwen_image_api.py,       默认端口 8021)
+    edit  : POST /edit-image        (qwen_image_edit_api.py,  默认端口 8022)
+    3d    : POST /generate-3d/      (image_to_3d_api.py,      默认端口 8031)
+    vl    : POST /v1/chat/completions  (vLLM Qwen3-VL,       默认端口 8012，支持 SSE 流式)
+    next  : POST /v1/chat/completions  (vLLM Qwen3-Next,     默认端口 8011，支持 SSE 流式)
+
+每个服务拥有可配置的服务时间分布和模拟GPU槽位数：请求先排队等待槽位，再按采样的服务时间异步休眠。
+GET /health 返回服务状态，GET /mock/stats 返回排队/在途/完成数等统计。
+
+用法:
+    python model_api/mock_servers.py all --time-scale 0.1
+    python model_api/mock_servers.py image --gpu-slots 2 --service-time 15 --distribution lognormal --jitter 0.3
+    MOCK_3D_GPU_SLOTS=2 MOCK_3D_SERVICE_TIME=40 python model_api/mock_servers.py all
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+import zipfile
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
+from PIL import Image
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+# 复用 api_stubs 中面向各 Agent prompt 的模拟回复
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(current_dir))
+
+MAX_SEED = np.iinfo(np.int32).max
+# 与 qwen_image_api.py 相同的单次请求图像数上限
+MAX_IMAGES_PER_REQUEST = int(os.environ.get("MAX_IMAGES_PER_REQUEST", 8))
+
+# 各模拟服务的默认配置，可通过环境变量 MOCK_<NAME>_SERVICE_TIME / MOCK_<NAME>_GPU_SLOTS 覆盖
+SERVER_DEFAULTS = {
+    "image": {"port": 8021, "service_time": 20.0, "gpu_slots": 1},
+    "edit": {"port": 8022, "service_time": 25.0, "gpu_slots": 1},
+    "3d": {"port": 8031, "service_time": 30.0, "gpu_slots": 1},
+    "vl": {"port": 8012, "service_time": 3.0, "gpu_slots": 16},
+    "next": {"port": 8011, "service_time": 2.0, "gpu_slots": 16},
+}
+
+
+def _server_defaults(name: str) -> Dict[str, Any]:
+    defaults = dict(SERVER_DEFAULTS[name])
+    env_prefix = f"MOCK_{name.upper()}_"
+    defaults["service_time"] = float(os.environ.get(env_prefix + "SERVICE_TIME", defaults["service_time"]))
+    defaults["gpu_slots"] = int(os.environ.get(env_prefix + "GPU_SLOTS", defaults["gpu_slots"]))
+    return defaults
+
+
+# ----------------- 模拟GPU后端 -----------------
+class SimulatedBackend:
+    """
+    一个模拟的GPU推理后端：固定数量的槽位 + 服务时间分布。
+    超过 max_queue 个请求排队时直接返回 503，模拟真实服务任务队列已满。
+    """
+
+    def __init__(self, name: str, service_time: float, gpu_slots: int, distribution: str = "fixed",
+                 jitter: float = 0.0, time_scale: float = 1.0, max_queue: int = 100, seed: Optional[int] = None):
+        if distribution not in ("fixed", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"未知的服务时间分布: {distribution}")
+        self.name = name
+        self.service_time = service_time
+        self.gpu_slots = gpu_slots
+        self.distribution = distribution
+        self.jitter = jitter
+        self.time_scale = time_scale
+        self.max_queue = max_queue
+        self._rng = random.Random(seed)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"queued": 0, "in_flight": 0, "peak_in_flight": 0, "completed": 0, "rejected": 0,
+                      "busy_seconds": 0.0}
+        self.started_at = time.time()
+
+    def sample_service_time(self, scale: float = 1.0) -> float:
+        """按配置的分布采样一次服务时间 (秒)。"""
+        mean = self.service_time * self.time_scale * scale
+        if mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return max(self._rng.uniform(mean * (1 - self.jitter), mean * (1 + self.jitter)), 0.0)
+        if self.distribution == "exponential":
+            return self._rng.expovariate(1 / mean)
+        if self.distribution == "lognormal":
+            return self._rng.lognormvariate(math.log(mean) - self.jitter ** 2 / 2, self.jitter)
+        return mean
+
+    @asynccontextmanager
+    async def gpu_slot(self):
+        """排队等待一个GPU槽位。"""
+        # 信号量需在事件循环内创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.gpu_slots)
+        if self.stats["queued"] >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise HTTPException(status_code=503, detail=f"{self.name} task queue is full")
+
+        self.stats["queued"] += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.stats["queued"] -= 1
+
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+        acquired_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stats["in_flight"] -= 1
+            self.stats["completed"] += 1
+            self.stats["busy_seconds"] += time.monotonic() - acquired_at
+            self._semaphore.release()
+
+    async def serve(self, scale: float = 1.0):
+        """占用一个槽位并模拟一次推理。"""
+        async with self.gpu_slot():
+            await asyncio.sleep(self.sample_service_time(scale))
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "backend": self.name,
+            "gpu_slots": self.gpu_slots,
+            "service_time": self.service_time,
+            "distribution": self.distribution,
+            "time_scale": self.time_scale,
+            **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.stats.items()},
+            "slot_utilization": round(self.stats["busy_seconds"] / (elapsed * self.gpu_slots), 4),
+        }
+
+
+def _add_common_routes(app: FastAPI, backend: SimulatedBackend):
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy", "device": "mock"}
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        return backend.snapshot()
+
+
+# ----------------- 模拟输出 -----------------
+def get_image_size(aspect_ratio):
+    if aspect_ratio == "1:1": return 1328, 1328
+    elif aspect_ratio == "16:9": return 1664, 928
+    elif aspect_ratio == "9:16": return 928, 1664
+    elif aspect_ratio == "4:3": return 1472, 1140
+    elif aspect_ratio == "3:4": return 1140, 1472
+    return 1328, 1328
+
+
+def _render_png_base64(seed: int, width: int, height: int) -> str:
+    """生成一张由种子决定颜色的占位图 (白底 + 居中色块)，返回 base64 PNG。"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    color = tuple(rng.randint(30, 220) for _ in range(3))
+    box = (width // 4, height // 6, width * 3 // 4, height * 5 // 6)
+    image.paste(color, box)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+# 3D高斯泼溅 PLY 的标准属性 (与 TRELLIS 的 save_ply 输出一致)
+_GAUSSIAN_FIELDS = (
+    ["x", "y", "z", "nx", "ny", "nz", "f_dc_0", "f_dc_1", "f_dc_2"]
+    + [f"f_rest_{i}" for i in range(45)]
+    + ["opacity", "scale_0", "scale_1", "scale_2", "rot_0", "rot_1", "rot_2", "rot_3"]
+)
+
+
+@lru_cache(maxsize=4)
+def _gaussian_ply_bytes(num_gaussians: int) -> bytes:
+    """生成一个合法的二进制3DGS PLY (单位立方体内的高斯团块)。同一数量只生成一次。"""
+    rng = np.random.default_rng(num_gaussians)
+    data = np.zeros((num_gaussians, len(_GAUSSIAN_FIELDS)), dtype="<f4")
+    data[:, 0:3] = rng.normal(0.0, 0.15, size=(num_gaussians, 3)).clip(-0.5, 0.5)
+    data[:, 6:9] = rng.normal(0.0, 0.5, size=(num_gaussians, 3))
+    opacity_idx = _GAUSSIAN_FIELDS.index("opacity")
+    data[:, opacity_idx] = rng.normal(2.0, 1.0, size=num_gaussians)
+    data[:, opacity_idx + 1:opacity_idx + 4] = rng.normal(-5.0, 0.5, size=(num_gaussians, 3))
+    data[:, opacity_idx + 4] = 1.0
+
+    header = "ply\nformat binary_little_endian 1.0\n"
+    header += f"element vertex {num_gaussians}\n"
+    header += "".join(f"property float {name}\n" for name in _GAUSSIAN_FIELDS)
+    header += "end_header\n"
+    return header.encode("ascii") + data.tobytes()
+
+
+def _build_3d_package(num_gaussians: int) -> str:
+    """按 TRELLIS 服务的命名打包 ZIP：gaussian_<id>.ply、三个渲染视频和 model_<id>.glb。"""
+    unique_id = uuid.uuid4().hex[:8]
+    output_dir = tempfile.mkdtemp()
+    zip_file_path = os.path.join(output_dir, f"3d_model_assets_{unique_id}.zip")
+    with zipfile.ZipFile(zip_file_path, "w") as zipf:
+        zipf.writestr(f"gaussian_{unique_id}.ply", _gaussian_ply_bytes(num_gaussians))
+        for asset_type in ["gaussian", "radiance_field", "mesh"]:
+            zipf.writestr(f"{asset_type}_{unique_id}.mp4", b"mock mp4 data")
+        zipf.writestr(f"model_{unique_id}.glb", b"mock glb data")
+    return zip_file_path
+
+
+# ----------------- 文生图 /generate -----------------
+class InferenceRequest(BaseModel):
+    prompt: str
+    negative_prompt: str = ""
+    seed: int = 42
+    randomize_seed: bool = False
+    aspect_ratio: str = "16:9"
+    guidance_scale: float = 5.0
+    num_inference_steps: int = 50
+    num_images: int = 1
+    seeds: Optional[List[int]] = None
+
+
+def create_image_app(backend: SimulatedBackend) -> FastAPI:
+    import api_stubs
+    app = FastAPI(title="Mock Qwen-Image API")
+    _add_common_routes(app, backend)
+
+    @app.post("/generate")
+    async def generate_image(req: InferenceRequest):
+        if req.seeds:
+            seeds = list(req.seeds)
+        elif req.randomize_seed:
+            seeds = [random.randint(0, MAX_SEED) for _ in range(req.num_images)]
+        else:
+            seeds = [(req.seed + i) % (MAX_SEED + 1) for i in range(req.num_images)]
+        if not 1 <= len(seeds) <= MAX_IMAGES_PER_REQUEST:
+            raise HTTPException(status_code=400, detail=f"num_images must be between 1 and {MAX_IMAGES_PER_REQUEST}")
+        # 服务时间按推理步数线性缩放 (配置值对应 50 步)；同一批次的额外图像共享文本编码与调度，只增加部分时间
+        batch_scale = 1 + api_stubs.BATCH_IMAGE_LATENCY_FACTOR * (len(seeds) - 1)
+        await backend.serve(scale=req.num_inference_steps / 50 * batch_scale)
+        width, height = get_image_size(req.aspect_ratio)
+        images = [await asyncio.to_thread(_render_png_base64, seed, width, height) for seed in seeds]
+        return {"success": True, "seed": seeds[0], "image_base64": images[0], "seeds": seeds, "images_base64": images}
+
+    return app
+
+
+# ----------------- 图像编辑 /edit-image -----------------
+class ImageEditRequest(BaseModel):
+    prompt: str
+    negative_prompt: str = " "
+    seed: int = 0
+    true_cfg_scale: float = 4.0
+    guidance_scale: float = 1.0
+    num_inference_steps: int = 40
+    num_images_per_prompt: int = 1
+
+
+def create_edit_app(backend: SimulatedBackend) -> FastAPI:
+    app = FastAPI(title="Mock Qwen Image Edit Plus API")
+    _add_common_routes(app, backend)
+
+    @app.post("/edit-image")
+    async def edit_image(request: str = Form(...), images: List[UploadFile] = File(...)):
+        try:
+            request_obj = ImageEditRequest(**json.loads(request))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        input_images = []
+        for img_file in images:
+            img_bytes = await img_file.read()
+            try:
+                input_images.append(Image.open(BytesIO(img_bytes)).convert("RGB"))
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+        if not input_images:
+            raise HTTPException(status_code=400, detail="At least 1 image is required")
+
+        await backend.serve(scale=request_obj.num_inference_steps / 40)
+        width, height = input_images[0].size
+        img_str = await asyncio.to_thread(_render_png_base64, request_obj.seed, width, height)
+        return {"success": True, "image_base64": img_str, "seed": request_obj.seed}
+
+    return app
+
+
+# ----------------- 图生3D /generate-3d/ -----------------
+def create_3d_app(backend: SimulatedBackend, num_gaussians: int = 20000) -> FastAPI:
+    app = FastAPI(title="Mock 3D Model Generator API")
+    _add_common_routes(app, backend)
+
+    @app.post("/generate-3d/")
+    async def generate_3d(file: UploadFile = File(...)):
+        image_bytes = await file.read()
+        try:
+            Image.open(BytesIO(image_bytes)).verify()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+
+        await backend.serve()
+        zip_file_path = await asyncio.to_thread(_build_3d_package, num_gaussians)
+        # 响应发送完毕后删除本次请求的临时目录，长时间压测不会堆满 /tmp
+        return FileResponse(
+            zip_file_path,
+            media_type="application/octet-stream",
+            filename=os.path.basename(zip_file_path),
+            background=BackgroundTask(shutil.rmtree, os.path.dirname(zip_file_path), ignore_errors=True)
+        )
+
+    return app
+
+
+# ----------------- vLLM /v1/chat/completions -----------------
+_BATCH_ITEM_ID = re.compile(r"### 检查项 id=(\S+)")
+
+
+def _split_message(messages: List[Dict[str, Any]]):
+    """从 OpenAI 格式的消息中取出最后一条用户消息的文本，并统计图像/视频数量。"""
+    text_parts, num_media = [], 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            text_parts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                text_parts.append(part.get("text", ""))
+            else:
+                num_media += 1
+    return "\n".join(text_parts), num_media
+
+
+def create_chat_app(backend: SimulatedBackend, model_name: str, qa_failure_rate: float = 0.0,
+                    token_latency_ms: float = 0.0, chunk_chars: int = 8) -> FastAPI:
+    """
+    vLLM OpenAI 兼容接口。文本请求复用 api_stubs 的模拟回复 (规划/布局/尺寸估算等)，
+    带图像的请求按 qa_failure_rate 返回QA结论JSON。服务时间对应首个token的延迟。
+    """
+    import api_stubs
+    api_stubs.configure_stubs(time_scale=0)
+    rng = random.Random()
+
+    app = FastAPI(title=f"Mock vLLM ({model_name})")
+    _add_common_routes(app, backend)
+
+    def qa_verdict() -> Dict[str, Any]:
+        if rng.random() < qa_failure_rate:
+            return {"pass": False, "failed_criteria": [4], "reason": "图像存在明显的投射阴影，不符合3D建模要求。"}
+        return {"pass": True, "failed_criteria": [], "reason": "所有标准均已满足。"}
+
+    def reply_for(prompt: str, num_media: int) -> str:
+        if num_media:
+            # 批量QA (utils.vlm_utils.acall_vlm_batch_api)：每个检查项返回一个带 id 的结论
+            batch_ids = _BATCH_ITEM_ID.findall(prompt)
+            if batch_ids:
+                return json.dumps([{"id": item_id, **qa_verdict()} for item_id in batch_ids], ensure_ascii=False, indent=2)
+            return json.dumps(qa_verdict(), ensure_ascii=False, indent=2)
+        return api_stubs.call_llm_api(prompt)
+
+    def service_scale(prompt: str) -> float:
+        items = len(_BATCH_ITEM_ID.findall(prompt))
+        return 1 + api_stubs.BATCH_ITEM_LATENCY_FACTOR * (items - 1) if items > 1 else 1.0
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": model_name, "object": "model", "owned_by": "mock"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: Dict[str, Any]):
+        prompt, num_media = _split_message(body.get("messages", []))
+        model = body.get("model", model_name)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        usage = {"prompt_tokens": len(prompt) // 4 + num_media * 256}
+
+        if not body.get("stream"):
+            await backend.serve(service_scale(prompt))
+            content = reply_for(prompt, num_media)
+            usage["completion_tokens"] = len(content) // 4
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def event_stream():
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+                payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                           "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+            # 整个流式输出期间占用槽位，对应 vLLM 中一个正在解码的序列
+            async with backend.gpu_slot():
+                await asyncio.sleep(backend.sample_service_time(service_scale(prompt)))
+                content = reply_for(prompt, num_media)
+                yield chunk({"role": "assistant", "content": ""})
+                for i in range(0, len(content), chunk_chars):
+                    if token_latency_ms:
+                        await asyncio.sleep(token_latency_ms * backend.time_scale / 1000)
+                    yield chunk({"content": content[i:i + chunk_chars]})
+                yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+
+# ----------------- 启动 -----------------
+def create_app(name: str, args: argparse.Namespace) -> FastAPI:
+    defaults = _server_defaults(name)
+    backend = SimulatedBackend(
+        name=name,
+        service_time=args.service_time if args.service_time is not None else defaults["service_time"],
+        gpu_slots=args.gpu_slots if args.gpu_slots is not None else defaults["gpu_slots"],
+        distribution=args.distribution,
+        jitter=args.jitter,
+        time_scale=args.time_scale,
+        max_queue=args.max_queue,
+        seed=args.seed,
+    )
+    if name == "image":
+        return create_image_app(backend)
+    if name == "edit":
+        return create_edit_app(backend)
+    if name == "3d":
+        return create_3d_app(backend, num_gaussians=args.gaussians)
+    model_name = "Qwen3-VL-32B-Thinking" if name == "vl" else "Qwen3-Next-80B-A3B-Thinking-FP8"
+    return create_chat_app(backend, model_name, qa_failure_rate=args.qa_failure_rate,
+                           token_latency_ms=args.token_latency_ms, chunk_chars=args.chunk_chars)
+
+
+async def serve_all(names: List[str], args: argparse.Namespace):
+    """在同一个事件循环中启动多个模拟服务，各自监听自己的端口。"""
+    import uvicorn
+
+    servers = []
+    for name in names:
+        port = args.port if args.port and len(names) == 1 else SERVER_DEFAULTS[name]["port"]
+        config = uvicorn.Config(create_app(name, args), host=args.host, port=port, log_level=args.log_level)
+        servers.append(uvicorn.Server(config))
+        print(f"🧪 模拟服务 '{name}' 监听 http://{args.host}:{port}")
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟模型服务 (压测用)")
+    parser.add_argument("server", choices=["all"] + list(SERVER_DEFAULTS), help="要启动的模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="仅启动单个服务时覆盖默认端口")
+    parser.add_argument("--service-time", type=float, default=None, help="平均服务时间 (秒)，默认按服务类型")
+    parser.add_argument("--gpu-slots", type=int, default=None, help="模拟GPU槽位数，默认按服务类型")
+    parser.add_argument("--distribution", choices=("fixed", "uniform", "exponential", "lognormal"), default="fixed")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform: ±比例；lognormal: 对数标准差")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="所有服务时间统一乘以该系数")
+    parser.add_argument("--max-queue", type=int, default=int(os.environ.get("TASK_QUEUE_SIZE", 100)),
+                        help="排队请求上限，超过时返回 503")
+    parser.add_argument("--seed", type=int, default=None, help="服务时间采样的随机种子")
+    parser.add_argument("--gaussians", type=int, default=20000, help="3D服务返回的PLY中的高斯数量")
+    parser.add_argument("--qa-failure-rate", type=float, default=0.0, help="带图像的对话请求返回QA不通过的概率")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="SSE 流式输出中每个分块的间隔")
+    parser.add_argument("--chunk-chars", type=int, default=8, help="SSE 流式输出每个分块的字符数")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    names = list(SERVER_DEFAULTS) if args.server == "all" else [args.server]
+    asyncio.run(serve_all(names, args))
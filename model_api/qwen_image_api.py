@@ -9,8 +9,9 @@ import atexit
 import signal
 from io import BytesIO
 import base64
+from typing import List, Optional
 from pydantic import BaseModel
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from PIL import Image
 
 import torch
@@ -27,6 +28,8 @@ MAX_SEED = np.iinfo(np.int32).max
 NUM_GPUS_TO_USE = int(os.environ.get("NUM_GPUS_TO_USE", 1))#torch.cuda.device_count()
 TASK_QUEUE_SIZE = int(os.environ.get("TASK_QUEUE_SIZE", 100))
 TASK_TIMEOUT = int(os.environ.get("TASK_TIMEOUT", 300))
+# 单次请求最多生成的图像数 (同一批次在一次扩散调用中完成，受显存限制)
+MAX_IMAGES_PER_REQUEST = int(os.environ.get("MAX_IMAGES_PER_REQUEST", 8))
 
 print(f"Config: Using {NUM_GPUS_TO_USE} GPUs, queue size {TASK_QUEUE_SIZE}, timeout {TASK_TIMEOUT} seconds")
 
@@ -56,18 +59,20 @@ class GPUWorker:
     def process_task(self, task):
         try:
             task_id = task['task_id']
-            generator = torch.Generator(device=self.device).manual_seed(task['seed'])
+            # 每张图像一个独立种子的 generator，整批在一次扩散调用中完成，文本只编码一次
+            generators = [torch.Generator(device=self.device).manual_seed(seed) for seed in task['seeds']]
             with torch.cuda.device(self.gpu_id):
-                image = self.pipe(
+                images = self.pipe(
                     prompt=task['prompt'],
                     negative_prompt=task['negative_prompt'],
                     true_cfg_scale=task['guidance_scale'],
                     num_inference_steps=task['num_inference_steps'],
                     width=task['width'],
                     height=task['height'],
-                    generator=generator
-                ).images[0]
-            return {'task_id': task_id, 'image': image, 'success': True, 'gpu_id': self.gpu_id}
+                    num_images_per_prompt=len(generators),
+                    generator=generators
+                ).images
+            return {'task_id': task_id, 'images': images, 'success': True, 'gpu_id': self.gpu_id}
         except Exception as e:
             return {'task_id': task_id, 'success': False, 'error': str(e), 'gpu_id': self.gpu_id}
 
@@ -125,13 +130,13 @@ class MultiGPUManager:
             except queue.Empty:
                 continue
 
-    def submit_task(self, prompt, negative_prompt="", seed=42, width=1664, height=928,
+    def submit_task(self, prompt, negative_prompt="", seeds=(42,), width=1664, height=928,
                     guidance_scale=4, num_inference_steps=50, timeout=300):
         task_id = f"task_{self.task_counter}_{time.time()}"
         self.task_counter += 1
         task = {
             'task_id': task_id, 'prompt': prompt, 'negative_prompt': negative_prompt,
-            'seed': seed, 'width': width, 'height': height,
+            'seeds': list(seeds), 'width': width, 'height': height,
             'guidance_scale': guidance_scale, 'num_inference_steps': num_inference_steps
         }
         result_event = threading.Event()
@@ -177,18 +182,29 @@ def get_image_size(aspect_ratio):
     elif aspect_ratio == "3:4": return 1140, 1472
     return 1328, 1328
 
+def resolve_seeds(seed=42, randomize_seed=False, num_images=1, seeds=None):
+    """
+    确定一次请求中每张图像的种子：显式给出 seeds 时按其生成 len(seeds) 张；
+    否则生成 num_images 张，种子为 seed, seed+1, ... (randomize_seed 时各自随机)。
+    """
+    if seeds:
+        return list(seeds)
+    if randomize_seed:
+        return [random.randint(0, MAX_SEED) for _ in range(num_images)]
+    return [(seed + i) % (MAX_SEED + 1) for i in range(num_images)]
+
 def infer(prompt, negative_prompt="", seed=42, randomize_seed=False,
-          aspect_ratio="16:9", guidance_scale=5, num_inference_steps=50):
+          aspect_ratio="16:9", guidance_scale=5, num_inference_steps=50, num_images=1, seeds=None):
+    """生成一批图像 (一个队列任务、一次扩散调用)，返回 (图像列表, 种子列表)，失败时图像列表为 None。"""
     global gpu_manager
     if gpu_manager is None:
         initialize_gpu_manager()
-    if randomize_seed:
-        seed = random.randint(0, MAX_SEED)
+    seeds = resolve_seeds(seed, randomize_seed, num_images, seeds)
     width, height = get_image_size(aspect_ratio)
     # prompt = rewrite(prompt)
-    result = gpu_manager.submit_task(prompt, negative_prompt, seed, width, height,
+    result = gpu_manager.submit_task(prompt, negative_prompt, seeds, width, height,
                                      guidance_scale, num_inference_steps, timeout=TASK_TIMEOUT)
-    return result['image'], seed if result['success'] else (None, seed)
+    return (result['images'] if result['success'] else None), seeds
 
 # ----------------- FastAPI -----------------
 app = FastAPI()
@@ -201,17 +217,28 @@ class InferenceRequest(BaseModel):
     aspect_ratio: str = "16:9"
     guidance_scale: float = 5.0
     num_inference_steps: int = 50
+    # 一次请求生成多张候选：num_images 张 (种子从 seed 递增)，或按 seeds 逐一指定
+    num_images: int = 1
+    seeds: Optional[List[int]] = None
+
+def _encode_png(image):
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
 
 @app.post("/generate")
 def generate_image(req: InferenceRequest):
-    image, seed = infer(req.prompt, req.negative_prompt, req.seed, req.randomize_seed,
-                        req.aspect_ratio, req.guidance_scale, req.num_inference_steps)
-    if image is None:
+    count = len(req.seeds) if req.seeds else req.num_images
+    if not 1 <= count <= MAX_IMAGES_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"num_images must be between 1 and {MAX_IMAGES_PER_REQUEST}")
+    images, seeds = infer(req.prompt, req.negative_prompt, req.seed, req.randomize_seed,
+                          req.aspect_ratio, req.guidance_scale, req.num_inference_steps, req.num_images, req.seeds)
+    if images is None:
         return {"success": False, "error": "Generation failed"}
-    buffer = BytesIO()
-    image.save(buffer, format="PNG")
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    return {"success": True, "seed": seed, "image_base64": img_str}
+    images_base64 = [_encode_png(image) for image in images]
+    # seed / image_base64 保留第一张，兼容只取单张图像的客户端
+    return {"success": True, "seed": seeds[0], "image_base64": images_base64[0],
+            "seeds": seeds, "images_base64": images_base64}
 
 # ----------------- 退出清理 -----------------
 def cleanup():
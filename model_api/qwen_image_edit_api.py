@@ -61,8 +61,8 @@ async def edit_image(
             img = Image.open(BytesIO(img_bytes)).convert("RGB")
             input_images.append(img)
         
-        if len(input_images) < 2:
-            raise HTTPException(status_code=400, detail="At least 2 images are required")
+        if not input_images:
+            raise HTTPException(status_code=400, detail="At least 1 image is required")
 
         # 准备输入参数（使用 request_obj）
         inputs = {
@@ -0,0 +1,105 @@
+"""
+AssetCache 的内容寻址、读写、LRU 淘汰与多进程共用索引测试。
+运行: python -m pytest -q tests  或  python -m unittest tests.test_asset_cache
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.asset_cache import AssetCache, asset_cache_key
+
+PARAMS = {"image_model": "Qwen-Image", "image_seed": 1}
+
+
+def task(description: str, asset_id: str = "A") -> dict:
+    return {"asset_id": asset_id, "description": description, "style": ["Art Deco"], "type": "building"}
+
+
+class AssetCacheKeyTest(unittest.TestCase):
+    def test_key_ignores_asset_id_whitespace_and_style_order(self):
+        a = {"asset_id": "A", "description": "a  red\nbank", "style": ["B", "a"], "type": "Building"}
+        b = {"asset_id": "B", "description": "a red bank", "style": ["a", "b "], "type": "building"}
+        self.assertEqual(asset_cache_key(a, PARAMS), asset_cache_key(b, PARAMS))
+
+    def test_key_depends_on_generation_params(self):
+        self.assertNotEqual(asset_cache_key(task("bank"), PARAMS),
+                            asset_cache_key(task("bank"), {**PARAMS, "image_seed": 2}))
+
+
+class AssetCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "cache")
+        self.image = os.path.join(self.tmp_dir, "concept.png")
+        with open(self.image, "wb") as f:
+            f.write(b"p" * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def asset(self) -> dict:
+        return {"source_image_path": self.image, "qa_2d": {"pass": True}}
+
+    def test_put_then_get_returns_cached_copy(self):
+        cache = AssetCache(self.root)
+        key = cache.put(task("bank"), PARAMS, self.asset())
+        package = cache.get(task("bank", asset_id="OTHER"), PARAMS)
+        self.assertEqual(package["cache_key"], key)
+        self.assertEqual(package["asset_id"], "OTHER")
+        self.assertEqual(package["qa_2d"], {"pass": True})
+        self.assertTrue(package["source_image_path"].startswith(os.path.join(self.root, "entries", key)))
+        with open(package["source_image_path"], "rb") as f:
+            self.assertEqual(f.read(), b"p" * 100)
+        self.assertEqual((cache.stats["hits"], cache.stats["misses"]), (1, 0))
+
+    def test_miss_and_corrupt_entry(self):
+        cache = AssetCache(self.root)
+        self.assertIsNone(cache.get(task("bank"), PARAMS))
+        key = cache.put(task("bank"), PARAMS, self.asset())
+        with open(os.path.join(self.root, "entries", key, "entry.json"), "w", encoding="utf-8") as f:
+            f.write("{broken")
+        self.assertIsNone(cache.get(task("bank"), PARAMS))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "entries", key)))
+        self.assertEqual(cache.stats["misses"], 2)
+
+    def test_evicts_least_recently_used(self):
+        cache = AssetCache(self.root)
+        first = cache.put(task("one"), PARAMS, self.asset())
+        entry_size = cache.total_bytes()
+        cache = AssetCache(self.root, max_bytes=int(entry_size * 2.5))
+        second = cache.put(task("two"), PARAMS, self.asset())
+        # 访问 first 之后 second 成为最久未使用的条目
+        self.assertIsNotNone(cache.get(task("one"), PARAMS))
+        third = cache.put(task("three"), PARAMS, self.asset())
+
+        self.assertEqual(cache.stats["evictions"], 1)
+        self.assertTrue(os.path.isdir(os.path.join(self.root, "entries", first)))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "entries", second)))
+        self.assertTrue(os.path.isdir(os.path.join(self.root, "entries", third)))
+        self.assertLessEqual(cache.total_bytes(), cache.max_bytes)
+
+    def test_instances_sharing_a_directory_keep_each_others_entries(self):
+        first, second = AssetCache(self.root), AssetCache(self.root)
+        first.put(task("one"), PARAMS, self.asset())
+        second.put(task("two"), PARAMS, self.asset())
+
+        with open(os.path.join(self.root, "index.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)), 2)
+        self.assertIsNotNone(second.get(task("one"), PARAMS))
+        self.assertIsNotNone(first.get(task("two"), PARAMS))
+
+    def test_unindexed_entries_are_recovered(self):
+        cache = AssetCache(self.root)
+        cache.put(task("one"), PARAMS, self.asset())
+        size = cache.total_bytes()
+        with open(os.path.join(self.root, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({}, f)
+        recovered = AssetCache(self.root)
+        self.assertEqual(recovered.total_bytes(), size)
+        self.assertIsNotNone(recovered.get(task("one"), PARAMS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+RunCheckpoint 的运行目录、运行标识、资产固定与最终结果 (含多视角快照) 测试。
+运行: python -m pytest -q tests  或  python -m unittest tests.test_checkpoint
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.checkpoint import RunCheckpoint
+
+
+def _write(path: str, content: bytes = b"data") -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+class RunCheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.runs_dir = os.path.join(self.tmp_dir, "runs")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_create_in_same_second_uses_distinct_directories(self):
+        first, second = RunCheckpoint.create(self.runs_dir), RunCheckpoint.create(self.runs_dir)
+        self.assertNotEqual(first.run_dir, second.run_dir)
+        self.assertEqual(RunCheckpoint.create(self.runs_dir, "named").run_dir, os.path.join(self.runs_dir, "named"))
+
+    def test_run_id_is_stable_until_renewed(self):
+        checkpoint = RunCheckpoint.create(self.runs_dir)
+        run_id = checkpoint.run_id
+        self.assertEqual(RunCheckpoint(checkpoint.run_dir).run_id, run_id)
+        checkpoint.renew_run_id()
+        self.assertNotEqual(checkpoint.run_id, run_id)
+        self.assertEqual(RunCheckpoint(checkpoint.run_dir).run_id, checkpoint.run_id)
+
+    def test_plan_and_scene_state_round_trip(self):
+        checkpoint = RunCheckpoint.create(self.runs_dir)
+        checkpoint.save_plan({"profile": "x"}, [{"asset_id": "A"}])
+        checkpoint.save_scene_state({"placed_assets": [{"instance_id": "A_1"}]}, ["A_2"])
+        reopened = RunCheckpoint(checkpoint.run_dir)
+        self.assertEqual(reopened.load_plan(), ({"profile": "x"}, [{"asset_id": "A"}]))
+        self.assertEqual(reopened.load_scene_state(),
+                         {"placed_assets": [{"instance_id": "A_1"}], "skipped_instances": ["A_2"]})
+        self.assertEqual(reopened.meta["stage"], "planned")
+
+    def test_save_asset_copies_referenced_files(self):
+        checkpoint = RunCheckpoint.create(self.runs_dir)
+        source = _write(os.path.join(self.tmp_dir, "work", "concept.png"), b"png")
+        pinned = checkpoint.save_asset("A", {"source_image_path": source, "qa": {"pass": True}})
+        os.remove(source)
+        loaded = RunCheckpoint(checkpoint.run_dir).load_assets()["A"]
+        self.assertEqual(loaded, pinned)
+        with open(loaded["source_image_path"], "rb") as f:
+            self.assertEqual(f.read(), b"png")
+
+    def test_save_final_copies_every_snapshot_view(self):
+        checkpoint = RunCheckpoint.create(self.runs_dir)
+        work = os.path.join(self.tmp_dir, "work")
+        views = {view: _write(os.path.join(work, f"snapshot_final_{view}.png"), view.encode())
+                 for view in ("front", "top")}
+        final = checkpoint.save_final({
+            "final_scene_ply": _write(os.path.join(work, "scene_final.ply")),
+            "final_snapshot_path": views,
+            "placed_assets_info": [],
+        })
+        shutil.rmtree(work)
+
+        self.assertEqual(final["final_scene_ply"], os.path.join(checkpoint.scene_dir, "final.ply"))
+        self.assertEqual(set(final["final_snapshot_path"]), {"front", "top"})
+        for view, path in final["final_snapshot_path"].items():
+            self.assertEqual(os.path.basename(path), f"final_snapshot_{view}.png")
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), view.encode())
+        with open(os.path.join(checkpoint.run_dir, "final.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), final)
+        self.assertEqual(checkpoint.meta["stage"], "completed")
+
+    def test_save_final_without_result_marks_failed(self):
+        checkpoint = RunCheckpoint.create(self.runs_dir)
+        self.assertIsNone(checkpoint.save_final(None))
+        self.assertEqual(checkpoint.meta["stage"], "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
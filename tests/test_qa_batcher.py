@@ -0,0 +1,77 @@
+"""
+批量QA回复解析与 QABatcher 取消逻辑的测试。模型调用均为本地函数，不访问任何服务。
+运行: python -m pytest -q tests  或  python -m unittest tests.test_qa_batcher
+"""
+import json
+import threading
+import unittest
+from contextlib import contextmanager
+
+from utils.qa_batcher import QABatcher, parse_batch_verdicts
+
+
+class _Span:
+    def set(self, *args):
+        pass
+
+
+class ParseBatchVerdictsTest(unittest.TestCase):
+    def test_verdicts_are_keyed_by_id(self):
+        response = json.dumps([{"id": "2", "pass": False}, {"id": "1", "pass": True}])
+        self.assertEqual(parse_batch_verdicts(response, ["1", "2"]), {"1": {"pass": True}, "2": {"pass": False}})
+
+    def test_fenced_json_with_surrounding_text(self):
+        response = '结论如下:\n```json\n[{"id": "a", "pass": true, "score": 8}]\n```\n以上。'
+        self.assertEqual(parse_batch_verdicts(response, ["a"]), {"a": {"pass": True, "score": 8}})
+
+    def test_missing_ids_fall_back_to_array_order(self):
+        response = json.dumps([{"pass": True}, {"pass": False}])
+        self.assertEqual(parse_batch_verdicts(response, ["x", "y"]), {"x": {"pass": True}, "y": {"pass": False}})
+
+    def test_unknown_ids_and_non_objects_are_dropped(self):
+        response = json.dumps([{"id": "zzz", "pass": True}, "oops", {"id": "1", "pass": True}])
+        self.assertEqual(parse_batch_verdicts(response, ["1"]), {"1": {"pass": True}})
+
+    def test_unparseable_responses_yield_nothing(self):
+        for response in (None, "", "no json here", "[{broken", '{"id": "1", "pass": true}'):
+            self.assertEqual(parse_batch_verdicts(response, ["1"]), {}, response)
+
+
+class QABatcherCancelTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.on_slot = None
+
+        @contextmanager
+        def slot(kind, items):
+            if self.on_slot:
+                self.on_slot()
+            yield _Span()
+
+        def single(media, prompt):
+            self.calls.append(media)
+            return json.dumps({"pass": True})
+
+        self.batcher = QABatcher(single, lambda instruction, items: "[]", slot, max_items=1)
+
+    def test_single_check_returns_model_verdict(self):
+        self.assertEqual(json.loads(self.batcher.check("2d", "inst", "item", "a.png", "full")), {"pass": True})
+        self.assertEqual(self.calls, ["a.png"])
+
+    def test_cancelled_before_send_is_not_checked(self):
+        cancel = threading.Event()
+        cancel.set()
+        self.assertIsNone(self.batcher.check("2d", "inst", "item", "a.png", "full", cancel))
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.batcher.stats["cancelled"], 1)
+
+    def test_cancelled_while_waiting_for_slot_is_not_checked(self):
+        cancel = threading.Event()
+        self.on_slot = cancel.set
+        self.assertIsNone(self.batcher.check("2d", "inst", "item", "a.png", "full", cancel))
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.batcher.stats["requests"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+RetryPolicy 的预算计算、失败后的补救决定与统计持久化测试。
+运行: python -m pytest -q tests  或  python -m unittest tests.test_retry_policy
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.retry_policy import (
+    CRITERIA_HINTS_2D, MAX_SAME_CRITERIA_FAILURES, MIN_SAMPLES_TO_GIVE_UP, REMEDIATION_GIVE_UP,
+    REMEDIATION_NEW_SEED, REMEDIATION_PROMPT_TWEAK, STAGE_PROFILES, RetryPolicy,
+)
+
+
+class RetryBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy()
+
+    def test_unknown_rate_uses_stage_maximum(self):
+        # 无统计时通过率为 0.5，达到 95% 需要 5 次，被限制在阶段上限内
+        for stage, profile in STAGE_PROFILES.items():
+            self.assertEqual(self.policy.budget(stage, "building"), min(5, int(profile["max_attempts"])), stage)
+
+    def test_cap_tightens_budget(self):
+        self.assertEqual(self.policy.budget("2d", "building", cap=2), 2)
+        self.assertEqual(self.policy.budget("2d", "building", cap=0), 1)
+
+    def test_high_pass_rate_shrinks_budget_to_minimum(self):
+        for _ in range(50):
+            self.policy.record("2d", "prop", True)
+        self.assertEqual(self.policy.budget("2d", "prop"), int(STAGE_PROFILES["2d"]["min_attempts"]))
+
+    def test_hopeless_combination_gets_one_attempt(self):
+        for _ in range(MIN_SAMPLES_TO_GIVE_UP - 1):
+            self.policy.record("3d", "vehicle", False)
+        self.assertGreater(self.policy.budget("3d", "vehicle"), 1)
+        self.policy.record("3d", "vehicle", False)
+        self.assertEqual(self.policy.budget("3d", "vehicle"), 1)
+
+    def test_asset_type_is_normalized(self):
+        self.policy.record("2d", " Building ", True)
+        self.assertEqual(self.policy.report()["2d/building"]["passes"], 1)
+
+
+class RetryDecisionTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy()
+
+    def test_budget_exhausted_gives_up(self):
+        decision = self.policy.on_failure("2d", "building", 3, 3, {"pass": False}, [])
+        self.assertFalse(decision.retry)
+        self.assertEqual(decision.remediation, REMEDIATION_GIVE_UP)
+
+    def test_invalid_output_backs_off_exponentially(self):
+        base = STAGE_PROFILES["3d"]["error_backoff"]
+        first = self.policy.on_failure("3d", "building", 1, 3, None, [])
+        second = self.policy.on_failure("3d", "building", 2, 3, None, [None])
+        self.assertTrue(first.retry)
+        self.assertEqual(first.remediation, REMEDIATION_NEW_SEED)
+        self.assertEqual((first.delay, second.delay), (base, base * 2))
+
+    def test_failed_criteria_tweak_prompt_without_delay(self):
+        decision = self.policy.on_failure("2d", "building", 1, 4, {"pass": False, "failed_criteria": [4, 4]}, [])
+        self.assertEqual(decision.remediation, REMEDIATION_PROMPT_TWEAK)
+        self.assertEqual(decision.hints, [CRITERIA_HINTS_2D[4]])
+        self.assertEqual(decision.delay, 0)
+
+    def test_repeated_criteria_give_up_early(self):
+        qa = {"pass": False, "failed_criteria": [3]}
+        history = [dict(qa) for _ in range(MAX_SAME_CRITERIA_FAILURES - 1)]
+        decision = self.policy.on_failure("2d", "building", MAX_SAME_CRITERIA_FAILURES, 10, qa, history)
+        self.assertFalse(decision.retry)
+        self.assertEqual(decision.remediation, REMEDIATION_GIVE_UP)
+
+    def test_placement_reason_becomes_hint(self):
+        decision = self.policy.on_failure("placement", "prop", 1, 4, {"pass": False, "reason": "悬浮"}, [])
+        self.assertEqual(decision.remediation, REMEDIATION_PROMPT_TWEAK)
+        self.assertIn("悬浮", decision.hints[0])
+
+    def test_plain_failure_uses_new_seed(self):
+        decision = self.policy.on_failure("3d", "building", 1, 3, {"pass": False, "reason": "破面"}, [])
+        self.assertTrue(decision.retry)
+        self.assertEqual(decision.remediation, REMEDIATION_NEW_SEED)
+
+
+class RetryStatsPersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.stats_path = os.path.join(self.tmp_dir, "stats", "retry_stats.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_stats_survive_reload(self):
+        RetryPolicy(self.stats_path).record("2d", "building", False, [1, 4])
+        entry = RetryPolicy(self.stats_path).report()["2d/building"]
+        self.assertEqual(entry, {"attempts": 1, "passes": 0, "failed_criteria": {"1": 1, "4": 1}})
+
+    def test_concurrent_writers_do_not_lose_counts(self):
+        first, second = RetryPolicy(self.stats_path), RetryPolicy(self.stats_path)
+        first.record("2d", "building", True)
+        second.record("2d", "building", False)
+        first.record("3d", "building", True)
+        with open(self.stats_path, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+        self.assertEqual(stats["2d/building"]["attempts"], 2)
+        self.assertEqual(stats["2d/building"]["passes"], 1)
+        self.assertEqual(stats["3d/building"]["attempts"], 1)
+
+    def test_corrupt_file_starts_empty(self):
+        os.makedirs(os.path.dirname(self.stats_path))
+        with open(self.stats_path, "w", encoding="utf-8") as f:
+            f.write("{not json")
+        policy = RetryPolicy(self.stats_path)
+        self.assertEqual(policy.report(), {})
+        policy.record("2d", "building", True)
+        self.assertEqual(RetryPolicy(self.stats_path).report()["2d/building"]["attempts"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
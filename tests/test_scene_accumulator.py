@@ -0,0 +1,114 @@
+"""
+SceneAccumulator 的暂存 / 确认 / 回滚、扩容与写盘测试，以及 transform_vertices 的变换顺序。
+运行: python -m pytest -q tests  或  python -m unittest tests.test_scene_accumulator
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from plyfile import PlyData
+
+from utils.scene_accumulator import SceneAccumulator, transform_vertices, write_vertices_ply
+
+GAUSSIAN_DTYPE = np.dtype([(name, "<f4") for name in ("x", "y", "z", "opacity", "scale_0", "scale_1", "scale_2")])
+
+
+def make_asset(path: str, count: int, offset: float = 0.0) -> str:
+    vertices = np.zeros(count, dtype=GAUSSIAN_DTYPE)
+    vertices["x"] = np.arange(count, dtype="<f4") + offset
+    vertices["opacity"] = 1.0
+    write_vertices_ply(vertices, path)
+    return path
+
+
+class TransformVerticesTest(unittest.TestCase):
+    def test_scale_then_rotate_then_translate(self):
+        vertices = np.zeros(1, dtype=GAUSSIAN_DTYPE)
+        vertices["x"], vertices["opacity"] = 1.0, 0.5
+        out = transform_vertices(vertices, {"x": 10, "y": 0, "z": 0}, {"z": 90}, {"x": 2})
+        self.assertAlmostEqual(float(out["x"][0]), 10.0, places=5)
+        self.assertAlmostEqual(float(out["y"][0]), 2.0, places=5)
+        self.assertEqual(float(out["opacity"][0]), 0.5)
+
+    def test_missing_attribute_raises(self):
+        vertices = np.zeros(1, dtype=[("x", "<f4"), ("y", "<f4"), ("z", "<f4")])
+        with self.assertRaises(ValueError):
+            transform_vertices(vertices, {}, {}, out=np.zeros(1, dtype=GAUSSIAN_DTYPE))
+
+
+class SceneAccumulatorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.asset = make_asset(os.path.join(self.tmp_dir, "asset.ply"), 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_add_is_pending_until_commit(self):
+        scene = SceneAccumulator(initial_capacity=4)
+        self.assertEqual(scene.add(self.asset, {"x": 100}, {}), (0, 5))
+        self.assertEqual((len(scene), scene.committed_count, scene.pending_count), (5, 0, 5))
+        np.testing.assert_allclose(scene.vertices["x"], np.arange(5) + 100)
+        scene.commit()
+        self.assertEqual((scene.committed_count, scene.pending_count), (5, 0))
+
+    def test_rollback_discards_only_pending(self):
+        scene = SceneAccumulator(initial_capacity=4)
+        scene.add(self.asset, {}, {})
+        scene.commit()
+        scene.add(self.asset, {"x": 50}, {})
+        scene.rollback()
+        self.assertEqual(len(scene), 5)
+        np.testing.assert_allclose(scene.vertices["x"], np.arange(5))
+        # commit 之后 rollback 不产生效果
+        scene.rollback()
+        self.assertEqual(len(scene), 5)
+
+    def test_capacity_grows_and_keeps_data(self):
+        scene = SceneAccumulator(initial_capacity=4)
+        for i in range(10):
+            scene.add(self.asset, {"x": 10 * i}, {})
+        scene.commit()
+        self.assertEqual(len(scene), 50)
+        self.assertGreaterEqual(scene.capacity, 50)
+        np.testing.assert_allclose(scene.vertices["x"][45:], np.arange(5) + 90)
+
+    def test_vertices_view_is_read_only(self):
+        scene = SceneAccumulator()
+        scene.add(self.asset, {}, {})
+        with self.assertRaises(ValueError):
+            scene.vertices["x"][0] = 1.0
+
+    def test_flush_writes_committed_only_and_skips_unchanged(self):
+        scene = SceneAccumulator()
+        path = os.path.join(self.tmp_dir, "scene.ply")
+        self.assertIsNone(scene.flush(path))
+        scene.add(self.asset, {}, {})
+        scene.commit()
+        scene.add(self.asset, {"x": 7}, {})
+        self.assertEqual(scene.flush(path), path)
+        self.assertEqual(len(PlyData.read(path)["vertex"].data), 5)
+
+        mtime = os.stat(path).st_mtime_ns
+        scene.rollback()
+        scene.flush(path)
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+
+    def test_from_ply_round_trip(self):
+        scene = SceneAccumulator()
+        scene.add(self.asset, {"y": 3}, {})
+        scene.commit()
+        path = scene.flush(os.path.join(self.tmp_dir, "scene.ply"))
+        restored = SceneAccumulator.from_ply(path)
+        self.assertEqual(restored.committed_count, 5)
+        np.testing.assert_allclose(restored.vertices["y"], 3)
+
+    def test_missing_asset_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            SceneAccumulator().add(os.path.join(self.tmp_dir, "missing.ply"), {}, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
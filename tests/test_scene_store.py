@@ -0,0 +1,110 @@
+"""
+SceneStore 的清单记录、重新打开、资产固定与导出测试。
+运行: python -m pytest -q tests  或  python -m unittest tests.test_scene_store
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from plyfile import PlyData
+
+from utils.scene_accumulator import write_vertices_ply
+from utils.scene_store import MANIFEST_NAME, SceneStore
+
+GAUSSIAN_DTYPE = np.dtype([(name, "<f4") for name in ("x", "y", "z", "opacity")])
+
+
+def make_asset(path: str, count: int, value: float = 0.0) -> str:
+    vertices = np.zeros(count, dtype=GAUSSIAN_DTYPE)
+    vertices["opacity"] = value
+    write_vertices_ply(vertices, path)
+    return path
+
+
+class SceneStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "store")
+        self.house = make_asset(os.path.join(self.tmp_dir, "house.ply"), 3, 1.0)
+        self.tree = make_asset(os.path.join(self.tmp_dir, "tree.ply"), 2, 2.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_place_move_remove_survive_reopen(self):
+        store = SceneStore(self.root)
+        store.place("house_1", "house", self.house, {"x": 1}, {})
+        store.place("house_2", "house", self.house, {"x": 2}, {})
+        store.place("tree_1", "tree", self.tree, {"x": 3}, {})
+        store.move("house_2", position={"x": 20})
+        store.remove("tree_1")
+
+        reopened = SceneStore(self.root)
+        self.assertEqual([entry["instance_id"] for entry in reopened.entries()], ["house_1", "house_2"])
+        self.assertEqual(reopened.entries()[1]["position"], {"x": 20})
+        self.assertNotIn("tree_1", reopened)
+
+    def test_unknown_instance_raises(self):
+        store = SceneStore(self.root)
+        with self.assertRaises(KeyError):
+            store.move("missing", position={"x": 1})
+        with self.assertRaises(KeyError):
+            store.remove("missing")
+        with self.assertRaises(FileNotFoundError):
+            store.place("a", "a", os.path.join(self.tmp_dir, "missing.ply"), {}, {})
+
+    def test_instances_of_one_asset_share_one_pinned_file(self):
+        store = SceneStore(self.root)
+        store.place("house_1", "house", self.house, {}, {})
+        store.place("house_2", "house", self.house, {}, {})
+        self.assertEqual(len(os.listdir(store.assets_dir)), 1)
+
+    def test_regenerated_asset_content_is_pinned_separately(self):
+        store = SceneStore(self.root)
+        store.place("house_1", "house", self.house, {}, {})
+        make_asset(self.house, 4, 5.0)
+        store.place("house_2", "house", self.house, {}, {})
+        first, second = store.entries()
+        self.assertNotEqual(first["asset_ply"], second["asset_ply"])
+        self.assertEqual(len(PlyData.read(first["asset_ply"])["vertex"].data), 3)
+        self.assertEqual(len(PlyData.read(second["asset_ply"])["vertex"].data), 4)
+
+    def test_truncated_manifest_tail_is_repaired(self):
+        store = SceneStore(self.root)
+        store.place("house_1", "house", self.house, {}, {})
+        with open(store.manifest_path, "a", encoding="utf-8") as f:
+            f.write('{"op": "place", "instance_id": "hal')
+        store = SceneStore(self.root)
+        store.place("tree_1", "tree", self.tree, {}, {})
+        with open(os.path.join(self.root, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["instance_id"] for line in lines], ["house_1", "tree_1"])
+
+    def test_export_applies_transforms(self):
+        store = SceneStore(self.root)
+        self.assertIsNone(store.export(os.path.join(self.tmp_dir, "empty.ply")))
+        store.place("house_1", "house", self.house, {"x": 1, "y": 2, "z": 3}, {})
+        store.place("tree_1", "tree", self.tree, {"x": -1}, {}, scale={"x": 2, "y": 2, "z": 2})
+
+        path = store.export(os.path.join(self.tmp_dir, "out", "scene.ply"))
+        vertices = PlyData.read(path)["vertex"].data
+        self.assertEqual(len(vertices), 5)
+        np.testing.assert_allclose(vertices["x"], [1, 1, 1, -1, -1])
+        np.testing.assert_allclose(vertices["y"], [2, 2, 2, 0, 0])
+        np.testing.assert_allclose(vertices["opacity"], [1, 1, 1, 2, 2])
+        self.assertEqual(len(store.build_scene()), 5)
+
+    def test_clear_empties_store(self):
+        store = SceneStore(self.root)
+        store.place("house_1", "house", self.house, {}, {})
+        store.clear()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(os.listdir(store.assets_dir), [])
+        self.assertEqual(len(SceneStore(self.root)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
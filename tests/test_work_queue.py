@@ -0,0 +1,145 @@
+"""
+SQLiteTaskQueue 的租约、重新投递与重试上限测试。
+
+队列只依赖 sqlite，不需要模型服务或 torch；用负的 lease_seconds 让租约立即过期，不依赖 sleep。
+运行: python -m pytest -q tests  或  python -m unittest tests.test_work_queue
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.work_queue import SQLiteTaskQueue
+
+# 负的租期让租约在租用的同一时刻就已过期，模拟 worker 崩溃或失联
+EXPIRED = -1.0
+
+
+class SQLiteTaskQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = SQLiteTaskQueue(os.path.join(self.tmp_dir, "queue.sqlite"))
+
+    def tearDown(self):
+        conn = getattr(self.queue._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_lease_returns_highest_priority_first(self):
+        self.queue.publish("low", {"n": 2}, priority=5)
+        self.queue.publish("high", {"n": 1}, priority=0)
+        task = self.queue.lease("w1")
+        self.assertEqual(task.task_id, "high")
+        self.assertEqual(task.payload, {"n": 1})
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(self.queue.lease("w2").task_id, "low")
+        self.assertIsNone(self.queue.lease("w3"))
+
+    def test_active_lease_is_not_redelivered(self):
+        self.queue.publish("t", {})
+        self.assertIsNotNone(self.queue.lease("w1", lease_seconds=60))
+        self.assertIsNone(self.queue.lease("w2"))
+        self.assertEqual(self.queue.status("t"), "leased")
+
+    def test_expired_lease_is_redelivered(self):
+        self.queue.publish("t", {"x": 1})
+        first = self.queue.lease("w1", lease_seconds=EXPIRED)
+        second = self.queue.lease("w2", lease_seconds=60)
+        self.assertEqual(second.task_id, first.task_id)
+        self.assertEqual(second.payload, {"x": 1})
+        self.assertEqual(second.attempts, 2)
+
+    def test_lost_lease_rejects_heartbeat_and_complete(self):
+        self.queue.publish("t", {})
+        self.queue.lease("w1", lease_seconds=EXPIRED)
+        self.queue.lease("w2", lease_seconds=60)
+
+        self.assertFalse(self.queue.heartbeat("t", "w1"))
+        self.assertFalse(self.queue.complete("t", "w1", {"owner": "w1"}))
+        self.assertFalse(self.queue.fail("t", "w1", "stale"))
+        self.assertEqual(self.queue.status("t"), "leased")
+
+        self.assertTrue(self.queue.heartbeat("t", "w2"))
+        self.assertTrue(self.queue.complete("t", "w2", {"owner": "w2"}))
+        self.assertEqual(self.queue.results(["t"]), {"t": ("done", {"owner": "w2"}, None)})
+
+    def test_complete_after_done_is_rejected(self):
+        self.queue.publish("t", {})
+        self.queue.lease("w1")
+        self.assertTrue(self.queue.complete("t", "w1", {"v": 1}))
+        self.assertFalse(self.queue.complete("t", "w1", {"v": 2}))
+        self.assertFalse(self.queue.heartbeat("t", "w1"))
+        self.assertEqual(self.queue.results(["t"])["t"][1], {"v": 1})
+
+    def test_fail_requeues_until_max_attempts(self):
+        self.queue.publish("t", {}, max_attempts=2)
+        self.queue.lease("w1")
+        self.assertTrue(self.queue.fail("t", "w1", "boom 1"))
+        self.assertEqual(self.queue.status("t"), "pending")
+
+        task = self.queue.lease("w2")
+        self.assertEqual(task.attempts, 2)
+        self.assertTrue(self.queue.fail("t", "w2", "boom 2"))
+        self.assertEqual(self.queue.status("t"), "failed")
+        self.assertEqual(self.queue.results(["t"]), {"t": ("failed", None, "boom 2")})
+        self.assertIsNone(self.queue.lease("w3"))
+
+    def test_fail_without_retry_is_terminal(self):
+        self.queue.publish("t", {}, max_attempts=3)
+        self.queue.lease("w1")
+        self.assertTrue(self.queue.fail("t", "w1", "failed QA", retry=False))
+        self.assertEqual(self.queue.results(["t"]), {"t": ("failed", None, "failed QA")})
+        self.assertIsNone(self.queue.lease("w2"))
+
+    def test_expired_lease_at_max_attempts_fails(self):
+        self.queue.publish("t", {}, max_attempts=2)
+        self.queue.lease("w1", lease_seconds=EXPIRED)
+        self.queue.lease("w2", lease_seconds=EXPIRED)
+
+        self.assertIsNone(self.queue.lease("w3"))
+        status, result, error = self.queue.results(["t"])["t"]
+        self.assertEqual(status, "failed")
+        self.assertIsNone(result)
+        self.assertIn("lease expired", error)
+        self.assertFalse(self.queue.complete("t", "w2", {}))
+
+    def test_publish_is_idempotent(self):
+        self.assertTrue(self.queue.publish("t", {"v": 1}, priority=3))
+        self.assertFalse(self.queue.publish("t", {"v": 2}, priority=0))
+        self.assertEqual(self.queue.counts(), {"pending": 1})
+        self.assertEqual(self.queue.lease("w1").payload, {"v": 1})
+
+        self.queue.complete("t", "w1", {})
+        self.assertFalse(self.queue.publish("t", {"v": 3}))
+        self.assertEqual(self.queue.status("t"), "done")
+
+    def test_requeue_resets_failed_task_only(self):
+        self.queue.publish("failed", {}, priority=0, max_attempts=1)
+        self.queue.publish("done", {}, priority=1)
+        self.queue.publish("leased", {}, priority=2)
+        self.queue.lease("w1")
+        self.queue.fail("failed", "w1", "boom")
+        self.queue.lease("w1")
+        self.queue.complete("done", "w1", {"ok": True})
+        self.queue.lease("w1", lease_seconds=60)
+
+        for task_id in ("failed", "done", "leased"):
+            self.queue.requeue(task_id, max_attempts=3)
+        self.assertEqual(self.queue.status("failed"), "pending")
+        self.assertEqual(self.queue.status("done"), "done")
+        self.assertEqual(self.queue.status("leased"), "leased")
+
+        task = self.queue.lease("w2")
+        self.assertEqual(task.task_id, "failed")
+        self.assertEqual(task.attempts, 1)
+        self.assertTrue(self.queue.fail("failed", "w2", "boom again"))
+        self.assertEqual(self.queue.status("failed"), "pending")
+
+    def test_status_of_unknown_task_is_none(self):
+        self.assertIsNone(self.queue.status("missing"))
+        self.assertEqual(self.queue.results(["missing"]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
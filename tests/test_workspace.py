@@ -0,0 +1,101 @@
+"""
+RunWorkspace 的登记、释放与配额回收测试。
+
+场景快照按 gs_utils.gaussian_splatting_snapshot 的返回格式 (视角名称 -> 图片路径) 登记，
+由 api_stubs 中与之同格式的模拟实现生成，不需要 torch。
+运行: python -m pytest -q tests  或  python -m unittest tests.test_workspace
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import api_stubs
+from utils.workspace import RunWorkspace
+
+
+def _write(path: str, size: int) -> str:
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+class RunWorkspaceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.workspace = RunWorkspace("test", root=self.tmp_dir, quota_bytes=250, keep=False)
+
+    def tearDown(self):
+        self.workspace.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_track_and_release_update_live_bytes(self):
+        path = self.workspace.track(_write(os.path.join(self.workspace.path, "a.bin"), 100))
+        self.assertEqual(self.workspace.live_bytes(), 100)
+        self.workspace.release(path)
+        self.assertEqual(self.workspace.live_bytes(), 0)
+        self.assertEqual(self.workspace.usage(), 100)
+        self.assertTrue(os.path.isfile(path))
+
+    def test_paths_outside_workspace_are_ignored(self):
+        outside = _write(os.path.join(self.tmp_dir, "outside.bin"), 1000)
+        self.assertEqual(self.workspace.track(outside), outside)
+        self.workspace.release(outside, None)
+        self.assertEqual(self.workspace.usage(), 0)
+        self.assertTrue(os.path.isfile(outside))
+
+    def test_quota_evicts_oldest_released_first_and_never_live(self):
+        a, b, c = (self.workspace.track(_write(os.path.join(self.workspace.path, f"{name}.bin"), 100))
+                   for name in "abc")
+        # 全部为 live 时超出配额也不回收
+        self.assertTrue(all(os.path.isfile(path) for path in (a, b, c)))
+
+        self.workspace.release(a)
+        self.assertFalse(os.path.exists(a))
+        self.workspace.release(b)
+        self.assertTrue(os.path.isfile(b))
+        self.assertTrue(os.path.isfile(c))
+        self.assertEqual(self.workspace.stats["evicted"], 1)
+
+    def test_gc_removes_all_released(self):
+        paths = [self.workspace.track(_write(os.path.join(self.workspace.path, f"{i}.bin"), 10)) for i in range(3)]
+        self.workspace.release(*paths[:2])
+        self.assertEqual(self.workspace.gc(), 20)
+        self.assertEqual([os.path.exists(path) for path in paths], [False, False, True])
+
+    def test_adopt_moves_external_file_into_category(self):
+        external = _write(os.path.join(self.tmp_dir, "gen.png"), 10)
+        adopted = self.workspace.adopt(external, "images")
+        self.assertFalse(os.path.exists(external))
+        self.assertTrue(self.workspace.contains(adopted))
+        self.assertEqual(os.path.basename(os.path.dirname(adopted)), "images")
+
+    def test_snapshot_views_are_tracked_and_released_per_file(self):
+        time_scale = api_stubs.STUB_CONFIG["time_scale"]
+        api_stubs.configure_stubs(time_scale=0)
+        try:
+            views = api_stubs.gaussian_splatting_snapshot("scene.ply", "panoramic", "unit",
+                                                          output_dir=self.workspace.subdir("scene"))
+        finally:
+            api_stubs.configure_stubs(time_scale=time_scale)
+        self.assertIsInstance(views, dict)
+        self.assertEqual(set(views), set(api_stubs.SNAPSHOT_VIEWS))
+
+        for path in views.values():
+            self.workspace.track(path)
+        self.assertEqual(self.workspace.live_bytes(), sum(os.path.getsize(path) for path in views.values()))
+        self.workspace.release(*views.values())
+        self.assertEqual(self.workspace.live_bytes(), 0)
+
+    def test_empty_scene_snapshot_has_no_views(self):
+        self.assertEqual(api_stubs.gaussian_splatting_snapshot(None, "panoramic", "empty",
+                                                               output_dir=self.workspace.subdir("scene")), {})
+
+    def test_close_removes_directory(self):
+        path = self.workspace.path
+        self.workspace.close()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,87 +1,237 @@
 # main.py (V3 - 全流程Orchestrator)
+import argparse
 import os
-import shutil
+import threading
+from typing import Any, Dict, Optional
+
 from agents.planner_agent import CityPlannerAgent
 from agents.asset_agent import AssetGenerationAgent
 from agents.assembly_agent import SceneAssemblyAgent
+from utils.asset_cache import AssetCache
+from utils.checkpoint import RunCheckpoint
+from utils.prompt_memo import PromptMemo
+from utils.retry_policy import DEFAULT_RETRY_STATS_PATH, RetryPolicy
+from utils.scheduler import AssetScheduler, AssetStream, BackendPool, building_priority
+from utils.tracing import start_tracing, stop_tracing
+from utils.work_queue import DistributedAssetScheduler, SQLiteTaskQueue
+from utils.workspace import DEFAULT_WORKSPACE_ROOT, RunWorkspace, sweep_stale_workspaces
+
+# 默认的用户输入
+DEFAULT_USER_CONCEPT = {"theme": "西方城镇风格，写实高仿真", "scale": "3个街区", "time_of_day": "白天晴天"}
 
-def main():
+
+def main(run_dir: Optional[str] = None, resume: bool = False, stream: bool = False, queue_db: Optional[str] = None,
+         user_concept: Optional[Dict[str, Any]] = None, backend_pool=None, asset_cache: Optional[AssetCache] = None,
+         workspace_root: str = DEFAULT_WORKSPACE_ROOT, trace: bool = True, retry_policy: Optional[RetryPolicy] = None,
+         prompt_memo: Optional[PromptMemo] = None) -> Optional[Dict[str, Any]]:
     """
     主流程 Orchestrator (V3)
     负责初始化Agents并按顺序驱动一个完整的、带迭代的PCG流程。
+    规划、每个资产以及每次放置完成后都会写入 run_dir 下的检查点；resume=True 时跳过已完成的工作。
+    stream=True 时资产一旦通过QA即进入组装阶段，生成与组装并行进行。
+    queue_db 不为空时，资产任务发布到该任务队列，由各节点上的 asset_worker.py 进程生成。
+
+    中间产物写入 workspace_root 下本次运行独占的工作目录，运行结束后删除；恢复所需的文件由检查点复制到 run_dir。
+    批量模式 (batch_pipeline.py) 会传入每个城市的 user_concept、共享的 backend_pool (租户视图)、asset_cache、retry_policy 与 prompt_memo、
+    批次自己的 workspace_root，并统一管理追踪 (trace=False)；共享资源的统计报告由调用方打印。
+    返回最终场景信息，失败时返回 None。
     """
-    # 初始用户输入
-    user_concept = {"theme": "西方城镇风格，写实高仿真", "scale": "3个街区", "time_of_day": "白天晴天"}
-    
+    user_concept = user_concept or DEFAULT_USER_CONCEPT
+
+    # 所有Agent共享同一组按后端划分的并发限制
+    owns_backend_pool = backend_pool is None
+    if owns_backend_pool:
+        backend_pool = BackendPool()
+    # 跨运行共享的资产缓存 (不在 tmp/ 中，不会随每次运行被清理)
+    owns_asset_cache = asset_cache is None
+    if owns_asset_cache:
+        asset_cache = AssetCache()
+    # 各资产类型的QA通过率跨运行累积，用于决定重试预算
+    owns_retry_policy = retry_policy is None
+    if owns_retry_policy:
+        retry_policy = RetryPolicy(DEFAULT_RETRY_STATS_PATH)
+    # 2D prompt 改写结果跨运行复用
+    owns_prompt_memo = prompt_memo is None
+    if owns_prompt_memo:
+        prompt_memo = PromptMemo()
+
+    checkpoint = RunCheckpoint(run_dir) if run_dir else RunCheckpoint.create()
+    if not resume:
+        checkpoint.renew_run_id()
+    print(f"💾 运行目录: {checkpoint.run_dir}" + (" (恢复模式)" if resume else ""))
+    workspace = RunWorkspace(os.path.basename(os.path.normpath(checkpoint.run_dir)), root=workspace_root)
+
     # 初始化所有Agents
-    planner = CityPlannerAgent()
-    asset_generator = AssetGenerationAgent()
-    assembler = SceneAssemblyAgent()
+    planner = CityPlannerAgent(backend_pool)
+    asset_generator = AssetGenerationAgent(backend_pool, asset_cache, retry_policy=retry_policy, workspace=workspace,
+                                           prompt_memo=prompt_memo)
+    assembler = SceneAssemblyAgent(backend_pool, workspace=workspace, retry_policy=retry_policy)
+
+    if queue_db:
+        # 以运行目录名 + 运行标识作为任务命名空间，多个运行 (包括不同批次中的同名城市) 可共用同一个队列；
+        # 恢复运行时标识不变，继续使用之前发布的任务
+        namespace = f"{os.path.basename(os.path.normpath(checkpoint.run_dir))}-{checkpoint.run_id}"
+        scheduler = DistributedAssetScheduler(SQLiteTaskQueue(queue_db), namespace, priority_fn=building_priority)
+    else:
+        scheduler = AssetScheduler(asset_generator, backend_pool)
+    # 每次运行写出一份 Chrome Trace 格式的追踪文件，可在 chrome://tracing 或 Perfetto 中查看
+    if trace:
+        start_tracing(os.path.join(checkpoint.run_dir, "trace.json"))
+    try:
+        final_scene = _run_stages(user_concept, planner, asset_generator, assembler, scheduler, checkpoint, resume, stream)
+    finally:
+        if trace:
+            stop_tracing()
+        workspace.close()
+
+    if owns_backend_pool:
+        backend_pool.print_report()
+    if owns_asset_cache:
+        asset_cache.print_report()
+    if owns_retry_policy:
+        retry_policy.print_report()
+    if owns_prompt_memo:
+        prompt_memo.print_report()
+    asset_generator.pre_qa_2d.print_report()
+    asset_generator.pre_qa_3d.print_report()
+    asset_generator.qa_batcher.print_report()
+    workspace.print_report()
+    return final_scene
+
+
+def _run_stages(user_concept, planner, asset_generator, assembler, scheduler, checkpoint, resume, stream):
+    """依次执行规划、资产生成与场景组装三个阶段。"""
 
     # 流程状态变量
     city_plan = None
     asset_queue = []
-    asset_library = {} # 存储所有已生成的、唯一的资产实例
+    asset_library = {} # 存储所有已生成的唯一资产 (每种资产只生成一次)
+    asset_instances = [] # 指向资产库的轻量实例记录
 
     max_iterations = 2
 
-    city_plan, asset_queue = planner.run(user_concept)
-    if not city_plan or not asset_queue:
-        print("🚨 规划阶段失败，流程终止。")
-        return
+    saved_plan = checkpoint.load_plan() if resume else None
+    if saved_plan:
+        city_plan, asset_queue = saved_plan
+        print(f"♻️  从检查点恢复城市规划: {city_plan['profile'].get('name', 'N/A')}")
+    else:
+        city_plan, asset_queue = planner.run(user_concept)
+        if not city_plan or not asset_queue:
+            print("🚨 规划阶段失败，流程终止。")
+            return None
+        checkpoint.save_plan(city_plan, asset_queue)
+
+    completed_assets = checkpoint.load_assets() if resume else {}
+    if completed_assets:
+        print(f"♻️  从检查点恢复 {len(completed_assets)} 个已生成的资产。")
 
     # 阶段二：资产生成
     if not asset_queue:
         print("\n- 资产生成队列为空，跳过阶段二。")
-    else:
-        print("\n" + "="*50)
-        print(f"====== 阶段二：生成 {len(asset_queue)} 类资产 ======")
-        print("="*50)
-
-        # 使用列表推导式安全地迭代和修改队列
-        remaining_tasks = []
-        for task_template in asset_queue:
-            print(f"\n--- 正在处理资产类型: '{task_template['asset_id']}' (需求: {task_template['quantity_required']}) ---")
-
-            # 为Agent准备一个更扁平化的任务字典
-            run_task = {
-                "asset_id": task_template['asset_id'],
-                "description": task_template['description'],
-                "style": task_template['style_tags'], # 关键映射
-                "type": task_template['type']
-            }
-
-            # 根据需求数量生成资产实例
-            for k in range(task_template['quantity_required']):
-                asset_instance = asset_generator.run(run_task)
-                if asset_instance:
-                    # 使用唯一的实例ID存储到库中
-                    instance_id = f"{task_template['asset_id']}_inst_{k+1}"
-                    asset_library[instance_id] = {**asset_instance, **task_template} # 合并生成信息和规划信息
-                else:
-                    print(f"   🚨 生成资产 '{task_template['asset_id']}' 的实例 {k+1} 失败，已跳过。")
-
-        asset_queue.clear() # 清空本轮队列
+        return None
+
+    print("\n" + "="*50)
+    print(f"====== 阶段二：生成 {len(asset_queue)} 类资产" + (" (流式组装)" if stream else "") + " ======")
+    print("="*50)
+
+    # 每种资产只生成一次，数量需求通过轻量实例记录满足；建筑优先提交，与组装顺序一致，改款资产排在其原资产之后
+    asset_tasks = []
+    task_templates = {}
+    for task_template in sorted(asset_queue, key=lambda t: (building_priority(t.get('variant_of') or t['asset_id']),
+                                                            bool(t.get('variant_of')))):
+        print(f"\n--- 登记资产类型: '{task_template['asset_id']}' (需求: {task_template['quantity_required']}) ---")
+
+        # 为Agent准备一个更扁平化的任务字典
+        run_task = {
+            "asset_id": task_template['asset_id'],
+            "description": task_template['description'],
+            "style": task_template['style_tags'], # 关键映射
+            "type": task_template['type'],
+            "reference_dimensions": task_template.get('reference_dimensions'),
+        }
+        if task_template.get('variant_of'):
+            run_task.update(variant_of=task_template['variant_of'], variant_edit=task_template.get('variant_edit'))
+        task_templates[task_template['asset_id']] = task_template
+        if task_template['asset_id'] in completed_assets:
+            continue
+        asset_tasks.append((task_template['asset_id'], run_task))
+
+    # 改款资产由原资产通过QA的概念图派生：登记等待的原资产，已在检查点中的原资产直接发布其概念图
+    variant_parents = {task['variant_of'] for _, task in asset_tasks if task.get('variant_of')}
+    asset_generator.expect_concepts(variant_parents)
+    for parent_id in variant_parents & completed_assets.keys():
+        asset_generator.publish_concept(parent_id, completed_assets[parent_id].get('source_image_path'))
+
+    asset_stream = AssetStream() if stream else None
+
+    def register_asset(asset_id, generated_asset):
+        """将通过QA的资产登记到资产库并展开实例记录；流式模式下立即交给组装阶段。"""
+        task_template = task_templates[asset_id]
+        asset_info = {**generated_asset, **task_template} # 合并生成信息和规划信息
+        # 根据需求数量登记实例，使用唯一的实例ID引用资产库中的同一资产
+        instances = [{"instance_id": f"{asset_id}_inst_{k+1}", "asset_id": asset_id}
+                     for k in range(task_template['quantity_required'])]
+        asset_library[asset_id] = asset_info
+        asset_instances.extend(instances)
+        if asset_stream is not None:
+            asset_stream.put(asset_id, asset_info, instances)
+
+    def on_asset_complete(asset_id, generated_asset):
+        if not generated_asset:
+            print(f"   🚨 生成资产 '{asset_id}' 失败，其 {task_templates[asset_id]['quantity_required']} 个实例均已跳过。")
+            if asset_stream is not None:
+                asset_stream.fail(asset_id)
+            return
+        # 每个资产完成后立即写入检查点，文件被复制到运行目录中，工作目录中的原件随之释放
+        register_asset(asset_id, checkpoint.save_asset(asset_id, generated_asset))
+        asset_generator.release_asset_files(generated_asset)
+
+    for asset_id in task_templates:
+        if asset_id in completed_assets:
+            register_asset(asset_id, completed_assets[asset_id])
+        elif asset_stream is not None:
+            asset_stream.expect(asset_id)
+
+    checkpoint.set_stage("generating_assets")
+    if asset_stream is None:
+        scheduler.run(asset_tasks, on_complete=on_asset_complete)
 
         print("\n✅ 资产生成阶段完成！")
-        print(f"资产库中共有 {len(asset_library)} 个资产实例。")
+        print(f"资产库中共有 {len(asset_library)} 种资产，{len(asset_instances)} 个实例。")
+
+        # 阶段三：场景组装
+        if not asset_library:
+            print("🚨 资产库为空，无法进行场景组装，流程终止。")
+        checkpoint.set_stage("assembling")
+        final_scene = assembler.run(city_plan, asset_library, asset_instances, checkpoint=checkpoint, resume=resume)
+    else:
+        # 流式模式：生成在后台线程进行，组装在主线程边消费边放置
+        def generate_all():
+            try:
+                scheduler.run(asset_tasks, on_complete=on_asset_complete)
+                print(f"\n✅ 资产生成阶段完成！资产库中共有 {len(asset_library)} 种资产，{len(asset_instances)} 个实例。")
+            finally:
+                asset_stream.close()
 
-    # 阶段三：场景组装
-    if not asset_library:
-        print("🚨 资产库为空，无法进行场景组装，流程终止。")
-    final_scene = assembler.run(city_plan, asset_library)
+        generation_thread = threading.Thread(target=generate_all, name="asset-generation", daemon=True)
+        generation_thread.start()
+        final_scene = assembler.run_streaming(city_plan, asset_stream, checkpoint=checkpoint, resume=resume)
+        generation_thread.join()
+
+    final_scene = checkpoint.save_final(final_scene)
     if not final_scene:
         print("🚨 场景组装失败，流程终止。")
+    return final_scene
 
 if __name__ == "__main__":
-    # 确保运行前清理旧的模拟文件
-    if os.path.exists("tmp"):
-        for f in os.listdir("tmp"):
-            path_to_delete = os.path.join("tmp", f)
-            # 2. 判断是文件还是目录，然后用对应的方法删除
-            if os.path.isfile(path_to_delete):
-                os.remove(path_to_delete)
-            elif os.path.isdir(path_to_delete):
-                shutil.rmtree(path_to_delete)  # 使用 shutil.rmtree() 删除目录
-
-    main()
+    parser = argparse.ArgumentParser(description="城市场景生成全流程")
+    parser.add_argument("--run-dir", default=None, help="本次运行的检查点目录，默认在 runs/ 下按时间创建")
+    parser.add_argument("--resume", default=None, metavar="RUN_DIR", help="从指定运行目录的检查点恢复，跳过已完成的工作")
+    parser.add_argument("--stream", action="store_true", help="流式模式：资产生成与场景组装并行进行")
+    parser.add_argument("--queue-db", default=None, help="分布式模式：将资产任务发布到该任务队列，由 asset_worker.py 处理")
+    args = parser.parse_args()
+
+    # 只清理本机上已退出进程遗留的工作目录，同一主机上正在进行的其他运行不受影响
+    sweep_stale_workspaces()
+
+    main(run_dir=args.resume or args.run_dir, resume=bool(args.resume), stream=args.stream, queue_db=args.queue_db)
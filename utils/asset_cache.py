@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from utils.checkpoint import atomic_write_json, exclusive_file_lock
+
+DEFAULT_CACHE_DIR = os.environ.get("BUILDING_AGENT_CACHE_DIR", "asset_cache")
+DEFAULT_CACHE_MAX_BYTES = int(float(os.environ.get("BUILDING_AGENT_CACHE_MAX_GB", 20)) * 1024 ** 3)
+
+# 资产包中需要持久化的文件字段 -> 缓存目录内的文件名前缀
+_CACHED_FILE_FIELDS = {
+    "source_image_path": "concept",
+    "model_3d_zip_path": "model_3d",
+    "gaussian_splatting_path": "gaussian",
+    "render_video_path": "render",
+}
+
+
+def normalize_asset_task(asset_task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将资产任务规范化为只包含影响生成结果的字段。
+    asset_id 不参与计算：不同运行中同样的描述 + 风格 + 类型应命中同一缓存。
+    """
+    return {
+        "description": " ".join(str(asset_task.get("description", "")).split()),
+        "style": sorted({str(tag).strip().lower() for tag in asset_task.get("style", [])}),
+        "type": str(asset_task.get("type", "")).strip().lower(),
+    }
+
+
+def asset_cache_key(asset_task: Dict[str, Any], generation_params: Dict[str, Any]) -> str:
+    """由规范化任务和生成参数 (模型、种子、步数等) 计算内容地址。"""
+    payload = {"task": normalize_asset_task(asset_task), "params": generation_params}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def file_digest(path: str) -> str:
+    """文件内容的 SHA-256 (例如改款资产所派生自的概念图)，用于让缓存地址随输入文件变化。"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AssetCache:
+    """
+    跨运行共享的内容寻址资产缓存。
+
+    目录结构:
+        <root>/index.json              # key -> {size, created_at, last_access}
+        <root>/index.lock              # 读-改-写索引时持有的跨进程锁
+        <root>/entries/<key>/entry.json  # 资产包元数据与QA结论
+        <root>/entries/<key>/concept.png, model_3d.zip, gaussian.ply, ...
+
+    超过容量上限时按最近最少使用 (LRU) 顺序淘汰条目。
+    多个进程 (asset_worker、并行的运行) 可以共用同一个缓存目录：每次修改索引前都在锁内重新读取磁盘上的索引。
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries_dir = os.path.join(root, "entries")
+        self.index_path = os.path.join(root, "index.json")
+        self.lock_path = os.path.join(root, "index.lock")
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        os.makedirs(self.entries_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        index = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                print("   ⚠️ 资产缓存索引损坏，将按条目目录重建索引。")
+        # 丢弃目录已不存在的条目
+        index = {key: meta for key, meta in index.items() if os.path.isdir(os.path.join(self.entries_dir, key))}
+        # 目录完整但未登记的条目 (索引损坏，或旧版本并发写索引时丢失的) 按目录补登记，使其计入容量并参与淘汰
+        for key in os.listdir(self.entries_dir):
+            entry_json = os.path.join(self.entries_dir, key, "entry.json")
+            if key in index or ".staging." in key or not os.path.isfile(entry_json):
+                continue
+            mtime = os.path.getmtime(entry_json)
+            index[key] = {"size": _dir_size(os.path.join(self.entries_dir, key)), "created_at": mtime, "last_access": mtime}
+        return index
+
+    @contextmanager
+    def _locked_index(self):
+        """持有进程内锁与索引文件锁，并从磁盘重新读取索引；其他进程在此期间写入的条目不会被覆盖。"""
+        with self._lock, exclusive_file_lock(self.lock_path):
+            self._index = self._load_index()
+            yield
+
+    def _save_index(self):
+        atomic_write_json(self.index_path, self._index)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(meta["size"] for meta in self._index.values())
+
+    def get(self, asset_task: Dict[str, Any], generation_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """查询缓存。命中时返回指向缓存文件的资产包副本，否则返回 None。"""
+        key = asset_cache_key(asset_task, generation_params)
+        entry_dir = os.path.join(self.entries_dir, key)
+
+        with self._locked_index():
+            if key not in self._index:
+                self.stats["misses"] += 1
+                return None
+            try:
+                with open(os.path.join(entry_dir, "entry.json"), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                # 条目损坏，视为未命中并移除
+                self._remove_entry(key)
+                self._save_index()
+                self.stats["misses"] += 1
+                return None
+
+            self._index[key]["last_access"] = time.time()
+            self._save_index()
+            self.stats["hits"] += 1
+
+        package = dict(entry["asset"])
+        for field, filename in entry.get("files", {}).items():
+            package[field] = os.path.join(entry_dir, filename)
+        package["asset_id"] = asset_task["asset_id"]
+        package["cache_key"] = key
+        return package
+
+    def put(self, asset_task: Dict[str, Any], generation_params: Dict[str, Any], asset: Dict[str, Any]) -> str:
+        """将已通过QA的资产包 (概念图、3D压缩包、PLY、QA结论) 写入缓存，返回缓存key。"""
+        key = asset_cache_key(asset_task, generation_params)
+        entry_dir = os.path.join(self.entries_dir, key)
+        staging_dir = f"{entry_dir}.staging.{os.getpid()}.{threading.get_ident()}"
+        os.makedirs(staging_dir, exist_ok=True)
+
+        files = {}
+        for field, prefix in _CACHED_FILE_FIELDS.items():
+            src = asset.get(field)
+            if not src or not os.path.isfile(src):
+                continue
+            filename = prefix + os.path.splitext(src)[1]
+            shutil.copyfile(src, os.path.join(staging_dir, filename))
+            files[field] = filename
+
+        entry = {
+            "key": key,
+            "task": normalize_asset_task(asset_task),
+            "generation_params": generation_params,
+            "asset": {k: v for k, v in asset.items() if k not in _CACHED_FILE_FIELDS},
+            "files": files,
+        }
+        atomic_write_json(os.path.join(staging_dir, "entry.json"), entry)
+        size = _dir_size(staging_dir)
+
+        with self._locked_index():
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.replace(staging_dir, entry_dir)
+            now = time.time()
+            self._index[key] = {"size": size, "created_at": now, "last_access": now}
+            self.stats["stores"] += 1
+            self._evict_if_needed(keep=key)
+            self._save_index()
+
+        return key
+
+    def _remove_entry(self, key: str):
+        shutil.rmtree(os.path.join(self.entries_dir, key), ignore_errors=True)
+        self._index.pop(key, None)
+
+    def _evict_if_needed(self, keep: Optional[str] = None):
+        """按 last_access 从旧到新淘汰，直到总大小不超过上限 (调用方需持有锁)。"""
+        total = sum(meta["size"] for meta in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, meta in sorted(self._index.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= meta["size"]
+            self._remove_entry(key)
+            self.stats["evictions"] += 1
+            print(f"   🧹 资产缓存已淘汰条目 {key[:12]} ({meta['size'] / 1024 ** 2:.1f} MB)")
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def print_report(self):
+        print("\n--- 🗄️ 资产缓存统计 ---")
+        print(f"   命中: {self.stats['hits']}, 未命中: {self.stats['misses']}, 命中率: {self.hit_rate() * 100:.1f}%")
+        print(f"   写入: {self.stats['stores']}, 淘汰: {self.stats['evictions']}, "
+              f"条目: {len(self._index)}, 占用: {self.total_bytes() / 1024 ** 2:.1f} MB / {self.max_bytes / 1024 ** 2:.0f} MB")
@@ -0,0 +1,89 @@
+import asyncio
+import atexit
+import os
+import threading
+from typing import Any, Coroutine, Dict, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+# 连接池配置：所有模型后端共享，保持长连接避免每次请求重新握手
+MAX_CONNECTIONS = int(os.environ.get("BUILDING_AGENT_HTTP_MAX_CONNECTIONS", 256))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("BUILDING_AGENT_HTTP_MAX_KEEPALIVE", 64))
+KEEPALIVE_EXPIRY = float(os.environ.get("BUILDING_AGENT_HTTP_KEEPALIVE_EXPIRY", 60.0))
+DEFAULT_TIMEOUT = httpx.Timeout(300.0, connect=10.0)
+
+# httpx.AsyncClient 绑定到创建它的事件循环，因此每个事件循环持有一个客户端
+_clients: Dict[int, httpx.AsyncClient] = {}
+_clients_lock = threading.Lock()
+
+# 同步包装函数使用的后台事件循环
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_lock = threading.Lock()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    返回当前事件循环共享的、带连接池的 httpx.AsyncClient。
+    必须在协程中调用。
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(id(loop))
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=DEFAULT_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+            )
+            _clients[id(loop)] = client
+        return client
+
+
+async def aclose_async_client():
+    """关闭当前事件循环的共享客户端。"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.pop(id(loop), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="async-http-loop", daemon=True)
+            thread.start()
+            _background_loop = loop
+        return _background_loop
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    在后台事件循环中执行协程并阻塞等待结果。
+    同步版本的 API 调用通过它复用同一个连接池，可从任意线程安全调用。
+    """
+    loop = _get_background_loop()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def _shutdown_background_loop():
+    global _background_loop
+    loop = _background_loop
+    if loop is None or loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(aclose_async_client(), loop).result(timeout=5)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+    _background_loop = None
+
+
+atexit.register(_shutdown_background_loop)
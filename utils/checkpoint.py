@@ -0,0 +1,199 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只能依靠进程内的锁
+    fcntl = None
+
+DEFAULT_RUNS_DIR = os.environ.get("BUILDING_AGENT_RUNS_DIR", "runs")
+
+# 资产包中引用的文件字段，检查点会将其复制到运行目录内，保证工作目录被删除后仍可恢复
+_ASSET_FILE_FIELDS = ("source_image_path", "model_3d_zip_path", "gaussian_splatting_path", "render_video_path")
+
+
+def atomic_write_json(path: str, data: Any):
+    """写入临时文件、fsync 后原子替换目标文件。"""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def exclusive_file_lock(lock_path: str):
+    """
+    跨进程的排他锁 (对 lock_path 加 flock)，用于多个进程读-改-写同一个JSON文件。
+    锁文件与被保护的文件分开：被保护的文件通过原子替换写入，替换后不会丢失锁。
+    """
+    with open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def atomic_copy_file(src: str, dst: str):
+    """复制文件到临时路径后原子替换，避免留下不完整的副本。"""
+    tmp_path = f"{dst}.tmp.{os.getpid()}.{threading.get_ident()}"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def pin_asset_files(asset: Dict[str, Any], asset_dir: str) -> Dict[str, Any]:
+    """将资产包引用的文件原子复制到 asset_dir，返回指向副本的资产包。"""
+    os.makedirs(asset_dir, exist_ok=True)
+    pinned = dict(asset)
+    for field in _ASSET_FILE_FIELDS:
+        src = asset.get(field)
+        if not src or not os.path.isfile(src):
+            continue
+        dst = os.path.join(asset_dir, field + os.path.splitext(src)[1])
+        if os.path.abspath(src) != os.path.abspath(dst):
+            atomic_copy_file(src, dst)
+        pinned[field] = dst
+    return pinned
+
+
+def _read_json(path: str) -> Optional[Any]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class RunCheckpoint:
+    """
+    一次完整运行 (规划 -> 资产生成 -> 场景组装) 的持久化检查点。
+
+    运行目录结构:
+        <run_dir>/run.json                  # 运行元信息与当前阶段
+        <run_dir>/plan.json                 # city_plan + asset_queue
+        <run_dir>/assets/<asset_id>.json    # 每个已通过QA的资产
+        <run_dir>/artifacts/<asset_id>/...  # 资产引用的文件副本
+        <run_dir>/scene/scene_state.json    # 已放置/已跳过的实例
+        <run_dir>/scene/store/...           # 只追加的场景存储: manifest.jsonl + assets/<asset_id>-<内容哈希>.ply
+        <run_dir>/scene/final.ply, final_snapshot_<视角>.png  # 最终场景与快照的副本
+        <run_dir>/final.json                # 组装完成后的最终结果
+
+    所有写入均为原子操作，进程在任意时刻退出都不会留下损坏的检查点。
+    """
+
+    def __init__(self, run_dir: str):
+        self.run_dir = run_dir
+        self.assets_dir = os.path.join(run_dir, "assets")
+        self.artifacts_dir = os.path.join(run_dir, "artifacts")
+        self.scene_dir = os.path.join(run_dir, "scene")
+        # 组装阶段的只追加场景存储 (SceneStore)：资产原始PLY + 变换清单
+        self.scene_store_dir = os.path.join(self.scene_dir, "store")
+        self._lock = threading.Lock()
+
+        for d in (self.run_dir, self.assets_dir, self.artifacts_dir, self.scene_dir):
+            os.makedirs(d, exist_ok=True)
+
+        meta_path = os.path.join(run_dir, "run.json")
+        self.meta = _read_json(meta_path) or {"created_at": time.time(), "stage": "created"}
+        self.meta.setdefault("run_id", uuid.uuid4().hex[:12])
+        self._write_meta()
+
+    @property
+    def run_id(self) -> str:
+        """运行的唯一标识，恢复运行时保持不变；用于区分共用同一任务队列的运行。"""
+        return self.meta["run_id"]
+
+    def renew_run_id(self):
+        """在已有的运行目录中重新开始 (非恢复模式) 时换一个新的运行标识，不再复用上一次运行发布的任务。"""
+        with self._lock:
+            self.meta["run_id"] = uuid.uuid4().hex[:12]
+            self._write_meta()
+
+    @classmethod
+    def create(cls, runs_dir: str = DEFAULT_RUNS_DIR, run_name: Optional[str] = None) -> "RunCheckpoint":
+        """在 runs_dir 下创建一个新的运行目录；未指定名称时带随机后缀，同一秒内启动的多个运行不会共用目录。"""
+        run_name = run_name or f"{time.strftime('run_%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        return cls(os.path.join(runs_dir, run_name))
+
+    def _write_meta(self):
+        self.meta["updated_at"] = time.time()
+        atomic_write_json(os.path.join(self.run_dir, "run.json"), self.meta)
+
+    def set_stage(self, stage: str):
+        with self._lock:
+            self.meta["stage"] = stage
+            self._write_meta()
+
+    # --- 阶段一：规划 ---
+
+    def save_plan(self, city_plan: Dict[str, Any], asset_queue: List[Dict[str, Any]]):
+        atomic_write_json(os.path.join(self.run_dir, "plan.json"), {"city_plan": city_plan, "asset_queue": asset_queue})
+        self.set_stage("planned")
+
+    def load_plan(self) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        data = _read_json(os.path.join(self.run_dir, "plan.json"))
+        if data is None:
+            return None
+        return data["city_plan"], data["asset_queue"]
+
+    # --- 阶段二：资产 ---
+
+    def save_asset(self, asset_id: str, asset: Dict[str, Any]) -> Dict[str, Any]:
+        """将资产文件复制进运行目录并记录资产包，返回指向运行目录内文件的资产包。"""
+        pinned = pin_asset_files(asset, os.path.join(self.artifacts_dir, asset_id))
+        atomic_write_json(os.path.join(self.assets_dir, f"{asset_id}.json"), pinned)
+        return pinned
+
+    def load_assets(self) -> Dict[str, Dict[str, Any]]:
+        assets = {}
+        for filename in sorted(os.listdir(self.assets_dir)):
+            if filename.endswith(".json"):
+                assets[filename[:-len(".json")]] = _read_json(os.path.join(self.assets_dir, filename))
+        return assets
+
+    # --- 阶段三：组装 ---
+
+    def save_scene_state(self, scene_state: Dict[str, Any], skipped_instances: List[str]):
+        """
+        记录每次放置 (成功或最终跳过) 后的场景状态。
+        场景本身由组装阶段追加写入 scene_store_dir 下的清单，这里不复制任何PLY；恢复时已放置的实例以清单为准。
+        """
+        state = {
+            "placed_assets": scene_state["placed_assets"],
+            "skipped_instances": skipped_instances,
+        }
+        atomic_write_json(os.path.join(self.scene_dir, "scene_state.json"), state)
+
+    def load_scene_state(self) -> Optional[Dict[str, Any]]:
+        return _read_json(os.path.join(self.scene_dir, "scene_state.json"))
+
+    def save_final(self, final_scene: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        记录最终结果；最终场景与快照复制到运行目录内 (工作目录会在运行结束后删除)，返回指向副本的结果。
+        final_snapshot_path 为视角名称到图片路径的映射，每个视角复制为 final_snapshot_<视角>.png。
+        """
+        if final_scene:
+            final_scene = dict(final_scene)
+            src = final_scene.get("final_scene_ply")
+            if src and os.path.isfile(src):
+                final_scene["final_scene_ply"] = self._copy_final(src, "final" + os.path.splitext(src)[1])
+            snapshots = final_scene.get("final_snapshot_path")
+            if snapshots:
+                final_scene["final_snapshot_path"] = {
+                    view: self._copy_final(path, f"final_snapshot_{view}{os.path.splitext(path)[1]}")
+                    for view, path in snapshots.items() if os.path.isfile(path)
+                }
+        atomic_write_json(os.path.join(self.run_dir, "final.json"), final_scene)
+        self.set_stage("completed" if final_scene else "failed")
+        return final_scene
+
+    def _copy_final(self, src: str, filename: str) -> str:
+        dst = os.path.join(self.scene_dir, filename)
+        if os.path.abspath(src) != os.path.abspath(dst):
+            atomic_copy_file(src, dst)
+        return dst
@@ -0,0 +1,165 @@
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+from plyfile import PlyData
+
+# 计算包围盒时两端各舍弃的百分位，去掉TRELLIS输出中零散的漂浮高斯
+DEFAULT_EXTENT_PERCENTILE = float(os.environ.get("BUILDING_AGENT_EXTENT_PERCENTILE", 1.0))
+# 不透明度 (sigmoid 之后) 低于该值的高斯几乎不可见，不参与尺寸计算
+MIN_GAUSSIAN_OPACITY = float(os.environ.get("BUILDING_AGENT_MIN_GAUSSIAN_OPACITY", 0.05))
+# 资产与场景的竖直轴 (与放置时 position.y 为地面高度一致)
+UP_AXIS = os.environ.get("BUILDING_AGENT_UP_AXIS", "y").lower()
+# 有效高斯少于该数量时认为模型无法测量
+MIN_MEASURABLE_GAUSSIANS = 16
+
+_AXES = ("x", "y", "z")
+_DIMENSION_TEXT = re.compile(r"(Length|Width|Height)\s*[:：]\s*([\d.]+)\s*m", re.I)
+
+Dimensions = Dict[str, Any]
+
+
+def _horizontal_axes() -> List[str]:
+    return [axis for axis in _AXES if axis != UP_AXIS]
+
+
+def measure_gaussian_extent(ply_path: Optional[str], percentile: float = DEFAULT_EXTENT_PERCENTILE,
+                            min_opacity: float = MIN_GAUSSIAN_OPACITY) -> Optional[Dict[str, Any]]:
+    """
+    读取高斯PLY，返回去除漂浮点后的轴对齐包围盒 (模型自身单位):
+        {"extent": {"x", "y", "z"}, "min": {...}, "max": {...}, "gaussians": 总数, "kept": 参与计算的数量}
+    先按不透明度过滤，再在每个轴上取 [percentile, 100 - percentile] 百分位区间。文件无法解析时返回 None。
+    """
+    if not ply_path or not os.path.isfile(ply_path):
+        return None
+    try:
+        vertices = PlyData.read(ply_path)["vertex"].data
+    except Exception:
+        return None
+
+    points = np.stack([vertices[axis] for axis in _AXES], axis=1).astype(np.float64)
+    total = len(points)
+    if "opacity" in (vertices.dtype.names or ()):
+        visible = 1.0 / (1.0 + np.exp(-vertices["opacity"].astype(np.float64))) >= min_opacity
+        if visible.sum() >= MIN_MEASURABLE_GAUSSIANS:
+            points = points[visible]
+    points = points[np.isfinite(points).all(axis=1)]
+    if len(points) < MIN_MEASURABLE_GAUSSIANS:
+        return None
+
+    low, high = np.percentile(points, [percentile, 100.0 - percentile], axis=0)
+    return {
+        "extent": {axis: float(high[i] - low[i]) for i, axis in enumerate(_AXES)},
+        "min": {axis: float(low[i]) for i, axis in enumerate(_AXES)},
+        "max": {axis: float(high[i]) for i, axis in enumerate(_AXES)},
+        "gaussians": total,
+        "kept": len(points),
+    }
+
+
+def parse_dimension_text(text: Optional[str]) -> Optional[Dimensions]:
+    """解析 "Length: Xm, Width: Ym, Height: Zm" 格式的估算文本，缺少任一项时返回 None。"""
+    if not text:
+        return None
+    values = {name.lower(): float(value) for name, value in _DIMENSION_TEXT.findall(text)}
+    if not all(values.get(key, 0) > 0 for key in ("length", "width", "height")):
+        return None
+    return {"length": values["length"], "width": values["width"], "height": values["height"]}
+
+
+def _valid_reference(reference: Any) -> Optional[Dimensions]:
+    if not isinstance(reference, dict):
+        return None
+    try:
+        values = {key: float(reference[key]) for key in ("length", "width", "height")}
+    except (KeyError, TypeError, ValueError):
+        return None
+    return values if all(value > 0 for value in values.values()) else None
+
+
+def create_reference_dimensions_prompt(asset_catalogue: List[Dict[str, Any]]) -> str:
+    """为整个资产目录生成一次性的尺寸估算prompt (每种资产一行)。"""
+    lines = "\n".join(
+        f"- {task['asset_id']} ({task.get('type', '')}/{task.get('subtype', '')}): {task.get('description', '')}"
+        for task in asset_catalogue
+    )
+    return f"""
+你是一个经验丰富的场景设计师。请估算资产目录中每种资产的真实世界尺寸 (单位: 米)。
+长度 (length) 与宽度 (width) 为水平方向的尺寸，高度 (height) 为竖直方向的尺寸。
+
+### 资产目录
+{lines}
+
+### 输出格式
+严格输出一个JSON对象，不要包含任何额外说明，键为资产ID:
+{{"ASSET_ID": {{"length": float, "width": float, "height": float}}, ...}}
+"""
+
+
+def parse_reference_dimensions(response: Optional[str], asset_ids: List[str]) -> Dict[str, Dimensions]:
+    """解析目录级尺寸估算的回复，返回 asset_id -> {"length", "width", "height"}；无效或缺失的资产不出现在结果中。"""
+    if not response:
+        return {}
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        parsed = json.loads(response[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    references = {}
+    for asset_id in asset_ids:
+        reference = _valid_reference(parsed.get(asset_id))
+        if reference:
+            references[asset_id] = reference
+    return references
+
+
+def measure_asset_dimensions(ply_path: Optional[str], reference: Optional[Dimensions]) -> Optional[Dimensions]:
+    """
+    由资产的高斯模型与目录级的参考尺寸得到结构化的真实尺寸:
+        {"length", "width", "height", "unit": "m", "scale", "source", "model_extent"}
+    - source="gaussians": 比例尺 scale = 参考尺寸的最大边 / 模型包围盒的最大边 (对绕竖直轴的朝向不敏感)，
+      长宽高取模型包围盒乘以 scale，保留模型自身的比例；
+    - source="reference": 模型无法测量时直接使用参考尺寸，scale 为 None。
+    两者都不可用时返回 None。
+    """
+    reference = _valid_reference(reference)
+    measured = measure_gaussian_extent(ply_path)
+    horizontal = _horizontal_axes()
+
+    if measured and reference and max(measured["extent"].values()) > 0:
+        extent = measured["extent"]
+        scale = max(reference.values()) / max(extent.values())
+        return {
+            "length": round(extent[horizontal[0]] * scale, 3),
+            "width": round(extent[horizontal[1]] * scale, 3),
+            "height": round(extent[UP_AXIS] * scale, 3),
+            "unit": "m",
+            "scale": scale,
+            "source": "gaussians",
+            "model_extent": extent,
+        }
+    if reference:
+        return {**reference, "unit": "m", "scale": None, "source": "reference"}
+    return None
+
+
+def format_dimensions(dimensions: Union[Dimensions, str, None]) -> str:
+    """用于prompt的尺寸文本；兼容旧检查点与缓存中的自由文本。"""
+    if isinstance(dimensions, dict):
+        return (f"Length: {dimensions['length']:.2f}m, Width: {dimensions['width']:.2f}m, "
+                f"Height: {dimensions['height']:.2f}m")
+    return dimensions or "N/A"
+
+
+def asset_scale(dimensions: Union[Dimensions, str, None]) -> Optional[Dict[str, float]]:
+    """合并高斯模型时使用的等比缩放 (模型单位 -> 米)；尺寸未经测量时返回 None (不缩放)。"""
+    if isinstance(dimensions, dict) and dimensions.get("scale"):
+        scale = float(dimensions["scale"])
+        return {"x": scale, "y": scale, "z": scale}
+    return None
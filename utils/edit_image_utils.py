@@ -0,0 +1,106 @@
+import base64
+import json
+import os
+from io import BytesIO
+from typing import List, Optional
+
+import httpx
+from PIL import Image
+
+from utils.async_http import get_async_client, run_sync
+from utils.tracing import current_span, traced
+
+
+@traced("edit_image.call", "http", attributes=lambda prompt, image_paths, *a, **kw: {"images": len(image_paths)})
+async def acall_edit_image_api(
+        prompt: str,
+        image_paths: List[str],
+        output_path: str = "result.png",
+        url: str = "http://localhost:8022/edit-image",
+        negative_prompt: str = " ",
+        seed: int = 0,
+        true_cfg_scale: float = 4.0,
+        guidance_scale: float = 1.0,
+        num_inference_steps: int = 40,
+        save_image: bool = True
+) -> Optional[Image.Image]:
+    """
+    异步编辑图像 (Qwen-Image-Edit)，复用共享的 httpx 连接池。
+
+    Args:
+        prompt: 编辑指令
+        image_paths: 输入图像的本地路径列表 (至少一张)，第一张为被编辑的主图
+        output_path: 输出图像的保存路径，默认 "result.png"
+        url: API服务地址，默认 "http://localhost:8022/edit-image"
+        negative_prompt: 负面提示词，默认为空格
+        seed: 随机种子，默认 0
+        true_cfg_scale: 真实CFG强度，默认 4.0
+        guidance_scale: 提示词引导强度，默认 1.0
+        num_inference_steps: 推理步数 (在已有图像上做小幅修改时可以远少于文生图)，默认 40
+        save_image: 是否保存图像到文件，默认 True
+
+    Returns:
+        PIL.Image对象，如果失败则返回None
+    """
+    payload = {
+        "prompt": prompt,
+        "negative_prompt": negative_prompt,
+        "seed": seed,
+        "true_cfg_scale": true_cfg_scale,
+        "guidance_scale": guidance_scale,
+        "num_inference_steps": num_inference_steps,
+        "num_images_per_prompt": 1,
+    }
+
+    try:
+        files = []
+        for image_path in image_paths:
+            with open(image_path, "rb") as f:
+                mime_type = "image/jpeg" if image_path.lower().endswith((".jpg", ".jpeg")) else "image/png"
+                files.append(("images", (os.path.basename(image_path), f.read(), mime_type)))
+
+        res = await get_async_client().post(url, data={"request": json.dumps(payload)}, files=files, timeout=300)
+        res.raise_for_status()  # 检查HTTP错误
+        current_span().update(bytes_sent=sum(len(file[1][1]) for file in files), bytes_received=len(res.content))
+        data = res.json()
+
+        if data.get("success"):
+            img_data = base64.b64decode(data["image_base64"])
+            img = Image.open(BytesIO(img_data))
+
+            if save_image:
+                img.save(output_path)
+                print(f"图像已保存到: {output_path}")
+
+            return img
+        else:
+            print("编辑失败:", data)
+            return None
+
+    except httpx.HTTPError as e:
+        print(f"请求错误: {e}")
+        return None
+    except Exception as e:
+        print(f"处理错误: {e}")
+        return None
+
+
+def call_edit_image_api(
+        prompt: str,
+        image_paths: List[str],
+        output_path: str = "result.png",
+        url: str = "http://localhost:8022/edit-image",
+        negative_prompt: str = " ",
+        seed: int = 0,
+        true_cfg_scale: float = 4.0,
+        guidance_scale: float = 1.0,
+        num_inference_steps: int = 40,
+        save_image: bool = True
+) -> Optional[Image.Image]:
+    """
+    编辑图像 (同步版本)。acall_edit_image_api 的薄包装，参数与返回值相同。
+    """
+    return run_sync(acall_edit_image_api(
+        prompt, image_paths, output_path, url, negative_prompt, seed,
+        true_cfg_scale, guidance_scale, num_inference_steps, save_image
+    ))
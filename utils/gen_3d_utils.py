@@ -1,16 +1,21 @@
-import requests
 import os
 import uuid
 from typing import Optional
 
+import httpx
 
-def call_gen_3d_api(
+from utils.async_http import get_async_client, run_sync
+from utils.tracing import current_span, traced
+
+
+@traced("gen_3d.call", "http", attributes=lambda image_path, *a, **kw: {"image": os.path.basename(image_path)})
+async def acall_gen_3d_api(
         image_path: str,
         output_path: Optional[str] = None,
         api_url: str = "http://10.3.3.1:8031/generate-3d/"
 ) -> Optional[str]:
     """
-    上传图片生成3D模型（GLB/ZIP）文件。
+    异步上传图片生成3D模型（GLB/ZIP）文件，复用共享的 httpx 连接池。
 
     Args:
         image_path (str): 输入图片的本地路径。
@@ -33,11 +38,13 @@ def call_gen_3d_api(
         mime_type = "image/jpeg" if filename.lower().endswith(('.jpg', '.jpeg')) else "image/png"
 
         with open(image_path, "rb") as f:
-            # files参数格式: {'字段名': (文件名, 文件对象, MIME类型)}
-            files = {"file": (filename, f, mime_type)}
+            image_bytes = f.read()
+        # files参数格式: {'字段名': (文件名, 文件内容, MIME类型)}
+        files = {"file": (filename, image_bytes, mime_type)}
 
-            print(f"正在上传图片 '{filename}' 到 {api_url} ...")
-            response = requests.post(api_url, files=files, timeout=300)  # 设置超时防止无限等待
+        print(f"正在上传图片 '{filename}' 到 {api_url} ...")
+        response = await get_async_client().post(api_url, files=files, timeout=300)  # 设置超时防止无限等待
+        current_span().update(bytes_sent=len(image_bytes), bytes_received=len(response.content))
 
         # 3. 处理响应
         if response.status_code == 200:
@@ -50,7 +57,7 @@ def call_gen_3d_api(
                 # 自动创建输出目录（如果不存在）
             output_dir = os.path.dirname(output_path)
             if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+                os.makedirs(output_dir, exist_ok=True)
 
             # 保存文件
             with open(output_path, "wb") as f:
@@ -66,7 +73,7 @@ def call_gen_3d_api(
             print("响应内容:", response.text)
             return None
 
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print(f"❌ 网络错误: 无法连接到服务 {api_url}，请检查服务是否启动或IP是否正确。")
         return None
     except Exception as e:
@@ -74,6 +81,17 @@ def call_gen_3d_api(
         return None
 
 
+def call_gen_3d_api(
+        image_path: str,
+        output_path: Optional[str] = None,
+        api_url: str = "http://10.3.3.1:8031/generate-3d/"
+) -> Optional[str]:
+    """
+    上传图片生成3D模型（GLB/ZIP）文件 (同步版本)。acall_gen_3d_api 的薄包装，参数与返回值相同。
+    """
+    return run_sync(acall_gen_3d_api(image_path, output_path, api_url))
+
+
 # ==========================================
 # 使用示例
 # ==========================================
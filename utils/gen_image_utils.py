@@ -1,11 +1,16 @@
-import requests
 import base64
-from PIL import Image
 from io import BytesIO
-from typing import Optional, Union
+from typing import List, Optional, Sequence, Union
+
+import httpx
+from PIL import Image
 
+from utils.async_http import get_async_client, run_sync
+from utils.tracing import current_span, traced
 
-def call_gen_image_api(
+
+@traced("gen_image.call", "http", attributes=lambda prompt, *a, **kw: {"bytes_sent": len(prompt.encode("utf-8"))})
+async def acall_gen_image_api(
         prompt: str,
         output_path: str = "result.png",
         url: str = "http://localhost:8021/generate",
@@ -18,7 +23,7 @@ def call_gen_image_api(
         save_image: bool = True
 ) -> Optional[Image.Image]:
     """
-    生成AI图像
+    异步生成AI图像，复用共享的 httpx 连接池。
 
     Args:
         prompt: 图像生成的提示词
@@ -46,8 +51,9 @@ def call_gen_image_api(
     }
 
     try:
-        res = requests.post(url, json=payload)
+        res = await get_async_client().post(url, json=payload)
         res.raise_for_status()  # 检查HTTP错误
+        current_span().set("bytes_received", len(res.content))
         data = res.json()
 
         if data.get("success"):
@@ -63,7 +69,7 @@ def call_gen_image_api(
             print("生成失败:", data)
             return None
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"请求错误: {e}")
         return None
     except Exception as e:
@@ -71,6 +77,108 @@ def call_gen_image_api(
         return None
 
 
+@traced("gen_images.call", "http", attributes=lambda prompt, seeds, *a, **kw: {
+    "bytes_sent": len(prompt.encode("utf-8")), "images": len(seeds)})
+async def acall_gen_images_api(
+        prompt: str,
+        seeds: Sequence[int],
+        output_paths: Optional[Sequence[str]] = None,
+        url: str = "http://localhost:8021/generate",
+        negative_prompt: str = "",
+        aspect_ratio: str = "16:9",
+        guidance_scale: float = 5.0,
+        num_inference_steps: int = 50
+) -> List[Image.Image]:
+    """
+    异步地在一次请求中生成多张候选图像 (每个种子一张)。服务端把整批放进一次扩散调用，
+    只占用一个队列槽位、只编码一次文本，因此 K 张候选的开销远小于 K 次单张请求。
+
+    Args:
+        prompt: 图像生成的提示词
+        seeds: 每张图像的随机种子，决定生成的张数
+        output_paths: 与 seeds 一一对应的保存路径，为 None 时不保存
+        url: API服务地址，默认 "http://localhost:8021/generate"
+        negative_prompt: 负面提示词，默认为空
+        aspect_ratio: 图像宽高比，默认 "16:9"
+        guidance_scale: 提示词引导强度，默认 5.0
+        num_inference_steps: 推理步数，默认 50
+
+    Returns:
+        与 seeds 顺序一致的 PIL.Image 列表，失败时返回空列表
+    """
+    payload = {
+        "prompt": prompt,
+        "negative_prompt": negative_prompt,
+        "seeds": list(seeds),
+        "aspect_ratio": aspect_ratio,
+        "guidance_scale": guidance_scale,
+        "num_inference_steps": num_inference_steps
+    }
+
+    try:
+        res = await get_async_client().post(url, json=payload)
+        res.raise_for_status()  # 检查HTTP错误
+        current_span().set("bytes_received", len(res.content))
+        data = res.json()
+
+        if not data.get("success"):
+            print("生成失败:", data)
+            return []
+        # 旧版服务只返回单张 image_base64
+        encoded = data.get("images_base64") or [data["image_base64"]]
+        images = [Image.open(BytesIO(base64.b64decode(item))) for item in encoded]
+        for img, path in zip(images, output_paths or []):
+            img.save(path)
+            print(f"图像已保存到: {path}")
+        return images
+
+    except httpx.HTTPError as e:
+        print(f"请求错误: {e}")
+        return []
+    except Exception as e:
+        print(f"处理错误: {e}")
+        return []
+
+
+def call_gen_image_api(
+        prompt: str,
+        output_path: str = "result.png",
+        url: str = "http://localhost:8021/generate",
+        negative_prompt: str = "",
+        seed: int = 5678,
+        randomize_seed: bool = False,
+        aspect_ratio: str = "16:9",
+        guidance_scale: float = 5.0,
+        num_inference_steps: int = 50,
+        save_image: bool = True
+) -> Optional[Image.Image]:
+    """
+    生成AI图像 (同步版本)。acall_gen_image_api 的薄包装，参数与返回值相同。
+    """
+    return run_sync(acall_gen_image_api(
+        prompt, output_path, url, negative_prompt, seed, randomize_seed,
+        aspect_ratio, guidance_scale, num_inference_steps, save_image
+    ))
+
+
+def call_gen_images_api(
+        prompt: str,
+        seeds: Sequence[int],
+        output_paths: Optional[Sequence[str]] = None,
+        url: str = "http://localhost:8021/generate",
+        negative_prompt: str = "",
+        aspect_ratio: str = "16:9",
+        guidance_scale: float = 5.0,
+        num_inference_steps: int = 50
+) -> List[Image.Image]:
+    """
+    一次请求生成多张候选图像 (同步版本)。acall_gen_images_api 的薄包装，参数与返回值相同。
+    """
+    return run_sync(acall_gen_images_api(
+        prompt, seeds, output_paths, url, negative_prompt, aspect_ratio, guidance_scale, num_inference_steps
+    ))
+
+
 # 使用示例
 if __name__ == "__main__":
     # 基础使用
@@ -3,7 +3,6 @@ import time
 import numpy as np
 from typing import Optional, Dict
 from plyfile import PlyData, PlyElement
-from scipy.spatial.transform import Rotation as R
 import torch
 import numpy as np
 from plyfile import PlyData
@@ -14,6 +13,13 @@ import os
 import time
 from typing import Optional, Dict, Union
 
+from utils.model_package import local_media_path
+from utils.scene_accumulator import SceneAccumulator, load_asset_vertices, transform_vertices
+from utils.tracing import current_span, traced
+
+
+@traced("gs.merge", "gaussian", attributes=lambda base_scene_ply, new_asset_ply, position, rotation, scale=None, step=0, **kw: {
+    "asset_ply": os.path.basename(new_asset_ply), "step": step})
 def gaussian_splatting_merge(
         base_scene_ply: Optional[str],
         new_asset_ply: str,
@@ -24,11 +30,12 @@ def gaussian_splatting_merge(
         output_dir: str = "tmp"
 ) -> str:
     """
-    将新的高斯模型资产合并到基础场景中。
+    将新的高斯模型资产合并到基础场景中，每次调用都会重新读取整个基础场景并写出新的合并PLY。
+    逐个放置大量资产时应使用 SceneAccumulator (合并开销只与新资产大小有关)。
 
     Args:
         base_scene_ply: 基础场景的PLY文件路径。如果为None，则只对新资产进行变换。
-        new_asset_ply: 要添加的新资产PLY文件路径。
+        new_asset_ply: 要添加的新资产PLY文件路径。同一资产的多个实例引用同一路径，只会读盘一次。
         position: 位置字典，格式: {'x': 0.0, 'y': 0.0, 'z': 0.0}
         rotation: 旋转字典（欧拉角，单位：度），格式: {'x': 0.0, 'y': 0.0, 'z': 0.0}
         scale: 缩放字典，格式: {'x': 1.0, 'y': 1.0, 'z': 1.0}。默认为None（无缩放）
@@ -93,55 +100,27 @@ def gaussian_splatting_merge(
             raise FileNotFoundError(f"Asset file not found: {new_asset_ply}")
 
         print(f"  ⏳ Loading new asset: {new_asset_ply}")
-        asset_ply = PlyData.read(new_asset_ply)
-        asset_vertices = asset_ply['vertex']
+        asset_vertices = load_asset_vertices(new_asset_ply)
 
         # 如果这是第一个加载的文件，记录数据结构
         if vertex_dtype is None:
-            vertex_dtype = asset_vertices.data.dtype
-
-        # 3. 提取顶点坐标
-        points = np.vstack([
-            asset_vertices['x'],
-            asset_vertices['y'],
-            asset_vertices['z']
-        ]).T
+            vertex_dtype = asset_vertices.dtype
 
-        print(f"     ✓ Asset loaded: {len(points)} vertices")
+        print(f"     ✓ Asset loaded: {len(asset_vertices)} vertices")
 
-        # 4. 应用变换（缩放 -> 旋转 -> 平移）
+        # 3. 应用变换（缩放 -> 旋转 -> 平移）
         print(f"  🔧 Applying transformations...")
-
-        # a. 缩放
-        if not np.allclose(scale_array, [1.0, 1.0, 1.0]):
-            points = points * scale_array
-            print(f"     ✓ Scaled by {scale_array}")
-
-        # b. 旋转
-        if any(r != 0 for r in rot_array):
-            rotation_matrix = R.from_euler('xyz', rot_array, degrees=True).as_matrix()
-            points = points @ rotation_matrix.T
-            print(f"     ✓ Rotated by {rot_array}°")
-
-        # c. 平移
-        if not np.allclose(pos_array, [0, 0, 0]):
-            points = points + pos_array
-            print(f"     ✓ Translated by {pos_array}")
-
-        # 5. 更新变换后的顶点数据
-        transformed_data = np.copy(asset_vertices.data)
-        transformed_data['x'] = points[:, 0]
-        transformed_data['y'] = points[:, 1]
-        transformed_data['z'] = points[:, 2]
+        transformed_data = transform_vertices(asset_vertices, position, rotation, scale)
 
         all_vertices_data.append(transformed_data)
 
-        # 6. 合并所有顶点
+        # 4. 合并所有顶点
         print(f"  🔗 Merging vertices...")
         final_vertices = np.concatenate(all_vertices_data)
         print(f"     ✓ Total vertices: {len(final_vertices)}")
+        current_span().update(asset_gaussians=len(transformed_data), total_gaussians=len(final_vertices))
 
-        # 7. 创建并保存PLY文件
+        # 5. 创建并保存PLY文件
         output_filename = f"scene_merged_step_{step}.ply"
         output_path = os.path.join(output_dir, output_filename)
 
@@ -150,6 +129,7 @@ def gaussian_splatting_merge(
 
         print(f"  💾 Saving to: {output_path}")
         final_ply.write(output_path)
+        current_span().set("bytes_written", os.path.getsize(output_path))
         print(f"  ✅ Merge completed successfully!\n")
 
         return output_path
@@ -162,10 +142,16 @@ def gaussian_splatting_merge(
 #  load_ply 函数 (无需修改)
 # =================================================================================
 def load_ply(path, device="cuda"):
-    plydata = PlyData.read(path)
-    vertices = plydata['vertex']
+    # 压缩包中的PLY临时写入内存文件系统后按路径读取 (plyfile 只对真实文件做内存映射，流式逐条解析很慢)
+    with local_media_path(path) as local_path:
+        vertices = PlyData.read(local_path)['vertex'].data.copy()
+    return vertices_to_tensors(vertices, device=device)
+
+
+def vertices_to_tensors(vertices, device="cuda"):
+    """把高斯顶点结构化数组转换为渲染所需的 (means, scales, quats, rgbs, opacities) 张量。"""
     points = np.vstack([vertices['x'], vertices['y'], vertices['z']]).T
-    opacities = torch.sigmoid(torch.tensor(vertices['opacity'], dtype=torch.float32, device=device))
+    opacities = torch.sigmoid(torch.tensor(np.array(vertices['opacity'], dtype=np.float32), device=device))
     scales = torch.exp(torch.tensor(np.vstack([
         vertices['scale_0'], vertices['scale_1'], vertices['scale_2']
     ]), dtype=torch.float32, device=device).T)
@@ -225,6 +211,18 @@ def render_view(
         elevation_deg, azimuth_deg,
         output_path
 ):
+    image = render_view_image(means, scales, quats, rgbs, opacities, width, height, elevation_deg, azimuth_deg)
+    save_image(image, output_path)
+    print(f"   - 图像已保存到 '{output_path}'")
+    return output_path
+
+
+def render_view_image(
+        means, scales, quats, rgbs, opacities,
+        width, height,
+        elevation_deg, azimuth_deg
+):
+    """渲染单个视角，返回 (3, H, W) 的图像张量 (不写盘)。相机参数与 render_view 相同。"""
     device = means.device
     scene_center = means.mean(dim=0)
     scene_size = torch.max(torch.sqrt(torch.sum((means - scene_center) ** 2, dim=1))).item()
@@ -273,16 +271,16 @@ def render_view(
         backgrounds=backgrounds.float()
     )
 
-    save_image(outputs[0].permute(2, 0, 1), output_path)
-    print(f"   - 图像已保存到 '{output_path}'")
-    return output_path
+    return outputs[0].permute(2, 0, 1).clamp(0.0, 1.0)
 
 
 # =================================================================================
 #  封装的高斯渲染快照函数
 # =================================================================================
+@traced("gs.snapshot", "gaussian", attributes=lambda scene_ply=None, camera_mode="", info="", *a, **kw: {
+    "camera_mode": camera_mode, "info": info})
 def gaussian_splatting_snapshot(
-        scene_ply: Optional[str],
+        scene_ply: Union[str, SceneAccumulator, None],
         camera_mode: str,
         info: str,
         target_pos: Optional[Dict] = None,
@@ -295,7 +293,7 @@ def gaussian_splatting_snapshot(
     【已升级】为高斯场景生成快照。
 
     参数:
-        scene_ply: .ply文件路径，如果为None则返回空结果
+        scene_ply: .ply文件路径或内存中的 SceneAccumulator (含暂存资产，不写盘)，如果为None或场景为空则返回空结果
         camera_mode: 相机模式，可选 "all"(全部视角), "front", "top", "left", "perspective"
         info: 用于文件命名的标识信息
         target_pos: 可选的目标位置字典（预留参数，暂未使用）
@@ -312,12 +310,13 @@ def gaussian_splatting_snapshot(
     os.makedirs(output_dir, exist_ok=True)
 
     # 如果没有提供场景文件，返回空结果
-    if scene_ply is None:
+    if scene_ply is None or (isinstance(scene_ply, SceneAccumulator) and len(scene_ply) == 0):
         scene_name = "empty_scene"
         print(f"   - [WARNING] 未提供场景文件，无法生成快照")
         return {}
 
-    scene_name = os.path.basename(scene_ply)
+    in_memory = isinstance(scene_ply, SceneAccumulator)
+    scene_name = scene_ply.name if in_memory else os.path.basename(scene_ply)
     print(f"   - [Gaussian Splatting] 正在为场景 '{scene_name}' 生成 '{camera_mode}' 快照 (info: '{info}')...")
 
     # 设备选择
@@ -326,8 +325,12 @@ def gaussian_splatting_snapshot(
 
     # 加载PLY文件
     try:
-        (means, scales, quats, rgbs, opacities) = load_ply(scene_ply, device=device)
+        if in_memory:
+            (means, scales, quats, rgbs, opacities) = vertices_to_tensors(scene_ply.vertices, device=device)
+        else:
+            (means, scales, quats, rgbs, opacities) = load_ply(scene_ply, device=device)
         print(f"   - 成功加载 {means.shape[0]} 个高斯球")
+        current_span().set("gaussians", int(means.shape[0]))
     except Exception as e:
         print(f"   - [ERROR] 加载 .ply 文件时出错: {e}")
         return {}
@@ -383,6 +386,60 @@ def gaussian_splatting_snapshot(
     return snapshot_paths
 
 
+# =================================================================================
+#  资产QA用的环绕视角联系表
+# =================================================================================
+# (仰角, 方位角)，仰角的符号约定与 gaussian_splatting_snapshot 的视角配置一致
+CONTACT_SHEET_VIEWS = (
+    (-20, 0), (-20, 90), (-20, 180), (-20, 270),
+    (-45, 45), (-90, 0),
+)
+
+
+@traced("gs.contact_sheet", "gaussian", attributes=lambda ply_path, output_path, *a, **kw: {
+    "ply": os.path.basename(ply_path)})
+def gaussian_splatting_contact_sheet(
+        ply_path: str,
+        output_path: str,
+        views=CONTACT_SHEET_VIEWS,
+        tile_size: int = 384,
+        columns: int = 3,
+        apply_correction: bool = False
+) -> Optional[str]:
+    """
+    在本地渲染资产的一组固定环绕视角，并拼接为一张联系表图片，供3D质量评估使用 (代替服务端渲染的视频)。
+
+    参数:
+        ply_path: 资产高斯PLY路径，也可以是压缩包成员路径 <zip>!/<成员名>
+        output_path: 联系表图片的输出路径
+        views: (仰角, 方位角) 列表，默认 CONTACT_SHEET_VIEWS
+        tile_size: 每个视角的边长 (像素)
+        columns: 每行的视角数
+
+    返回:
+        联系表图片路径；加载或渲染失败时返回 None。
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    try:
+        (means, scales, quats, rgbs, opacities) = load_ply(ply_path, device=device)
+        if apply_correction:
+            means, scales, quats = correct_model_orientation(means, scales, quats)
+        tiles = [
+            render_view_image(means, scales, quats, rgbs, opacities, tile_size, tile_size, elevation, azimuth)
+            for elevation, azimuth in views
+        ]
+    except Exception as e:
+        print(f"   - [ERROR] 渲染联系表时出错: {e}")
+        return None
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    # 白色间隔与渲染背景一致
+    save_image(torch.stack(tiles), output_path, nrow=columns, padding=4, pad_value=1.0)
+    current_span().update(gaussians=int(means.shape[0]), views=len(tiles))
+    print(f"   - 联系表 ({len(tiles)} 个视角) 已保存到 '{output_path}'")
+    return output_path
+
+
 # =================================================================================
 #  向后兼容的生成函数
 # =================================================================================
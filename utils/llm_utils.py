@@ -4,8 +4,13 @@ import httpx
 import sys
 import datetime
 
+from utils.async_http import get_async_client, run_sync
+from utils.tracing import current_span, traced
 
-def call_llm_api(
+
+@traced("llm.call", "http", attributes=lambda prompt, model_name, *a, **kw: {
+    "model": model_name, "bytes_sent": len(prompt.encode("utf-8"))})
+async def acall_llm_api(
         prompt: str,
         model_name: str,
         base_url: str,
@@ -17,7 +22,7 @@ def call_llm_api(
         output_filename: str | None = None
 ) -> str | None:
     """
-    调用部署在 vLLM 上的 OpenAI 兼容 API。
+    异步调用部署在 vLLM 上的 OpenAI 兼容 API，底层复用共享的 httpx 连接池。
 
     Args:
         prompt (str): 发送给模型的用户提示。
@@ -34,10 +39,11 @@ def call_llm_api(
         str | None: 如果成功，返回模型生成的完整字符串；如果发生错误，则返回 None。
     """
     try:
-        # 初始化 OpenAI 客户端
-        client = openai.OpenAI(
+        # 初始化 OpenAI 异步客户端，使用共享连接池 (不随本次调用关闭)
+        client = openai.AsyncOpenAI(
             base_url=base_url,
             api_key=api_key,
+            http_client=get_async_client(),
         )
 
         # 准备要发送的消息
@@ -56,7 +62,7 @@ def call_llm_api(
             with open(output_filename, 'w', encoding='utf-8') if output_filename else open(sys.stdout.fileno(), 'w',
                                                                                            encoding='utf-8',
                                                                                            closefd=False) as f:
-                stream_response = client.chat.completions.create(
+                stream_response = await client.chat.completions.create(
                     model=model_name,
                     messages=messages_data,
                     temperature=temperature,
@@ -66,7 +72,7 @@ def call_llm_api(
                 )
 
                 print("\n模型流式返回结果:")
-                for chunk in stream_response:
+                async for chunk in stream_response:
                     chunk_content = chunk.choices[0].delta.content
                     if chunk_content is not None:
                         # 实时打印到控制台
@@ -83,12 +89,13 @@ def call_llm_api(
             if output_filename:
                 print(f"完整内容已成功保存到文件: {output_filename}")
 
+            current_span().set("response_chars", len(full_response_content))
             return full_response_content
 
         else:
             # --- 非流式处理 ---
             print("\n模型正在一次性生成结果，请稍候...")
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=model_name,
                 messages=messages_data,
                 temperature=temperature,
@@ -106,9 +113,10 @@ def call_llm_api(
                     f.write(result_content)
                 print(f"\n完整内容已成功保存到文件: {output_filename}")
 
+            current_span().set("response_chars", len(result_content or ""))
             return result_content
 
-    except httpx.ConnectTimeout:
+    except (httpx.ConnectTimeout, openai.APITimeoutError):
         print(f"\n错误: 连接超时。请检查网络连接或 API 端点地址 '{base_url}' 是否正确。")
         return None
     except Exception as e:
@@ -116,6 +124,26 @@ def call_llm_api(
         return None
 
 
+def call_llm_api(
+        prompt: str,
+        model_name: str,
+        base_url: str,
+        api_key: str = "not-needed",
+        temperature: float = 0.7,
+        max_tokens: int = 100000,
+        timeout: float = 300.0,
+        stream: bool = True,
+        output_filename: str | None = None
+) -> str | None:
+    """
+    调用部署在 vLLM 上的 OpenAI 兼容 API (同步版本)。
+    acall_llm_api 的薄包装，参数与返回值相同。
+    """
+    return run_sync(acall_llm_api(
+        prompt, model_name, base_url, api_key, temperature, max_tokens, timeout, stream, output_filename
+    ))
+
+
 # ==============================================================================
 # --- 主程序：如何使用这个函数 ---
 # ==============================================================================
@@ -0,0 +1,122 @@
+import fnmatch
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple
+
+# TRELLIS 结果包的成员命名: gaussian_<id>.ply、{gaussian,radiance_field,mesh}_<id>.mp4、model_<id>.glb
+# 按顺序匹配成员文件名，前面的模式优先；最后的通配模式兼容其他命名的结果包
+GAUSSIAN_PLY_PATTERNS = ("gaussian_*.ply", "*.ply")
+QA_VIDEO_PATTERNS = ("gaussian_*.mp4", "*.mp4")
+MESH_PATTERNS = ("model_*.glb", "*.glb")
+
+# 指向压缩包内成员的媒体路径: <zip路径>!/<成员名>
+MEMBER_SEPARATOR = "!/"
+# 只能按文件路径读取的库 (OpenCV 解码视频、plyfile 内存映射) 需要的压缩包成员临时写入内存文件系统 (若可用)
+MEDIA_SPOOL_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def member_ref(zip_path: str, member: str) -> str:
+    return f"{zip_path}{MEMBER_SEPARATOR}{member}"
+
+
+def split_member_ref(path: str) -> Optional[Tuple[str, str]]:
+    """拆分 <zip路径>!/<成员名>；普通文件路径返回 None。"""
+    zip_path, sep, member = str(path).partition(MEMBER_SEPARATOR)
+    if not sep or not zip_path.lower().endswith(".zip"):
+        return None
+    return zip_path, member
+
+
+def media_exists(path: str) -> bool:
+    ref = split_member_ref(path)
+    if ref is None:
+        return os.path.exists(path)
+    try:
+        with zipfile.ZipFile(ref[0]) as archive:
+            archive.getinfo(ref[1])
+        return True
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+
+
+@contextmanager
+def open_media(path: str) -> Iterator[BinaryIO]:
+    """以二进制只读方式打开普通文件或压缩包成员 (直接从压缩包中流式解压，不落盘)。"""
+    ref = split_member_ref(path)
+    if ref is None:
+        with open(path, "rb") as f:
+            yield f
+        return
+    with zipfile.ZipFile(ref[0]) as archive, archive.open(ref[1]) as stream:
+        yield stream
+
+
+def read_media_bytes(path: str) -> bytes:
+    with open_media(path) as f:
+        return f.read()
+
+
+@contextmanager
+def local_media_path(path: str) -> Iterator[str]:
+    """普通文件直接返回路径；压缩包成员解压到临时文件，离开上下文时删除。"""
+    if split_member_ref(path) is None:
+        yield path
+        return
+    suffix = os.path.splitext(path)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=MEDIA_SPOOL_DIR) as spool:
+        with open_media(path) as member:
+            shutil.copyfileobj(member, spool, 1024 * 1024)
+        spool.flush()
+        yield spool.name
+
+
+class ModelPackage:
+    """
+    3D生成结果包 (ZIP) 的只读视图。只读取中央目录，按文件名模式定位各阶段需要的成员:
+      - QA 通过 ref() 得到的成员路径直接从压缩包读取渲染视频，未通过QA的尝试不解压任何文件；
+      - 只有通过QA的尝试才用 extract() 把高斯PLY与QA视频逐个写入工作目录 (网格与其他视频不解压)。
+    结果包损坏时构造函数抛出 zipfile.BadZipFile。
+    """
+
+    def __init__(self, zip_path: str):
+        self.zip_path = zip_path
+        with zipfile.ZipFile(zip_path) as archive:
+            self.members: List[str] = [info.filename for info in archive.infolist() if not info.is_dir()]
+
+    def find(self, patterns: Sequence[str]) -> Optional[str]:
+        """返回第一个匹配的成员名 (按模式优先级，同一模式内按名称排序)，没有匹配时返回 None。"""
+        for pattern in patterns:
+            matches = sorted(m for m in self.members if fnmatch.fnmatch(os.path.basename(m).lower(), pattern))
+            if matches:
+                return matches[0]
+        return None
+
+    @property
+    def gaussian_ply(self) -> Optional[str]:
+        return self.find(GAUSSIAN_PLY_PATTERNS)
+
+    @property
+    def qa_video(self) -> Optional[str]:
+        return self.find(QA_VIDEO_PATTERNS)
+
+    @property
+    def mesh(self) -> Optional[str]:
+        return self.find(MESH_PATTERNS)
+
+    def ref(self, member: str) -> str:
+        return member_ref(self.zip_path, member)
+
+    def read(self, member: str) -> bytes:
+        with zipfile.ZipFile(self.zip_path) as archive:
+            return archive.read(member)
+
+    def extract(self, member: str, dest_dir: str) -> str:
+        """把单个成员流式写入 dest_dir (丢弃压缩包内的目录层级)，返回写出的路径。"""
+        os.makedirs(dest_dir, exist_ok=True)
+        target = os.path.join(dest_dir, os.path.basename(member))
+        with zipfile.ZipFile(self.zip_path) as archive, archive.open(member) as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        return target
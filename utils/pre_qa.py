@@ -0,0 +1,437 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from plyfile import PlyData, PlyElement
+from scipy import ndimage
+
+from utils.model_package import local_media_path
+
+# 启用的2D预检项 (逗号分隔)，为空或 none 时关闭预检，所有候选直接交给VLM
+DEFAULT_PRE_QA_CHECKS = os.environ.get("BUILDING_AGENT_PRE_QA_CHECKS", "background,cropped,shadow,blur")
+# 分析前把图像缩小到该边长，所有检查在缩略图上进行
+PRE_QA_ANALYSIS_SIZE = 256
+# 启用的3D几何预检项 (逗号分隔)，为空或 none 时关闭
+DEFAULT_PRE_QA_CHECKS_3D = os.environ.get("BUILDING_AGENT_PRE_QA_CHECKS_3D", "gaussians,floaters,splats,coverage")
+# 漂浮碎片占比不超过 floaters 检查的 max_repair_fraction 时，剔除碎片后继续QA，而不是直接拒绝
+REPAIR_FLOATERS = os.environ.get("BUILDING_AGENT_REPAIR_FLOATERS", "1") not in ("", "0")
+# 体素化时包围盒最长边划分的格数
+GAUSSIAN_VOXEL_GRID = 32
+# 主体范围: 各轴 [Q1 - k·IQR, Q3 + k·IQR]，之外的高斯直接视为漂浮碎片
+BODY_FENCE = 2.0
+
+
+@dataclass(frozen=True)
+class PreQACheck:
+    """
+    一项本地预检。fn(stats, thresholds) -> (指标值, 失败原因或 None)，stats 为 ImageStats 或 GaussianStats。
+    criterion 为对应的 QA 标准编号 (见 _create_2d_qa_prompt / _create_3d_qa_prompt)，供重试策略生成修正要求；
+    None 表示标准清单之外的问题。
+    """
+    name: str
+    fn: Callable[[Any, Dict[str, float]], Tuple[float, Optional[str]]]
+    criterion: Optional[int]
+    thresholds: Dict[str, float]
+
+
+# 名称 -> 预检项；新的检查通过 register_2d_check / register_3d_check 注册
+PRE_QA_CHECKS_2D: Dict[str, PreQACheck] = {}
+PRE_QA_CHECKS_3D: Dict[str, PreQACheck] = {}
+
+
+def register_2d_check(name: str, criterion: Optional[int] = None, **thresholds: float):
+    """注册一项2D预检，thresholds 为默认阈值，可在 ImagePreQA 中按检查项覆盖。"""
+    def decorator(fn):
+        PRE_QA_CHECKS_2D[name] = PreQACheck(name, fn, criterion, dict(thresholds))
+        return fn
+    return decorator
+
+
+def register_3d_check(name: str, criterion: Optional[int] = None, **thresholds: float):
+    """注册一项3D几何预检 (criterion 对应 _create_3d_qa_prompt 的标准编号)。"""
+    def decorator(fn):
+        PRE_QA_CHECKS_3D[name] = PreQACheck(name, fn, criterion, dict(thresholds))
+        return fn
+    return decorator
+
+
+@dataclass
+class PreQAResult:
+    passed: bool
+    failures: List[Dict[str, Any]] = field(default_factory=list)
+    metrics: Dict[str, float] = field(default_factory=dict)
+    # 3D预检剔除漂浮碎片后写出的PLY (仅 GaussianPreQA)
+    cleaned_path: Optional[str] = None
+
+    def as_qa_result(self) -> Dict[str, Any]:
+        """转换为与VLM结论相同格式的失败结论。"""
+        criteria = sorted({f["criterion"] for f in self.failures if f["criterion"] is not None})
+        return {
+            "pass": False,
+            "failed_criteria": criteria,
+            "reason": "本地预检未通过: " + "；".join(f["reason"] for f in self.failures),
+            "pre_qa": {"failed_checks": [f["check"] for f in self.failures], "metrics": self.metrics},
+        }
+
+
+class ImageStats:
+    """一张图像的缩略图及各检查共用的中间量 (亮度、饱和度、背景色、主体掩码)。"""
+
+    def __init__(self, image: Image.Image, border: float = 0.03):
+        image = image.convert("RGB")
+        image.thumbnail((PRE_QA_ANALYSIS_SIZE, PRE_QA_ANALYSIS_SIZE), Image.Resampling.BILINEAR)
+        self.rgb = np.asarray(image, dtype=np.float32) / 255.0
+        height, width = self.rgb.shape[:2]
+        self.lum = self.rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        high, low = self.rgb.max(axis=2), self.rgb.min(axis=2)
+        self.sat = np.where(high > 0, (high - low) / np.maximum(high, 1e-6), 0.0)
+
+        band = max(1, int(round(min(height, width) * border)))
+        self.border_mask = np.zeros((height, width), dtype=bool)
+        self.border_mask[:band, :] = self.border_mask[-band:, :] = True
+        self.border_mask[:, :band] = self.border_mask[:, -band:] = True
+        self.edge_mask = np.zeros((height, width), dtype=bool)
+        self.edge_mask[0, :] = self.edge_mask[-1, :] = self.edge_mask[:, 0] = self.edge_mask[:, -1] = True
+
+        self.bg_color = np.median(self.rgb[self.border_mask], axis=0)
+        self.bg_lum = float(self.bg_color @ np.array([0.299, 0.587, 0.114], dtype=np.float32))
+        # 与背景色明显不同的像素 (含阴影)
+        self.foreground = np.abs(self.rgb - self.bg_color).max(axis=2) > 0.15
+        # 比背景略暗的中性灰像素：投射阴影的候选
+        self.shadow_like = (self.sat < 0.12) & (self.lum < self.bg_lum - 0.08) & (self.lum > self.bg_lum - 0.45)
+        subject = self.foreground & ~self.shadow_like
+        self.subject = subject if subject.any() else self.foreground
+        self.subject_bbox = self._bbox(self.subject)
+
+    @staticmethod
+    def _bbox(mask: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+        if not len(rows):
+            return None
+        return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+@register_2d_check("background", criterion=3, min_light_fraction=0.7, min_lum=0.78, max_sat=0.12)
+def _check_background(stats: ImageStats, t: Dict[str, float]) -> Tuple[float, Optional[str]]:
+    """画面边缘应为纯白或浅灰背景。"""
+    border = stats.border_mask
+    light = (stats.lum[border] >= t["min_lum"]) & (stats.sat[border] <= t["max_sat"])
+    fraction = float(light.mean())
+    if fraction < t["min_light_fraction"]:
+        return fraction, f"背景不是纯白或浅灰 (边缘浅色像素仅占 {fraction:.0%})"
+    return fraction, None
+
+
+@register_2d_check("cropped", criterion=3, max_edge_fraction=0.02, min_area=0.02, max_area=0.9)
+def _check_cropped(stats: ImageStats, t: Dict[str, float]) -> Tuple[float, Optional[str]]:
+    """主体应完整地位于画面内，不接触画面边缘，且大小适中。"""
+    edge_fraction = float(stats.foreground[stats.edge_mask].mean())
+    area = float(stats.subject.mean())
+    if area < t["min_area"]:
+        return edge_fraction, f"主体缺失或过小 (占画面 {area:.1%})"
+    if area > t["max_area"]:
+        return edge_fraction, f"主体占满画面 (占画面 {area:.0%})"
+    if edge_fraction > t["max_edge_fraction"]:
+        return edge_fraction, f"主体被画面边缘裁切 ({edge_fraction:.0%} 的边缘像素属于主体)"
+    return edge_fraction, None
+
+
+@register_2d_check("shadow", criterion=4, max_shadow_fraction=0.04, margin=0.02)
+def _check_shadow(stats: ImageStats, t: Dict[str, float]) -> Tuple[float, Optional[str]]:
+    """主体包围盒之外的背景中不应有大片中性灰的投射阴影。"""
+    if stats.subject_bbox is None:
+        return 0.0, None
+    height, width = stats.lum.shape
+    pad = int(round(max(height, width) * t["margin"]))
+    top, bottom, left, right = stats.subject_bbox
+    outside = np.ones((height, width), dtype=bool)
+    outside[max(0, top - pad):bottom + pad, max(0, left - pad):right + pad] = False
+    if not outside.any():
+        return 0.0, None
+    fraction = float(stats.shadow_like[outside].mean())
+    if fraction > t["max_shadow_fraction"]:
+        return fraction, f"背景中存在明显的投射阴影 (占主体外区域 {fraction:.0%})"
+    return fraction, None
+
+
+@register_2d_check("blur", criterion=None, min_edge_response=0.04)
+def _check_blur(stats: ImageStats, t: Dict[str, float]) -> Tuple[float, Optional[str]]:
+    """主体区域的拉普拉斯响应 (99分位) 过低说明图像模糊。"""
+    lum = stats.lum
+    if stats.subject_bbox is not None:
+        top, bottom, left, right = stats.subject_bbox
+        lum = lum[max(0, top - 1):bottom + 1, max(0, left - 1):right + 1]
+    if min(lum.shape) < 3:
+        return 0.0, None
+    laplacian = (lum[1:-1, :-2] + lum[1:-1, 2:] + lum[:-2, 1:-1] + lum[2:, 1:-1] - 4 * lum[1:-1, 1:-1])
+    response = float(np.percentile(np.abs(laplacian), 99))
+    if response < t["min_edge_response"]:
+        return response, f"图像模糊 (边缘响应 {response:.3f})"
+    return response, None
+
+
+class _PreQARunner:
+    """按注册表执行一组已启用的预检项并累计统计，由 ImagePreQA / GaussianPreQA 继承。"""
+
+    title = ""
+
+    def __init__(self, registry: Dict[str, PreQACheck], default_checks: str, checks: Optional[List[str]],
+                 thresholds: Optional[Dict[str, Dict[str, float]]]):
+        if checks is None:
+            checks = [name.strip() for name in default_checks.split(",") if name.strip().lower() not in ("", "none")]
+        unknown = [name for name in checks if name not in registry]
+        if unknown:
+            raise ValueError(f"未知的预检项: {unknown}")
+        self.checks = [registry[name] for name in checks]
+        self.thresholds = {
+            check.name: {**check.thresholds, **(thresholds or {}).get(check.name, {})} for check in self.checks
+        }
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "rejected": 0, "by_check": {}}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.checks)
+
+    def _decode_failure(self, e: Exception, what: str) -> PreQAResult:
+        result = PreQAResult(False, [{"check": "decode", "criterion": None, "reason": f"{what}无法解码 ({e})"}])
+        self._count(result)
+        return result
+
+    def _evaluate(self, stats: Any) -> PreQAResult:
+        failures, metrics = [], {}
+        for check in self.checks:
+            value, reason = check.fn(stats, self.thresholds[check.name])
+            metrics[check.name] = round(value, 4)
+            if reason:
+                failures.append({"check": check.name, "criterion": check.criterion, "reason": reason})
+        return PreQAResult(not failures, failures, metrics)
+
+    def _count(self, result: PreQAResult):
+        with self._lock:
+            self.stats["checked"] += 1
+            if not result.passed:
+                self.stats["rejected"] += 1
+            for failure in result.failures:
+                self.stats["by_check"][failure["check"]] = self.stats["by_check"].get(failure["check"], 0) + 1
+
+    def print_report(self):
+        if not self.stats["checked"]:
+            return
+        print(f"\n--- 🔍 {self.title}统计 ---")
+        by_check = ", ".join(f"{name}: {count}" for name, count in sorted(self.stats["by_check"].items())) or "无"
+        print(f"   预检: {self.stats['checked']}, 本地拒绝: {self.stats['rejected']} (节省等量的VLM调用), 按检查项: {by_check}")
+
+
+class ImagePreQA(_PreQARunner):
+    """
+    2D候选图的本地预检：在调用VLM之前用 NumPy/PIL 启发式规则拒绝明显不合格的图像
+    (非白背景、投射阴影、模糊、主体被裁切)，只有通过预检的候选才占用VLM。
+    checks 为启用的检查名列表；thresholds 按检查名覆盖默认阈值，例如 {"shadow": {"max_shadow_fraction": 0.08}}。
+    """
+
+    title = "2D本地预检"
+
+    def __init__(self, checks: Optional[List[str]] = None, thresholds: Optional[Dict[str, Dict[str, float]]] = None):
+        super().__init__(PRE_QA_CHECKS_2D, DEFAULT_PRE_QA_CHECKS, checks, thresholds)
+
+    def run(self, image_path: str) -> PreQAResult:
+        """对一张图像执行所有启用的检查。图像无法解码时直接判为不合格。"""
+        try:
+            with Image.open(image_path) as image:
+                stats = ImageStats(image)
+        except Exception as e:
+            return self._decode_failure(e, "图像")
+        result = self._evaluate(stats)
+        self._count(result)
+        return result
+
+
+# --- 3D 几何预检 ---
+
+class GaussianStats:
+    """
+    一个高斯资产的几何统计，各检查共用:
+      - visible: 坐标有效且不透明度 (sigmoid 之后) 不低于 min_opacity 的高斯；
+      - 体素连通分量: 在主体范围 (四分位距围栏，见 BODY_FENCE) 内以 GAUSSIAN_VOXEL_GRID 的分辨率体素化可见高斯，
+        按 26 邻接标记连通分量，point_component 为每个可见高斯所属的分量 (0 表示落在主体范围之外)；
+      - point_density: 每个可见高斯所在体素及其邻域内的高斯数。
+    """
+
+    def __init__(self, vertices: np.ndarray, min_opacity: float = 0.05):
+        self.vertices = vertices
+        self.count = len(vertices)
+        names = vertices.dtype.names or ()
+        xyz = np.stack([vertices[axis] for axis in ("x", "y", "z")], axis=1).astype(np.float64)
+        finite = np.isfinite(xyz).all(axis=1)
+        if "opacity" in names:
+            self.opacity = 1.0 / (1.0 + np.exp(-vertices["opacity"].astype(np.float64)))
+        else:
+            self.opacity = np.ones(self.count)
+        self.scales = None
+        if all(f"scale_{i}" in names for i in range(3)):
+            self.scales = np.exp(np.stack([vertices[f"scale_{i}"] for i in range(3)], axis=1).astype(np.float64))
+        self.visible = finite & (self.opacity >= min_opacity)
+        self.points = xyz[self.visible]
+        # 由检查写入：需要剔除的漂浮高斯 (长度为 count 的布尔数组)
+        self.floater_mask: Optional[np.ndarray] = None
+
+        self.extent = 0.0
+        self.point_component = np.zeros(len(self.points), dtype=np.int64)
+        self.point_density = np.zeros(len(self.points), dtype=np.int64)
+        self.component_sizes = np.zeros(1, dtype=np.int64)
+        self.occupancy: Optional[np.ndarray] = None
+        self.voxel_component: Optional[np.ndarray] = None
+        if len(self.points):
+            self._label_components()
+
+    def _label_components(self):
+        # 四分位距围栏：远在主体之外的高斯即使很多也不会撑大包围盒
+        q1, q3 = np.percentile(self.points, [25, 75], axis=0)
+        fence = (q3 - q1) * BODY_FENCE
+        inside = ((self.points >= q1 - fence) & (self.points <= q3 + fence)).all(axis=1)
+        if not inside.any():
+            return
+        low, high = self.points[inside].min(axis=0), self.points[inside].max(axis=0)
+        self.extent = float((high - low).max())
+        if self.extent <= 0:
+            return
+        voxel = self.extent / GAUSSIAN_VOXEL_GRID
+        dims = np.maximum(np.ceil((high - low) / voxel).astype(int), 1)
+        index = tuple(np.minimum(((self.points[inside] - low) / voxel).astype(int), dims - 1).T)
+
+        self.occupancy = np.zeros(dims, dtype=np.int32)
+        np.add.at(self.occupancy, index, 1)
+        # 膨胀一格后再标记，稀疏表面上相隔一两个体素的高斯仍属于同一分量
+        occupied = self.occupancy > 0
+        neighbourhood = np.ones((3, 3, 3), dtype=bool)
+        labels, _ = ndimage.label(ndimage.binary_dilation(occupied, neighbourhood), structure=neighbourhood)
+        self.voxel_component = np.where(occupied, labels, 0)
+        self.point_component[inside] = self.voxel_component[index]
+        # 每个高斯所在体素及其 26 邻域内的高斯数 (局部密度)
+        self.point_density = np.zeros(len(self.points), dtype=np.int64)
+        self.point_density[inside] = ndimage.convolve(self.occupancy, np.ones((3, 3, 3), dtype=np.int32),
+                                                      mode="constant")[index]
+        self.component_sizes = np.bincount(self.point_component)
+        # 主体范围之外的高斯不属于任何分量
+        self.component_sizes[0] = 0
+
+    @property
+    def main_component(self) -> int:
+        return int(np.argmax(self.component_sizes))
+
+
+@register_3d_check("gaussians", criterion=1, min_visible=1000)
+def _check_gaussian_count(stats: GaussianStats, t: Dict[str, float]) -> Tuple[float, Optional[str]]:
+    """可见高斯过少说明模型几乎为空。"""
+    visible = int(stats.visible.sum())
+    if visible < t["min_visible"]:
+        return float(visible), f"模型几乎为空 (可见高斯 {visible} 个)"
+    return float(visible), None
+
+
+@register_3d_check("floaters", criterion=1, min_component_fraction=0.05, min_density=2, max_fraction=0.01,
+                   max_repair_fraction=0.15, repair=1.0)
+def _check_floaters(stats: GaussianStats, t: Dict[str, float]) -> Tuple[float, Optional[str]]:
+    """
+    与主体不连通的小分量、远离主体的高斯以及邻域内高斯数低于 min_density 的孤立高斯视为漂浮碎片。
+    碎片占比不超过 max_fraction 时忽略；不超过 max_repair_fraction 且允许修复时标记剔除 (stats.floater_mask)；否则拒绝。
+    """
+    if not len(stats.points) or stats.component_sizes.max() == 0:
+        return 0.0, None
+    main_size = stats.component_sizes[stats.main_component]
+    kept_components = np.flatnonzero(stats.component_sizes >= main_size * t["min_component_fraction"])
+    floating = ~np.isin(stats.point_component, kept_components) | (stats.point_density < t["min_density"])
+    fraction = float(floating.mean())
+    if fraction <= t["max_fraction"]:
+        return fraction, None
+    if t["repair"] and fraction <= t["max_repair_fraction"]:
+        mask = np.zeros(stats.count, dtype=bool)
+        mask[np.flatnonzero(stats.visible)[floating]] = True
+        stats.floater_mask = mask
+        return fraction, None
+    return fraction, f"模型存在大量悬浮碎片 (占可见高斯 {fraction:.1%})"
+
+
+@register_3d_check("splats", criterion=3, max_scale_of_extent=0.1, max_anisotropy=100.0, max_degenerate=0.1,
+                   max_transparent=0.6)
+def _check_splats(stats: GaussianStats, t: Dict[str, float]) -> Tuple[float, Optional[str]]:
+    """不透明度与尺度的异常统计：几乎透明的高斯过多，或过大 / 针状的退化高斯过多。"""
+    transparent = 1.0 - float(stats.visible.mean()) if stats.count else 0.0
+    if transparent > t["max_transparent"]:
+        return transparent, f"大部分高斯几乎透明 ({transparent:.0%})"
+    if stats.scales is None or stats.extent <= 0:
+        return 0.0, None
+    scales = stats.scales[stats.visible]
+    largest = scales.max(axis=1)
+    huge = largest > stats.extent * t["max_scale_of_extent"]
+    needle = largest > np.maximum(scales.min(axis=1), 1e-12) * t["max_anisotropy"]
+    degenerate = float((huge | needle).mean())
+    if degenerate > t["max_degenerate"]:
+        return degenerate, f"退化高斯过多 (过大或针状的占 {degenerate:.0%})，渲染会出现明显伪影"
+    return degenerate, None
+
+
+@register_3d_check("coverage", criterion=1, max_hole_fraction=0.15)
+def _check_coverage(stats: GaussianStats, t: Dict[str, float]) -> Tuple[float, Optional[str]]:
+    """主体在三个轴向投影中的空洞比例 (被主体包围却没有高斯的面积)，比例过高说明存在破洞或缺失的面。"""
+    if stats.voxel_component is None:
+        return 0.0, None
+    body = stats.voxel_component == stats.main_component
+    worst = 0.0
+    for axis in range(3):
+        silhouette = body.any(axis=axis)
+        filled = ndimage.binary_fill_holes(silhouette)
+        if filled.sum():
+            worst = max(worst, float((filled.sum() - silhouette.sum()) / filled.sum()))
+    if worst > t["max_hole_fraction"]:
+        return worst, f"模型存在明显破洞 (投影空洞占 {worst:.0%})"
+    return worst, None
+
+
+class GaussianPreQA(_PreQARunner):
+    """
+    3D资产的本地几何预检：直接分析高斯PLY (可以是压缩包成员 <zip>!/<成员名>)，在渲染与VLM之前
+    拒绝空模型、大量悬浮碎片、退化高斯和明显破洞；少量悬浮碎片在允许修复时被剔除并写出清理后的PLY。
+    """
+
+    title = "3D几何预检"
+
+    def __init__(self, checks: Optional[List[str]] = None, thresholds: Optional[Dict[str, Dict[str, float]]] = None,
+                 repair_floaters: bool = REPAIR_FLOATERS):
+        super().__init__(PRE_QA_CHECKS_3D, DEFAULT_PRE_QA_CHECKS_3D, checks, thresholds)
+        if "floaters" in self.thresholds:
+            self.thresholds["floaters"]["repair"] = 1.0 if repair_floaters else 0.0
+        self.stats["repaired"] = 0
+
+    def run(self, ply_path: str, cleaned_path: Optional[str] = None) -> PreQAResult:
+        """
+        对一个高斯PLY执行所有启用的检查。通过且标记了漂浮碎片时，把剔除碎片后的模型写到 cleaned_path
+        (为 None 时不写出)，并记录在结果的 cleaned_path 中。
+        """
+        try:
+            with local_media_path(ply_path) as local_path:
+                vertices = PlyData.read(local_path)["vertex"].data.copy()
+            stats = GaussianStats(vertices)
+        except Exception as e:
+            return self._decode_failure(e, "高斯PLY")
+
+        result = self._evaluate(stats)
+        if result.passed and stats.floater_mask is not None:
+            result.metrics["removed_floaters"] = int(stats.floater_mask.sum())
+            if cleaned_path:
+                os.makedirs(os.path.dirname(cleaned_path) or ".", exist_ok=True)
+                PlyData([PlyElement.describe(vertices[~stats.floater_mask], "vertex")]).write(cleaned_path)
+                result.cleaned_path = cleaned_path
+                with self._lock:
+                    self.stats["repaired"] += 1
+        self._count(result)
+        return result
+
+    def print_report(self):
+        super().print_report()
+        if self.stats["checked"]:
+            print(f"   剔除悬浮碎片后继续QA: {self.stats['repaired']}")
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.asset_cache import DEFAULT_CACHE_DIR
+from utils.checkpoint import atomic_write_json
+
+# 改写结果跨运行持久化，与资产缓存放在一起
+DEFAULT_PROMPT_MEMO_DIR = os.environ.get("BUILDING_AGENT_PROMPT_MEMO_DIR", os.path.join(DEFAULT_CACHE_DIR, "prompt_memo"))
+# 进程内 LRU 保留的条目数
+DEFAULT_PROMPT_MEMO_SIZE = int(os.environ.get("BUILDING_AGENT_PROMPT_MEMO_SIZE", 512))
+
+
+def prompt_memo_key(prompt: str, model: str) -> str:
+    """由模型名与完整 prompt 内容计算 key；模板中任何字符的变化都会得到新的 key。"""
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class PromptMemo:
+    """
+    LLM prompt 改写结果的两级缓存:
+      - 进程内 LRU (最多 max_entries 条)；
+      - 磁盘: <root>/<key[:2]>/<key>.json，跨运行共享。
+    同一 key 的并发请求只调用一次模型，其余线程等待同一结果 (single-flight)。
+    模型调用失败 (返回 None 或抛出异常) 时不写入缓存，下次请求会重新调用。
+    """
+
+    def __init__(self, root: Optional[str] = DEFAULT_PROMPT_MEMO_DIR, max_entries: int = DEFAULT_PROMPT_MEMO_SIZE):
+        self.root = root
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "shared": 0}
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def _load(self, key: str) -> Optional[str]:
+        if not self.root:
+            return None
+        path = self._entry_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except (ValueError, KeyError, OSError):
+            return None
+
+    def _store(self, key: str, model: str, response: str):
+        if not self.root:
+            return
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write_json(path, {"key": key, "model": model, "response": response, "created_at": time.time()})
+
+    def _remember(self, key: str, response: str):
+        """写入进程内 LRU (调用方需持有锁)。"""
+        self._lru[key] = response
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get_or_compute(self, prompt: str, model: str, compute: Callable[[], Optional[str]]) -> Tuple[Optional[str], str]:
+        """
+        返回 (改写结果, 来源)。来源为 memory / disk / shared (等待了并发的同一请求) / llm。
+        compute 只在两级缓存都未命中且没有进行中的同一请求时被调用。
+        """
+        key = prompt_memo_key(prompt, model)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._lru[key], "memory"
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[key] = Future()
+            else:
+                self.stats["shared"] += 1
+
+        if not owner:
+            return pending.result(), "shared"
+
+        try:
+            response = self._load(key)
+            source = "disk"
+            if response is None:
+                source = "llm"
+                response = compute()
+                if response is not None:
+                    self._store(key, model, response)
+            with self._lock:
+                self.stats["disk_hits" if source == "disk" else "misses"] += 1
+                if response is not None:
+                    self._remember(key, response)
+            pending.set_result(response)
+            return response, source
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def print_report(self):
+        lookups = sum(self.stats.values())
+        if not lookups:
+            return
+        saved = lookups - self.stats["misses"]
+        print("\n--- 🧠 Prompt改写缓存统计 ---")
+        print(f"   请求: {lookups}, 内存命中: {self.stats['memory_hits']}, 磁盘命中: {self.stats['disk_hits']}, "
+              f"合并并发请求: {self.stats['shared']}, 调用模型: {self.stats['misses']} "
+              f"(节省 {saved / lookups * 100:.1f}%)")
@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import AbstractContextManager
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from utils.tracing import trace_span
+
+# 一次请求最多合并的检查项数；1 表示关闭批量，每个检查项单独请求
+DEFAULT_QA_BATCH_SIZE = int(os.environ.get("BUILDING_AGENT_QA_BATCH_SIZE", 4))
+# 第一个检查项到达后等待同类检查项的最长时间 (毫秒)
+DEFAULT_QA_BATCH_WAIT_MS = float(os.environ.get("BUILDING_AGENT_QA_BATCH_WAIT_MS", 50))
+
+Media = Union[str, Dict[str, str], List[str]]
+
+
+def _media_paths(media: Media) -> List[str]:
+    if isinstance(media, dict):
+        return list(media.values())
+    if isinstance(media, str):
+        return [media]
+    return list(media)
+
+
+def parse_batch_verdicts(response: Optional[str], ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    解析批量QA回复 (按 id 标注的JSON数组)，返回 id -> 结论。
+    容忍 ```json 代码块包裹；缺少 id 时按数组顺序对应。无法解析或缺失的检查项不出现在结果中。
+    """
+    if not response:
+        return {}
+    text = response.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+    if fenced:
+        text = fenced.group(1).strip()
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        verdicts = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(verdicts, list):
+        return {}
+
+    parsed = {}
+    for index, verdict in enumerate(verdicts):
+        if not isinstance(verdict, dict):
+            continue
+        item_id = str(verdict.pop("id", ids[index] if index < len(ids) else ""))
+        if item_id in ids:
+            parsed[item_id] = verdict
+    return parsed
+
+
+class _Item:
+    __slots__ = ("id", "prompt", "media", "full_prompt", "cancel", "future")
+
+    def __init__(self, item_id: str, prompt: str, media: Media, full_prompt: str,
+                 cancel: Optional[threading.Event] = None):
+        self.id = item_id
+        self.prompt = prompt
+        self.media = media
+        self.full_prompt = full_prompt
+        self.cancel = cancel
+        self.future: Future = Future()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.is_set()
+
+
+class _Batch:
+    def __init__(self, instruction: str):
+        self.instruction = instruction
+        self.items: List[_Item] = []
+
+
+class QABatcher:
+    """
+    把并发到达的同类VLM检查 (例如并行候选图、同时完成的多个资产的3D视频) 合并为一次批量请求。
+
+    第一个检查项到达后最多等待 max_wait_ms 收集同类检查项，凑满 max_items 时立即发送；
+    批次由发起等待的线程 (或凑满批次的线程) 在一个后端槽位内发送，其余线程阻塞等待各自的结论。
+    只有一项时直接走单项请求；批量回复中缺失或无法解析的检查项逐个回退到单项请求。
+
+    single_fn(media, prompt) -> str 与 batch_fn(instruction, items) -> str 为模型调用；
+    slot_fn(kind, items) 返回占用后端槽位的上下文管理器。
+    """
+
+    def __init__(self, single_fn: Callable[[Media, str], str], batch_fn: Callable[[str, List[Dict]], str],
+                 slot_fn: Callable[..., AbstractContextManager], max_items: int = DEFAULT_QA_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_QA_BATCH_WAIT_MS):
+        self.single_fn = single_fn
+        self.batch_fn = batch_fn
+        self.slot_fn = slot_fn
+        self.max_items = max(1, max_items)
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        # (kind, instruction) -> 正在收集的批次
+        self._pending: Dict[Tuple[str, str], _Batch] = {}
+        self._seq = 0
+        self.stats = {"items": 0, "requests": 0, "batched_items": 0, "fallbacks": 0, "cancelled": 0}
+
+    def check(self, kind: str, instruction: str, item_prompt: str, media: Media, full_prompt: str,
+              cancel: Optional[threading.Event] = None) -> Optional[str]:
+        """
+        提交一个检查项并阻塞到拿到结论 (JSON字符串，与单项请求的返回格式一致)。
+        instruction 是同类检查项共享的评估说明，item_prompt 是本项特有的说明，full_prompt 用于单项请求。
+        cancel 在请求发出 (拿到后端槽位) 之前被置位时，该项不再送检，返回 None。
+        """
+        if self.max_items == 1:
+            return self._send(kind, instruction, [_Item("0", item_prompt, media, full_prompt, cancel)])[0]
+
+        with self._lock:
+            self._seq += 1
+            item = _Item(str(self._seq), item_prompt, media, full_prompt, cancel)
+            key = (kind, instruction)
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(instruction)
+            batch.items.append(item)
+            leader = len(batch.items) == 1
+            full = len(batch.items) >= self.max_items
+            if full:
+                del self._pending[key]
+
+        if full:
+            self._dispatch(kind, batch)
+        elif leader:
+            time.sleep(self.max_wait)
+            with self._lock:
+                # 批次可能已被凑满它的线程发送
+                mine = self._pending.get(key) is batch
+                if mine:
+                    del self._pending[key]
+            if mine:
+                self._dispatch(kind, batch)
+        return item.future.result()
+
+    def _dispatch(self, kind: str, batch: _Batch):
+        try:
+            results = self._send(kind, batch.instruction, batch.items)
+        except BaseException as e:
+            for item in batch.items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            raise
+        for item, result in zip(batch.items, results):
+            item.future.set_result(result)
+
+    def _live(self, items: List[_Item]) -> List[_Item]:
+        """去掉已取消的检查项 (它们的结论为 None)。"""
+        live = [item for item in items if not item.cancelled]
+        if len(live) < len(items):
+            with self._lock:
+                self.stats["cancelled"] += len(items) - len(live)
+        return live
+
+    def _send(self, kind: str, instruction: str, items: List[_Item]) -> List[Optional[str]]:
+        """发送检查项，返回与 items 对应的结论；在拿到后端槽位之前被取消的检查项不送检，结论为 None。"""
+        results: Dict[str, Optional[str]] = {item.id: None for item in items}
+        live = self._live(items)
+        if not live:
+            return [None] * len(items)
+
+        with self.slot_fn(kind, len(live)) as span:
+            # 排队等待槽位期间被取消的检查项也不再送检
+            live = self._live(live)
+            if live:
+                with self._lock:
+                    self.stats["items"] += len(live)
+                    self.stats["requests"] += 1
+            if len(live) == 1:
+                results[live[0].id] = self.single_fn(live[0].media, live[0].full_prompt)
+                return [results[item.id] for item in items]
+            if not live:
+                return [None] * len(items)
+            response = self.batch_fn(instruction, [
+                {"id": item.id, "prompt": item.prompt, "media_paths": _media_paths(item.media)} for item in live
+            ])
+            span.set("response", response)
+        verdicts = parse_batch_verdicts(response, [item.id for item in live])
+
+        for item in live:
+            if item.id in verdicts:
+                results[item.id] = json.dumps(verdicts[item.id], ensure_ascii=False)
+                continue
+            if item.cancelled:
+                continue
+            # 批量回复中缺失该项，单独重新评估
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["fallbacks"] += 1
+            with trace_span("qa.batch_fallback", "qa", kind=kind), self.slot_fn(kind, 1):
+                results[item.id] = self.single_fn(item.media, item.full_prompt)
+        with self._lock:
+            self.stats["batched_items"] += len(live)
+        return [results[item.id] for item in items]
+
+    def print_report(self):
+        if not self.stats["items"]:
+            return
+        print("\n--- 📦 VLM批量QA统计 ---")
+        print(f"   检查项: {self.stats['items']}, 请求数: {self.stats['requests']}, "
+              f"批量合并的检查项: {self.stats['batched_items']}, 回退单项: {self.stats['fallbacks']}, "
+              f"取消: {self.stats['cancelled']}")
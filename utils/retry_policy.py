@@ -0,0 +1,190 @@
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from utils.asset_cache import DEFAULT_CACHE_DIR
+from utils.checkpoint import atomic_write_json, exclusive_file_lock
+
+# 通过率统计跨运行持久化，与资产缓存放在一起
+DEFAULT_RETRY_STATS_PATH = os.environ.get(
+    "BUILDING_AGENT_RETRY_STATS", os.path.join(DEFAULT_CACHE_DIR, "retry_stats.json")
+)
+# 期望每个资产在预算内最终通过QA的概率
+DEFAULT_TARGET_SUCCESS = float(os.environ.get("BUILDING_AGENT_RETRY_TARGET", 0.95))
+
+# 各阶段的重试参数:
+#   max_attempts   预算上限 (调用方传入的 max_*_retries 会进一步收紧它)
+#   min_attempts   通过率未知或尚可时的最低预算
+#   give_up_below  样本充足且通过率低于该值时只尝试一次，不再为必然失败的资产消耗GPU
+#   error_backoff  QA输出无效 (多半是服务过载) 时的首次退避秒数，指数增长；正常的QA失败不等待
+# 2D 与放置的单次尝试代价低，预算更宽；3D 占用 TRELLIS 独占槽位，预算更紧
+STAGE_PROFILES: Dict[str, Dict[str, float]] = {
+    "2d": {"max_attempts": 4, "min_attempts": 2, "give_up_below": 0.05, "error_backoff": 0.2},
+    "3d": {"max_attempts": 3, "min_attempts": 1, "give_up_below": 0.10, "error_backoff": 1.0},
+    "placement": {"max_attempts": 6, "min_attempts": 2, "give_up_below": 0.02, "error_backoff": 0.2},
+}
+# 样本数少于该值时不据统计提前放弃
+MIN_SAMPLES_TO_GIVE_UP = 6
+# 同一组 failed_criteria 连续出现该次数后提前放弃
+MAX_SAME_CRITERIA_FAILURES = 3
+
+# 2D QA 标准编号 -> 重新生成时追加到 prompt 中的修正要求 (与 _create_2d_qa_prompt 中的清单对应)
+CRITERIA_HINTS_2D = {
+    1: "严格遵循指定的艺术风格，不要混入其他风格元素",
+    2: "准确完整地描绘核心主体，不要添加或遗漏主要部件",
+    3: "使用清晰的等轴测或3/4视角，主体完整居中，无遮挡、无裁切",
+    4: "使用无阴影的均匀全局光照，绝对不要出现任何投射阴影",
+}
+
+REMEDIATION_NEW_SEED = "new_seed"
+REMEDIATION_PROMPT_TWEAK = "prompt_tweak"
+REMEDIATION_GIVE_UP = "give_up"
+
+
+def _add_sample(stats: Dict[str, Dict[str, Any]], key: str, passed: bool, failed_criteria: Optional[List[int]]):
+    entry = stats.setdefault(key, {"attempts": 0, "passes": 0, "failed_criteria": {}})
+    entry["attempts"] += 1
+    if passed:
+        entry["passes"] += 1
+    for criterion in failed_criteria or []:
+        entry["failed_criteria"][str(criterion)] = entry["failed_criteria"].get(str(criterion), 0) + 1
+
+
+def _criteria(qa_result: Optional[Dict[str, Any]]) -> List[int]:
+    return sorted(set(qa_result.get("failed_criteria") or [])) if qa_result else []
+
+
+@dataclass
+class RetryDecision:
+    """一次失败之后的处理决定。"""
+    retry: bool
+    remediation: str
+    delay: float = 0.0
+    hints: List[str] = field(default_factory=list)
+    reason: str = ""
+
+
+class RetryPolicy:
+    """
+    按 (阶段, 资产类型) 统计QA通过率，据此决定每个资产的重试预算和每次失败后的补救方式:
+      - 预算: 用平滑后的通过率估算达到 DEFAULT_TARGET_SUCCESS 所需的尝试次数，并限制在阶段上下限之间；
+        样本充足且几乎从不通过的组合只尝试一次。
+      - 补救: QA给出 failed_criteria 或失败原因时改写 prompt (prompt_tweak)，否则换种子重试 (new_seed)；
+        同一标准在改写后仍连续失败则提前放弃。
+    正常的QA失败立即重试；只有QA输出无效时才按阶段退避。
+    """
+
+    def __init__(self, stats_path: Optional[str] = None, target_success: float = DEFAULT_TARGET_SUCCESS,
+                 profiles: Optional[Dict[str, Dict[str, float]]] = None):
+        self.stats_path = stats_path
+        self.target_success = target_success
+        self.profiles = {**STAGE_PROFILES, **(profiles or {})}
+        self._lock = threading.Lock()
+        self._stats = self._load_stats()
+
+    def _load_stats(self) -> Dict[str, Dict[str, Any]]:
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return {}
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            print("   ⚠️ 重试统计文件损坏，将从空统计开始。")
+            return {}
+
+    @staticmethod
+    def _key(stage: str, asset_type: str) -> str:
+        return f"{stage}/{str(asset_type).strip().lower() or 'unknown'}"
+
+    def pass_rate(self, stage: str, asset_type: str) -> float:
+        """平滑后的通过率 (Beta(1,1) 先验)。"""
+        with self._lock:
+            entry = self._stats.get(self._key(stage, asset_type), {})
+        return (entry.get("passes", 0) + 1) / (entry.get("attempts", 0) + 2)
+
+    def budget(self, stage: str, asset_type: str, cap: Optional[int] = None) -> int:
+        """返回该资产在此阶段的最大尝试次数。cap 为调用方显式指定的上限。"""
+        profile = self.profiles[stage]
+        max_attempts = int(profile["max_attempts"]) if cap is None else max(1, cap)
+        with self._lock:
+            entry = self._stats.get(self._key(stage, asset_type), {})
+        attempts, passes = entry.get("attempts", 0), entry.get("passes", 0)
+        # 放弃判断用原始通过率：平滑先验会让从未通过的组合在很多次失败后仍显得有希望
+        if attempts >= MIN_SAMPLES_TO_GIVE_UP and passes / attempts < profile["give_up_below"]:
+            return 1
+        rate = (passes + 1) / (attempts + 2)
+        if rate >= 1.0:
+            needed = 1
+        else:
+            needed = math.ceil(math.log(1 - self.target_success) / math.log(1 - rate))
+        return max(1, min(max_attempts, max(int(profile["min_attempts"]), needed)))
+
+    def record(self, stage: str, asset_type: str, passed: bool, failed_criteria: Optional[List[int]] = None):
+        """
+        记录一次QA结果并持久化统计。
+        多个进程共用同一统计文件时，在文件锁内重新读取磁盘上的统计再加上本次结果，不会覆盖其他进程的计数。
+        """
+        key = self._key(stage, asset_type)
+        with self._lock:
+            if not self.stats_path:
+                _add_sample(self._stats, key, passed, failed_criteria)
+                return
+            os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+            with exclusive_file_lock(f"{self.stats_path}.lock"):
+                self._stats = self._load_stats()
+                _add_sample(self._stats, key, passed, failed_criteria)
+                atomic_write_json(self.stats_path, self._stats)
+
+    def on_failure(self, stage: str, asset_type: str, attempt: int, budget: int,
+                   qa_result: Optional[Dict[str, Any]], history: List[Optional[Dict[str, Any]]]) -> RetryDecision:
+        """
+        根据本次QA结论决定下一步。qa_result 为 None 表示QA输出无效；
+        history 为本资产此阶段之前各次尝试的QA结论 (不含本次)。
+        """
+        if attempt >= budget:
+            return RetryDecision(False, REMEDIATION_GIVE_UP, reason=f"已用完 {budget} 次尝试预算")
+
+        if qa_result is None:
+            errors = sum(1 for previous in history if previous is None) + 1
+            delay = self.profiles[stage]["error_backoff"] * 2 ** (errors - 1)
+            return RetryDecision(True, REMEDIATION_NEW_SEED, delay=delay, reason="QA输出无效，退避后重试")
+
+        criteria = _criteria(qa_result)
+        recent = history[-(MAX_SAME_CRITERIA_FAILURES - 1):]
+        if criteria and len(recent) == MAX_SAME_CRITERIA_FAILURES - 1 and all(_criteria(r) == criteria for r in recent):
+            # 同一组标准在改写 prompt 之后仍然连续失败，继续重试只是浪费算力
+            return RetryDecision(False, REMEDIATION_GIVE_UP,
+                                 reason=f"标准 {criteria} 连续 {MAX_SAME_CRITERIA_FAILURES} 次未通过")
+
+        hints = [CRITERIA_HINTS_2D[c] for c in criteria if stage == "2d" and c in CRITERIA_HINTS_2D]
+        if not hints and stage == "placement" and qa_result.get("reason"):
+            hints = [f"上一次放置未通过质检: {qa_result['reason']}，请选择不同的位置避免同样的问题"]
+        if hints:
+            return RetryDecision(True, REMEDIATION_PROMPT_TWEAK, hints=hints, reason="; ".join(hints))
+        return RetryDecision(True, REMEDIATION_NEW_SEED, reason=qa_result.get("reason", ""))
+
+    @staticmethod
+    def wait(decision: RetryDecision):
+        if decision.delay > 0:
+            time.sleep(decision.delay)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {key: dict(entry) for key, entry in self._stats.items()}
+
+    def print_report(self):
+        stats = self.report()
+        if not stats:
+            return
+        print("\n--- 🔁 QA通过率与重试预算 ---")
+        print(f"   {'stage/type':<28}{'attempts':>9}{'passes':>8}{'rate':>8}{'budget':>8}")
+        for key in sorted(stats):
+            stage, asset_type = key.split("/", 1)
+            entry = stats[key]
+            rate = entry["passes"] / entry["attempts"] if entry["attempts"] else 0.0
+            budget = self.budget(stage, asset_type) if stage in self.profiles else "-"
+            print(f"   {key:<28}{entry['attempts']:>9}{entry['passes']:>8}{rate * 100:>7.1f}%{budget:>8}")
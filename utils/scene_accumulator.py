@@ -0,0 +1,193 @@
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from plyfile import PlyData, PlyElement
+from scipy.spatial.transform import Rotation as R
+
+from utils.tracing import current_span, trace_span, traced
+
+# 场景缓冲区的初始容量 (高斯数)，之后按倍增扩容
+INITIAL_CAPACITY = 1 << 16
+
+
+@lru_cache(maxsize=32)
+def _read_asset_vertices(abs_path: str, mtime_ns: int) -> np.ndarray:
+    """按 (路径, 修改时间) 缓存资产PLY的顶点数组，同一资产的多个实例只读盘一次。"""
+    data = PlyData.read(abs_path)['vertex'].data
+    data.setflags(write=False)
+    return data
+
+
+def load_asset_vertices(ply_path: str) -> np.ndarray:
+    """
+    读取资产PLY的顶点结构化数组（只读，带缓存）。
+    调用方如需修改数据，必须先 np.copy。
+    """
+    abs_path = os.path.abspath(ply_path)
+    return _read_asset_vertices(abs_path, os.stat(abs_path).st_mtime_ns)
+
+
+def transform_vertices(
+        vertices: np.ndarray,
+        position: Dict[str, float],
+        rotation: Dict[str, float],
+        scale: Optional[Dict[str, float]] = None,
+        out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    按 缩放 -> 旋转(欧拉角 xyz，单位：度) -> 平移 的顺序变换资产顶点的位置，其余属性原样复制。
+
+    结果写入 out (长度与 vertices 相同、字段可以是 vertices 字段的子集，顺序不限)，未提供时新建数组。
+    out 中存在而 vertices 缺少的字段会引发 ValueError。
+    """
+    if out is None:
+        out = np.empty(len(vertices), dtype=vertices.dtype)
+    missing = [name for name in out.dtype.names if name not in vertices.dtype.names]
+    if missing:
+        raise ValueError(f"Asset is missing Gaussian attributes: {missing}")
+
+    pos_array = np.array([position.get('x', 0), position.get('y', 0), position.get('z', 0)], dtype=np.float64)
+    rot_array = [rotation.get('x', 0), rotation.get('y', 0), rotation.get('z', 0)]
+    scale_array = np.ones(3) if scale is None else np.array(
+        [scale.get('x', 1.0), scale.get('y', 1.0), scale.get('z', 1.0)], dtype=np.float64)
+
+    # 缩放与旋转合成一个 3x3 矩阵，一次矩阵乘完成
+    matrix = np.diag(scale_array)
+    if any(r != 0 for r in rot_array):
+        matrix = R.from_euler('xyz', rot_array, degrees=True).as_matrix() @ matrix
+    points = np.stack([vertices['x'], vertices['y'], vertices['z']], axis=1) @ matrix.T + pos_array
+
+    for name in out.dtype.names:
+        if name not in ('x', 'y', 'z'):
+            out[name] = vertices[name]
+    out['x'], out['y'], out['z'] = points[:, 0], points[:, 1], points[:, 2]
+    return out
+
+
+def write_vertices_ply(vertices: np.ndarray, path: str):
+    """把顶点结构化数组写成PLY (先写临时文件再原子替换)。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    PlyData([PlyElement.describe(vertices, 'vertex')]).write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class SceneAccumulator:
+    """
+    常驻内存、可增量增长的高斯场景。
+
+    场景保存在预分配的结构化数组中，容量不足时倍增扩容 (均摊 O(1))；
+    add() 只变换并写入新资产的高斯，合并开销与新资产大小成正比，与场景已有的规模无关。
+
+    新加入的资产先处于暂存状态 (渲染快照时可见)，commit() 确认、rollback() 丢弃；
+    commit() 之后再调用 rollback() 不会产生任何效果。
+    只有 flush() 才会把已确认的部分写成PLY (检查点或运行结束时调用)，场景未变化时不会重复写盘。
+    """
+
+    def __init__(self, dtype: Optional[np.dtype] = None, name: str = "scene", initial_capacity: int = INITIAL_CAPACITY):
+        self.name = name
+        self._initial_capacity = max(1, initial_capacity)
+        self._data: Optional[np.ndarray] = np.empty(0, dtype=dtype) if dtype is not None else None
+        self._size = 0
+        self._committed = 0
+        # 每次确认新的高斯时递增；记录上一次 flush 的 (路径, 版本)，避免重复写盘
+        self._version = 0
+        self._flushed: Optional[Tuple[str, int]] = None
+
+    @classmethod
+    def from_ply(cls, ply_path: str, name: str = "scene") -> "SceneAccumulator":
+        """从已合并的场景PLY (例如检查点中的副本) 恢复，载入的高斯视为已确认。"""
+        data = np.array(PlyData.read(ply_path)['vertex'].data)
+        scene = cls(data.dtype, name=name)
+        scene._data = data
+        scene._size = scene._committed = len(data)
+        scene._flushed = (os.path.abspath(ply_path), scene._version)
+        return scene
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def committed_count(self) -> int:
+        return self._committed
+
+    @property
+    def pending_count(self) -> int:
+        return self._size - self._committed
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._data is None else len(self._data)
+
+    @property
+    def vertices(self) -> np.ndarray:
+        """当前场景 (含暂存资产) 的只读视图，不复制数据；场景再次修改后视图失效。"""
+        if self._data is None:
+            return np.empty(0)
+        view = self._data[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def _reserve(self, count: int, dtype: np.dtype):
+        """保证还能容纳 count 个高斯，容量不足时按倍增扩容。"""
+        if self._data is None:
+            self._data = np.empty(max(count, self._initial_capacity), dtype=dtype)
+            return
+        needed = self._size + count
+        if needed <= len(self._data):
+            return
+        grown = np.empty(max(needed, 2 * len(self._data), self._initial_capacity), dtype=self._data.dtype)
+        grown[:self._size] = self._data[:self._size]
+        self._data = grown
+
+    @traced("gs.merge", "gaussian", attributes=lambda self, asset_ply, *a, **kw: {
+        "asset_ply": os.path.basename(asset_ply)})
+    def add(
+            self,
+            asset_ply: str,
+            position: Dict[str, float],
+            rotation: Dict[str, float],
+            scale: Optional[Dict[str, float]] = None
+    ) -> Tuple[int, int]:
+        """
+        将资产变换后追加到场景末尾 (暂存状态)，返回新高斯在场景中的区间 [start, end)。
+        同一资产的多个实例引用同一路径，只会读盘一次。
+        """
+        if not os.path.exists(asset_ply):
+            raise FileNotFoundError(f"Asset file not found: {asset_ply}")
+        asset_vertices = load_asset_vertices(asset_ply)
+        self._reserve(len(asset_vertices), asset_vertices.dtype)
+
+        start, end = self._size, self._size + len(asset_vertices)
+        transform_vertices(asset_vertices, position, rotation, scale, out=self._data[start:end])
+        self._size = end
+        current_span().update(asset_gaussians=end - start, total_gaussians=end)
+        return start, end
+
+    def commit(self):
+        """确认所有暂存的资产。"""
+        if self._size != self._committed:
+            self._committed = self._size
+            self._version += 1
+
+    def rollback(self):
+        """丢弃所有暂存的资产 (已确认的部分不受影响)。"""
+        self._size = self._committed
+
+    def flush(self, ply_path: str) -> Optional[str]:
+        """
+        把已确认的场景写成PLY并返回路径；场景为空时返回 None。
+        自上次写入同一路径以来场景没有变化时直接返回，不重复写盘。
+        """
+        if self._committed == 0:
+            return None
+        target = (os.path.abspath(ply_path), self._version)
+        if self._flushed == target and os.path.isfile(ply_path):
+            return ply_path
+        with trace_span("gs.flush", "gaussian", gaussians=self._committed):
+            write_vertices_ply(self._data[:self._committed], ply_path)
+        self._flushed = target
+        return ply_path
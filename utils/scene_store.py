@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from plyfile import PlyElement
+
+from utils.scene_accumulator import SceneAccumulator, load_asset_vertices, transform_vertices
+from utils.tracing import current_span, traced
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+@lru_cache(maxsize=256)
+def _file_digest(abs_path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _content_digest(path: str) -> str:
+    """文件内容的 SHA-256 前缀，按 (路径, 修改时间, 大小) 缓存，同一资产的多个实例只计算一次。"""
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    return _file_digest(abs_path, stat.st_mtime_ns, stat.st_size)
+
+
+class SceneStore:
+    """
+    只追加的场景存储: 未变换的单个资产PLY + 记录实例变换的清单。
+
+    目录结构:
+        <root>/manifest.jsonl       # 每行一条操作记录: place / move / remove
+        <root>/assets/<asset_id>-<内容哈希>.ply  # 资产原始 (未变换) 高斯，同一资产的所有实例共用一份
+
+    放置、移动、删除实例都只是向清单追加一行 (O(1))，不会改写任何PLY；
+    变换在渲染 (build_scene) 或导出 (export) 时才应用，导出时逐个资产流式写出最终合并PLY。
+    进程崩溃时清单最多留下写了一半的最后一行，打开时会被截掉。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.assets_dir = os.path.join(root, "assets")
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(self.assets_dir, exist_ok=True)
+        self._repair_tail()
+        # instance_id -> 当前生效的放置记录，保持放置顺序
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        for record in self._read_records():
+            self._apply(record)
+
+    def _repair_tail(self):
+        """截掉清单末尾不完整的一行，避免后续追加的记录与之粘连。"""
+        if not os.path.isfile(self.manifest_path):
+            return
+        with open(self.manifest_path, "rb+") as f:
+            content = f.read()
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+
+    def _read_records(self) -> List[Dict[str, Any]]:
+        if not os.path.isfile(self.manifest_path):
+            return []
+        records = []
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def _apply(self, record: Dict[str, Any]):
+        instance_id = record.get("instance_id")
+        op = record.get("op")
+        if op == "place":
+            # 重新放置同一实例时以最新的记录为准
+            self._entries.pop(instance_id, None)
+            self._entries[instance_id] = {k: v for k, v in record.items() if k not in ("op", "ts")}
+        elif op == "move" and instance_id in self._entries:
+            self._entries[instance_id].update({k: record[k] for k in ("position", "rotation", "scale") if k in record})
+        elif op == "remove":
+            self._entries.pop(instance_id, None)
+
+    def _append(self, record: Dict[str, Any]):
+        record = {**record, "ts": time.time()}
+        with self._lock:
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+
+    def _pin_asset(self, asset_id: str, asset_ply: str) -> str:
+        """
+        把资产原始PLY放进存储目录 (优先硬链接，失败时复制)，返回相对 root 的路径。
+        文件名带内容哈希: 同一资产的多个实例共用一份，同一 asset_id 重新生成后的新内容不会被旧文件顶替。
+        """
+        relative = os.path.join("assets", f"{asset_id}-{_content_digest(asset_ply)}.ply")
+        target = os.path.join(self.root, relative)
+        if os.path.isfile(target) or os.path.abspath(asset_ply) == os.path.abspath(target):
+            return relative
+        tmp_path = f"{target}.tmp.{os.getpid()}.{threading.get_ident()}"
+        try:
+            os.link(asset_ply, tmp_path)
+        except OSError:
+            shutil.copyfile(asset_ply, tmp_path)
+        os.replace(tmp_path, target)
+        return relative
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, instance_id: str) -> bool:
+        return instance_id in self._entries
+
+    def place(self, instance_id: str, asset_id: str, asset_ply: str, position: Dict[str, float],
+              rotation: Dict[str, float], scale: Optional[Dict[str, float]] = None):
+        """记录一个实例的放置 (已放置的实例会被重新放置到清单末尾)。"""
+        if not os.path.exists(asset_ply):
+            raise FileNotFoundError(f"Asset file not found: {asset_ply}")
+        self._append({
+            "op": "place", "instance_id": instance_id, "asset_id": asset_id,
+            "asset_ply": self._pin_asset(asset_id, asset_ply),
+            "position": position, "rotation": rotation, "scale": scale,
+        })
+
+    def move(self, instance_id: str, position: Optional[Dict[str, float]] = None,
+             rotation: Optional[Dict[str, float]] = None, scale: Optional[Dict[str, float]] = None):
+        """修改已放置实例的变换；未提供的分量保持不变。实例不存在时抛出 KeyError。"""
+        if instance_id not in self._entries:
+            raise KeyError(instance_id)
+        changes = {"position": position, "rotation": rotation, "scale": scale}
+        self._append({"op": "move", "instance_id": instance_id, **{k: v for k, v in changes.items() if v is not None}})
+
+    def remove(self, instance_id: str):
+        """从场景中删除实例。实例不存在时抛出 KeyError。"""
+        if instance_id not in self._entries:
+            raise KeyError(instance_id)
+        self._append({"op": "remove", "instance_id": instance_id})
+
+    def clear(self):
+        """删除所有放置记录与资产PLY，回到空场景。"""
+        with self._lock:
+            if os.path.exists(self.manifest_path):
+                os.remove(self.manifest_path)
+            shutil.rmtree(self.assets_dir, ignore_errors=True)
+            os.makedirs(self.assets_dir, exist_ok=True)
+            self._entries.clear()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """当前场景中的实例 (按放置顺序)，asset_ply 为绝对路径。"""
+        return [{**entry, "asset_ply": os.path.join(self.root, entry["asset_ply"])} for entry in self._entries.values()]
+
+    def placed_assets(self) -> List[Dict[str, Any]]:
+        """与组装阶段 placed_assets 相同格式的放置记录。"""
+        return [{"asset_id": entry["asset_id"], "instance_id": entry["instance_id"],
+                 "position": entry["position"], "rotation": entry["rotation"]} for entry in self._entries.values()]
+
+    @traced("scene_store.build", "gaussian")
+    def build_scene(self, name: str = "scene") -> SceneAccumulator:
+        """按清单应用变换，重建内存中的场景 (用于渲染或恢复运行)。"""
+        scene = SceneAccumulator(name=name)
+        for entry in self.entries():
+            scene.add(entry["asset_ply"], entry["position"], entry["rotation"], entry["scale"])
+        scene.commit()
+        current_span().update(instances=len(self), gaussians=len(scene))
+        return scene
+
+    @traced("scene_store.export", "gaussian")
+    def export(self, ply_path: str) -> Optional[str]:
+        """
+        把整个场景导出为一个合并后的二进制PLY并返回路径；场景为空时返回 None。
+        逐个实例变换后直接写入文件，内存占用只与最大的单个资产有关。
+        """
+        entries = self.entries()
+        if not entries:
+            return None
+        counts = [len(load_asset_vertices(entry["asset_ply"])) for entry in entries]
+        dtype = load_asset_vertices(entries[0]["asset_ply"]).dtype.newbyteorder("<")
+        properties = PlyElement.describe(np.empty(0, dtype=dtype), "vertex").properties
+        header = ["ply", "format binary_little_endian 1.0", f"element vertex {sum(counts)}",
+                  *map(str, properties), "end_header"]
+
+        os.makedirs(os.path.dirname(ply_path) or ".", exist_ok=True)
+        tmp_path = f"{ply_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(("\n".join(header) + "\n").encode("ascii"))
+            for entry, count in zip(entries, counts):
+                chunk = np.empty(count, dtype=dtype)
+                transform_vertices(load_asset_vertices(entry["asset_ply"]), entry["position"], entry["rotation"],
+                                   entry["scale"], out=chunk)
+                f.write(chunk.tobytes())
+        os.replace(tmp_path, ply_path)
+        current_span().update(instances=len(entries), gaussians=sum(counts), bytes_written=os.path.getsize(ply_path))
+        return ply_path
@@ -0,0 +1,348 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from utils.tracing import current_span
+
+# 各模型后端的默认并发上限，可通过环境变量覆盖
+DEFAULT_BACKEND_LIMITS = {
+    "qwen_image": int(os.environ.get("QWEN_IMAGE_CONCURRENCY", 2)),
+    "qwen_image_edit": int(os.environ.get("QWEN_IMAGE_EDIT_CONCURRENCY", 1)),
+    "trellis": int(os.environ.get("TRELLIS_CONCURRENCY", 1)),
+    "qwen_vl": int(os.environ.get("QWEN_VL_CONCURRENCY", 4)),
+    "qwen_next": int(os.environ.get("QWEN_NEXT_CONCURRENCY", 4)),
+}
+
+
+DEFAULT_TENANT = "default"
+
+
+class _Ticket:
+    __slots__ = ("seq", "granted")
+
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.granted = threading.Event()
+
+
+class _FairSlots:
+    """
+    单个后端的槽位分配器。
+    空闲槽位优先分配给在途请求数 (按权重归一化) 最少的租户；相同时分配给累计获得服务最少的租户
+    (虚拟时间 = 获得槽位次数 / 权重，新到达的租户追平到当前虚拟时钟，不会因“攒下”的份额长期独占)，
+    再相同时先到先得。只有一个租户时等价于一个 FIFO 信号量。
+    """
+
+    def __init__(self, limit: int, weights: Dict[str, float]):
+        self.limit = limit
+        self.weights = weights
+        self.in_use = 0
+        self.tenant_in_flight: Dict[str, int] = defaultdict(int)
+        self._virtual_time: Dict[str, float] = defaultdict(float)
+        self._virtual_clock = 0.0
+        self._waiting: Dict[str, Deque[_Ticket]] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def acquire(self, tenant: str):
+        with self._lock:
+            ticket = _Ticket(next(self._seq))
+            if tenant not in self._waiting:
+                self._virtual_time[tenant] = max(self._virtual_time[tenant], self._virtual_clock)
+                self._waiting[tenant] = deque()
+            self._waiting[tenant].append(ticket)
+            self._dispatch()
+        ticket.granted.wait()
+
+    def release(self, tenant: str):
+        with self._lock:
+            self.in_use -= 1
+            self.tenant_in_flight[tenant] -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        while self.in_use < self.limit and self._waiting:
+            tenant = min(
+                self._waiting,
+                key=lambda t: (self.tenant_in_flight[t] / self.weights.get(t, 1.0),
+                               self._virtual_time[t], self._waiting[t][0].seq),
+            )
+            queue = self._waiting[tenant]
+            ticket = queue.popleft()
+            if not queue:
+                del self._waiting[tenant]
+            self.in_use += 1
+            self.tenant_in_flight[tenant] += 1
+            self._virtual_clock = self._virtual_time[tenant]
+            self._virtual_time[tenant] += 1.0 / self.weights.get(tenant, 1.0)
+            ticket.granted.set()
+
+
+class BackendPool:
+    """
+    按模型后端划分的并发限制器。
+    每个后端 (Qwen-Image / TRELLIS / Qwen-VL / Qwen-Next) 拥有独立的槽位，
+    并记录调用次数、排队时间、占用时间和峰值并发，用于计算后端利用率。
+
+    多个租户 (例如批量模式下的多个城市) 共享同一个池时，通过 tenant() 取得各自的视图，
+    空闲槽位在租户之间公平分配，避免资产较多的城市独占后端。
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.limits = dict(DEFAULT_BACKEND_LIMITS)
+        if limits:
+            self.limits.update(limits)
+
+        self._tenant_weights: Dict[str, float] = {}
+        self._slots = {name: _FairSlots(limit, self._tenant_weights) for name, limit in self.limits.items()}
+        self._lock = threading.Lock()
+        self._stats = {name: self._empty_stats() for name in self.limits}
+        self._tenant_stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._started_at = time.monotonic()
+
+    def tenant(self, name: str, weight: float = 1.0) -> "TenantBackendPool":
+        """返回某个租户的视图，其 slot() 调用参与租户间的公平分配。weight 越大分得的槽位越多。"""
+        self._tenant_weights[name] = weight
+        return TenantBackendPool(self, name)
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            "calls": 0,
+            "wait_seconds": 0.0,
+            "busy_seconds": 0.0,      # 所有槽位占用时间之和
+            "active_seconds": 0.0,    # 至少有一个请求在途的时间
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "_active_since": None,
+        }
+
+    def reset_clock(self):
+        """清空统计数据并重新开始计时。"""
+        with self._lock:
+            self._stats = {name: self._empty_stats() for name in self.limits}
+            self._tenant_stats = {}
+            self._started_at = time.monotonic()
+
+    @contextmanager
+    def slot(self, backend: str, tenant: str = DEFAULT_TENANT) -> Iterator[None]:
+        """占用指定后端的一个并发槽位，退出时释放。"""
+        if backend not in self._slots:
+            raise KeyError(f"未知的模型后端: {backend}")
+
+        wait_start = time.monotonic()
+        self._slots[backend].acquire(tenant)
+        acquired_at = time.monotonic()
+        span = current_span()
+        span.set("queue_wait_ms", round((acquired_at - wait_start) * 1000, 3))
+
+        with self._lock:
+            stats = self._stats[backend]
+            stats["calls"] += 1
+            stats["wait_seconds"] += acquired_at - wait_start
+            stats["in_flight"] += 1
+            stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+            if stats["in_flight"] == 1:
+                stats["_active_since"] = acquired_at
+            tenant_stats = self._tenant_stats.setdefault((backend, tenant), {"calls": 0, "wait_seconds": 0.0})
+            tenant_stats["calls"] += 1
+            tenant_stats["wait_seconds"] += acquired_at - wait_start
+
+        try:
+            yield
+        finally:
+            released_at = time.monotonic()
+            span.set("slot_held_ms", round((released_at - acquired_at) * 1000, 3))
+            with self._lock:
+                stats = self._stats[backend]
+                stats["busy_seconds"] += released_at - acquired_at
+                stats["in_flight"] -= 1
+                if stats["in_flight"] == 0:
+                    stats["active_seconds"] += released_at - stats["_active_since"]
+                    stats["_active_since"] = None
+            self._slots[backend].release(tenant)
+
+    def utilization(self) -> Dict[str, Dict[str, float]]:
+        """
+        返回每个后端的利用率快照。
+
+        - slot_utilization: 槽位占用时间 / (总时长 * 并发上限)
+        - active_ratio: 后端至少有一个请求在途的时间占比（即GPU非空闲比例）
+        """
+        now = time.monotonic()
+        with self._lock:
+            elapsed = max(now - self._started_at, 1e-9)
+            report = {}
+            for name, stats in self._stats.items():
+                active = stats["active_seconds"]
+                if stats["_active_since"] is not None:
+                    active += now - stats["_active_since"]
+                report[name] = {
+                    "limit": self.limits[name],
+                    "calls": stats["calls"],
+                    "wait_seconds": round(stats["wait_seconds"], 3),
+                    "busy_seconds": round(stats["busy_seconds"], 3),
+                    "peak_in_flight": stats["peak_in_flight"],
+                    "slot_utilization": round(stats["busy_seconds"] / (elapsed * self.limits[name]), 4),
+                    "active_ratio": round(active / elapsed, 4),
+                }
+            return report
+
+    def print_report(self):
+        """以表格形式打印各后端利用率。"""
+        print("\n--- 📊 模型后端利用率 ---")
+        print(f"   {'backend':<16}{'limit':>6}{'calls':>7}{'peak':>6}{'busy(s)':>10}{'wait(s)':>10}{'slot%':>8}{'active%':>9}")
+        for name, stats in self.utilization().items():
+            print(
+                f"   {name:<16}{stats['limit']:>6}{stats['calls']:>7}{stats['peak_in_flight']:>6}"
+                f"{stats['busy_seconds']:>10.1f}{stats['wait_seconds']:>10.1f}"
+                f"{stats['slot_utilization'] * 100:>7.1f}%{stats['active_ratio'] * 100:>8.1f}%"
+            )
+
+        tenants = self.tenant_report()
+        if len({tenant for _, tenant in tenants}) > 1:
+            print(f"\n   {'backend':<16}{'tenant':<24}{'calls':>7}{'wait(s)':>10}")
+            for (backend, tenant), stats in sorted(tenants.items()):
+                print(f"   {backend:<16}{tenant:<24}{stats['calls']:>7}{stats['wait_seconds']:>10.1f}")
+
+    def tenant_report(self) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """每个 (后端, 租户) 的调用次数与累计排队时间。"""
+        with self._lock:
+            return {key: dict(stats) for key, stats in self._tenant_stats.items()}
+
+
+class TenantBackendPool:
+    """BackendPool 的租户视图，接口与 BackendPool.slot 一致，可直接传给各 Agent。"""
+
+    def __init__(self, pool: BackendPool, tenant: str):
+        self.pool = pool
+        self.tenant_name = tenant
+
+    @property
+    def limits(self) -> Dict[str, int]:
+        return self.pool.limits
+
+    def slot(self, backend: str) -> Iterator[None]:
+        return self.pool.slot(backend, self.tenant_name)
+
+
+class AssetScheduler:
+    """
+    资产生成调度器：并发执行多个资产生成任务。
+    真正的并发度由 BackendPool 中各后端的信号量决定，
+    线程池只需足够大，保证每个后端都有排队中的请求可以处理。
+    """
+
+    def __init__(self, asset_generator, backend_pool: BackendPool, max_workers: Optional[int] = None):
+        self.asset_generator = asset_generator
+        self.backend_pool = backend_pool
+        self.max_workers = max_workers or sum(backend_pool.limits.values())
+
+    def run(
+            self,
+            tasks: List[Tuple[str, Dict[str, Any]]],
+            on_complete: Optional[Callable[[str, Optional[Dict[str, Any]]], None]] = None
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        并发运行所有资产任务。
+
+        Args:
+            tasks: (任务key, asset_task) 列表，key 用于回传结果。
+            on_complete: 每个任务完成时的回调 (key, result)，在调用 run 的线程中按完成顺序依次调用。
+
+        Returns:
+            Dict[str, Optional[Dict]]: 任务key到生成结果的映射，失败的任务为 None。
+        """
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        if not tasks:
+            return results
+
+        print(f"\n⚙️  调度器启动: {len(tasks)} 个资产任务, {self.max_workers} 个工作线程, 后端并发上限 {self.backend_pool.limits}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="asset") as executor:
+            futures = {executor.submit(self.asset_generator.run, task): key for key, task in tasks}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    print(f"   🚨 资产任务 '{key}' 执行异常: {e}")
+                    results[key] = None
+                if on_complete:
+                    on_complete(key, results[key])
+
+        return results
+
+
+def building_priority(asset_id: str) -> int:
+    """组装顺序：建筑优先 (0)，其余资产其次 (1)，与组装阶段的 "BUILDING" 排序规则一致。"""
+    return 0 if "BUILDING" in asset_id else 1
+
+
+class AssetStream:
+    """
+    资产生成与场景组装之间的流式队列。
+
+    生成端每完成一个资产，就把它的所有实例记录放入队列；组装端按优先级消费。
+    为了保持“建筑优先”的组装顺序，只要还有更高优先级的资产在生成中，
+    低优先级的实例就会被暂缓交付，直到这些资产完成或失败。
+    """
+
+    def __init__(self, priority_fn: Callable[[str], int] = building_priority):
+        self.priority_fn = priority_fn
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[int, int, Dict[str, str], Dict[str, Any]]] = []
+        self._pending: Dict[str, int] = {}
+        self._sequence = 0
+        self._closed = False
+
+    def expect(self, asset_id: str):
+        """登记一个尚在生成中的资产。"""
+        with self._cond:
+            self._pending[asset_id] = self.priority_fn(asset_id)
+
+    def put(self, asset_id: str, asset_info: Dict[str, Any], instances: List[Dict[str, str]]):
+        """资产已通过QA：将其所有实例放入队列。"""
+        with self._cond:
+            priority = self.priority_fn(asset_id)
+            for instance in instances:
+                heapq.heappush(self._heap, (priority, self._sequence, instance, asset_info))
+                self._sequence += 1
+            self._pending.pop(asset_id, None)
+            self._cond.notify_all()
+
+    def fail(self, asset_id: str):
+        """资产生成失败：不再等待它。"""
+        with self._cond:
+            self._pending.pop(asset_id, None)
+            self._cond.notify_all()
+
+    def close(self):
+        """生成端结束，不会再有新的资产。"""
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def _ready(self) -> bool:
+        if not self._heap:
+            return False
+        if not self._pending:
+            return True
+        return self._heap[0][0] <= min(self._pending.values())
+
+    def __iter__(self) -> Iterator[Tuple[Dict[str, str], Dict[str, Any]]]:
+        while True:
+            with self._cond:
+                while not self._ready() and not (self._closed and not self._heap):
+                    self._cond.wait()
+                if not self._heap:
+                    return
+                _, _, instance, asset_info = heapq.heappop(self._heap)
+            yield instance, asset_info
@@ -0,0 +1,222 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# 当前活跃的 span 栈，使用 contextvars 以同时支持多线程和 asyncio 协程
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _current_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+class Span:
+    """一个计时区间，可附带任意属性 (asset_id、attempt、发送字节数、高斯数量等)。"""
+
+    __slots__ = ("name", "category", "attributes", "start_us", "end_us", "thread_id", "thread_name", "parent")
+
+    def __init__(self, name: str, category: str, attributes: Dict[str, Any], parent: Optional["Span"]):
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.parent = parent
+        self.start_us = time.perf_counter_ns() // 1000
+        self.end_us: Optional[int] = None
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        # 同一事件循环线程上并发的协程各自占用一条轨道，避免 span 在时间轴上交叠
+        task = _current_task()
+        if task is not None:
+            self.thread_id = id(task) & 0x7FFFFFFF
+            self.thread_name = f"{thread.name}/{task.get_name()}"
+
+    def set(self, key: str, value: Any) -> "Span":
+        self.attributes[key] = value
+        return self
+
+    def update(self, **attributes: Any) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+
+class _NoopSpan:
+    """追踪未启用时返回的空 span，调用 set/update 不产生任何开销。"""
+
+    def set(self, key: str, value: Any) -> "_NoopSpan":
+        return self
+
+    def update(self, **attributes: Any) -> "_NoopSpan":
+        return self
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    收集 span 并导出为 Chrome Trace Event 格式 (可直接在 chrome://tracing 或 Perfetto 中打开)。
+    """
+
+    def __init__(self, output_path: str, process_name: str = "BuildingAgent"):
+        self.output_path = output_path
+        self.process_name = process_name
+        self._lock = threading.Lock()
+        self._spans: List[Span] = []
+        self._thread_names: Dict[int, str] = {}
+
+    def _record(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+            self._thread_names.setdefault(span.thread_id, span.thread_name)
+
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": self.process_name}}
+        ]
+        with self._lock:
+            for tid, thread_name in self._thread_names.items():
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+            for span in self._spans:
+                events.append({
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": span.start_us,
+                    "dur": (span.end_us or span.start_us) - span.start_us,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": {k: _jsonable(v) for k, v in span.attributes.items()},
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, output_path: Optional[str] = None) -> str:
+        """将所有已结束的 span 写入 JSON 文件，返回文件路径。"""
+        path = output_path or self.output_path
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        print(f"🧭 追踪文件已写入: {path} (共 {len(self._spans)} 个span)")
+        return path
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按 span 名称汇总调用次数和总耗时 (秒)。"""
+        totals: Dict[str, Dict[str, float]] = {}
+        for span in self.spans():
+            entry = totals.setdefault(span.name, {"count": 0, "total_seconds": 0.0})
+            entry["count"] += 1
+            entry["total_seconds"] += ((span.end_us or span.start_us) - span.start_us) / 1e6
+        return totals
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return str(value)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def start_tracing(output_path: str, process_name: str = "BuildingAgent") -> Tracer:
+    """启用全局追踪。之后所有 trace_span 都会被记录。"""
+    global _tracer
+    _tracer = Tracer(output_path, process_name)
+    return _tracer
+
+
+def stop_tracing(write: bool = True) -> Optional[str]:
+    """停用全局追踪，默认将结果写入文件并返回路径。"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return None
+    return tracer.write() if write else None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def current_span():
+    """返回当前上下文中的 span；未启用追踪时返回空 span。"""
+    return _current_span.get() or _NOOP_SPAN
+
+
+@contextmanager
+def trace_span(name: str, category: str = "pipeline", **attributes: Any) -> Iterator[Any]:
+    """
+    记录一个 span。用法:
+
+        with trace_span("qa.2d", "vlm", asset_id=asset_id, attempt=attempt) as span:
+            ...
+            span.set("passed", True)
+
+    追踪未启用时几乎没有开销。
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield _NOOP_SPAN
+        return
+
+    span = Span(name, category, dict(attributes), _current_span.get())
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        span.end_us = time.perf_counter_ns() // 1000
+        _current_span.reset(token)
+        tracer._record(span)
+
+
+def traced(name: Optional[str] = None, category: str = "pipeline",
+           attributes: Optional[Callable[..., Dict[str, Any]]] = None):
+    """
+    函数装饰器版本的 trace_span，同时支持普通函数和协程函数。
+    attributes 可以是一个接收相同参数、返回属性字典的函数。
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                attrs = attributes(*args, **kwargs) if attributes and _tracer else {}
+                with trace_span(span_name, category, **attrs):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            attrs = attributes(*args, **kwargs) if attributes and _tracer else {}
+            with trace_span(span_name, category, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
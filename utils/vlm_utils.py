@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import io
 import json
@@ -5,9 +6,13 @@ import os
 import sys
 
 import cv2  # OpenCV for video processing
-import requests
+import httpx
 from PIL import Image
 
+from utils.async_http import get_async_client, run_sync
+from utils.model_package import local_media_path, media_exists, open_media
+from utils.tracing import current_span, traced
+
 
 # --- 1. 辅助函数：媒体处理与编码 ---
 
@@ -34,9 +39,9 @@ def _compress_image_data(image_data: bytes, max_size: tuple = (1024, 1024), qual
 
 def _encode_image_to_base64(image_path: str, max_size: tuple = (1024, 1024), quality: int = 75) -> str:
     """
-    读取、压缩本地图片并编码为Base64字符串。
+    读取、压缩本地图片 (或压缩包成员) 并编码为Base64字符串。
     """
-    with open(image_path, "rb") as image_file:
+    with open_media(image_path) as image_file:
         compressed_data = _compress_image_data(image_file.read(), max_size, quality)
         return base64.b64encode(compressed_data).decode('utf-8')
 
@@ -52,7 +57,7 @@ def _process_video_to_base64_frames(
     从视频文件中按指定频率提取帧，压缩后编码为Base64字符串列表。
 
     Args:
-        video_path (str): 视频文件路径。
+        video_path (str): 视频文件路径，或压缩包成员路径 <zip>!/<成员名>。
         sample_rate_hz (int, optional): 每秒采样多少帧。默认为 1。
         max_frames (int, optional): 最多提取的帧数，防止视频过长。默认为 20。
         max_size (tuple, optional): 每帧图像的最大尺寸。默认为 (1024, 1024)。
@@ -61,6 +66,12 @@ def _process_video_to_base64_frames(
     Returns:
         list[str]: 包含多张Base64编码帧的列表。
     """
+    with local_media_path(video_path) as local_path:  # OpenCV 只能按文件路径解码视频
+        return _sample_video_frames(local_path, sample_rate_hz, max_frames, max_size, quality)
+
+
+def _sample_video_frames(video_path: str, sample_rate_hz: int, max_frames: int, max_size: tuple,
+                         quality: int) -> list[str]:
     base64_frames = []
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
@@ -108,9 +119,58 @@ def _process_video_to_base64_frames(
     return base64_frames
 
 
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv'}
+
+
+def _build_media_content(
+        media_paths: list[str],
+        image_max_size: tuple = (1024, 1024),
+        image_quality: int = 75,
+        video_sample_rate_hz: int = 1,
+        video_max_frames: int = 20
+) -> list[dict]:
+    """
+    读取、压缩并编码媒体文件，返回 OpenAI 多模态 content 中的 image_url 片段列表。
+    """
+    content = []
+
+    for path in media_paths:
+        if not media_exists(path):
+            print(f"警告: 文件不存在 {path}，将跳过。")
+            continue
+
+        ext = os.path.splitext(path)[1].lower()
+
+        if ext in IMAGE_EXTENSIONS:
+            print(f"正在处理图片: {os.path.basename(path)}")
+            base64_media = _encode_image_to_base64(path, image_max_size, image_quality)
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{base64_media}"}
+            })
+
+        elif ext in VIDEO_EXTENSIONS:
+            print(f"正在处理视频: {os.path.basename(path)}")
+            base64_frames = _process_video_to_base64_frames(
+                path, video_sample_rate_hz, video_max_frames, image_max_size, image_quality
+            )
+            for frame in base64_frames:
+                content.append({
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{frame}"}
+                })
+        else:
+            print(f"警告: 不支持的文件类型 {ext}，文件 {path} 将被跳过。")
+
+    return content
+
+
 # --- 2. 主函数：统一的多模态API调用 ---
 
-def call_vlm_api (
+@traced("vlm.call", "http", attributes=lambda text_prompt, media_paths, model_name, *a, **kw: {
+    "model": model_name, "media_files": len(media_paths)})
+async def acall_vlm_api(
         text_prompt: str,
         media_paths: list[str],
         model_name: str,
@@ -125,7 +185,8 @@ def call_vlm_api (
         video_max_frames: int = 20
 ) -> str | None:
     """
-    向本地多模态LLM发送一个包含文本、图像和视频的请求。
+    异步向本地多模态LLM发送一个包含文本、图像和视频的请求，复用共享的 httpx 连接池。
+    媒体编码在线程池中完成，不阻塞事件循环。
 
     Args:
         text_prompt (str): 文本提示。
@@ -143,40 +204,17 @@ def call_vlm_api (
     Returns:
         str | None: 返回模型的文本响应。如果出错则返回None。
     """
-    IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
-    VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv'}
-
     # 1. 构建 payload 的 content 部分
     content = [{"type": "text", "text": text_prompt}]
+    content.extend(await asyncio.to_thread(
+        _build_media_content, media_paths, image_max_size, image_quality, video_sample_rate_hz, video_max_frames
+    ))
+    return await _achat_completion(content, model_name, base_url, max_tokens, temperature, stream)
 
-    for path in media_paths:
-        if not os.path.exists(path):
-            print(f"警告: 文件不存在 {path}，将跳过。")
-            continue
-
-        ext = os.path.splitext(path)[1].lower()
-
-        if ext in IMAGE_EXTENSIONS:
-            print(f"正在处理图片: {os.path.basename(path)}")
-            base64_media = _encode_image_to_base64(path, image_max_size, image_quality)
-            content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{base64_media}"}
-            })
-
-        elif ext in VIDEO_EXTENSIONS:
-            print(f"正在处理视频: {os.path.basename(path)}")
-            base64_frames = _process_video_to_base64_frames(
-                path, video_sample_rate_hz, video_max_frames, image_max_size, image_quality
-            )
-            for frame in base64_frames:
-                content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{frame}"}
-                })
-        else:
-            print(f"警告: 不支持的文件类型 {ext}，文件 {path} 将被跳过。")
 
+async def _achat_completion(content: list[dict], model_name: str, base_url: str, max_tokens: int,
+                            temperature: float, stream: bool) -> str | None:
+    """发送一条多模态 user 消息并返回模型回复文本，出错时返回 None。"""
     # 2. 准备请求
     payload = {
         "model": model_name,
@@ -185,22 +223,26 @@ def call_vlm_api (
         "temperature": temperature,
         "stream": stream,
     }
-    headers = {"Content-Type": "application/json"}
     api_url = f"{base_url}/v1/chat/completions"
+    client = get_async_client()
+    current_span().update(
+        num_images=sum(1 for part in content if part["type"] == "image_url"),
+        bytes_sent=len(json.dumps(payload)),
+    )
 
     # 3. 发送请求并处理响应
     try:
         print(f"\n正在向 {api_url} 发送请求...")
-        response = requests.post(api_url, headers=headers, data=json.dumps(payload), stream=stream)
-        response.raise_for_status()  # 如果状态码不是 2xx，则抛出异常
-
-        full_response_content = ""
 
         if stream:
-            print("模型流式返回结果:")
-            for line in response.iter_lines():
-                if line:
-                    decoded_line = line.decode('utf-8')
+            full_response_content = ""
+            async with client.stream("POST", api_url, json=payload) as response:
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()  # 如果状态码不是 2xx，则抛出异常
+
+                print("模型流式返回结果:")
+                async for decoded_line in response.aiter_lines():
                     if decoded_line.startswith('data: '):
                         # 移除 "data: " 前缀
                         json_str = decoded_line[6:]
@@ -219,22 +261,123 @@ def call_vlm_api (
             return full_response_content
 
         else:  # 非流式
+            response = await client.post(api_url, json=payload)
+            response.raise_for_status()  # 如果状态码不是 2xx，则抛出异常
             print("模型正在一次性生成结果...")
             result = response.json()
             full_response_content = result['choices'][0]['message']['content']
             return full_response_content
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPStatusError as e:
         print(f"\n请求失败: {e}")
         # 尝试打印更详细的错误信息
-        if e.response is not None:
-            print(f"响应内容: {e.response.text}")
+        print(f"响应内容: {e.response.text}")
+        return None
+    except httpx.RequestError as e:
+        print(f"\n请求失败: {e}")
         return None
     except Exception as e:
         print(f"\n处理请求时发生未知错误: {e}")
         return None
 
 
+def call_vlm_api (
+        text_prompt: str,
+        media_paths: list[str],
+        model_name: str,
+        base_url: str,
+        max_tokens: int = 8192,
+        temperature: float = 0.7,
+        stream: bool = False,
+        # 媒体处理选项
+        image_max_size: tuple = (1024, 1024),
+        image_quality: int = 75,
+        video_sample_rate_hz: int = 1,
+        video_max_frames: int = 20
+) -> str | None:
+    """
+    向本地多模态LLM发送一个包含文本、图像和视频的请求 (同步版本)。
+    acall_vlm_api 的薄包装，参数与返回值相同。
+    """
+    return run_sync(acall_vlm_api(
+        text_prompt, media_paths, model_name, base_url, max_tokens, temperature, stream,
+        image_max_size, image_quality, video_sample_rate_hz, video_max_frames
+    ))
+
+
+# --- 批量QA：多个独立检查项合并为一次请求 ---
+
+BATCH_OUTPUT_INSTRUCTION = """
+### 批量输出格式
+以上共有 {count} 个相互独立的检查项，请分别评估每一项 (只依据该检查项自己的图片/视频)。
+你的回答必须是一个JSON数组，不含任何其它说明性文本，数组中每个元素对应一个检查项，并包含该检查项的 "id" 字段：
+[{{"id": "<检查项id>", ...该检查项要求的其余字段...}}, ...]
+"""
+
+
+def _build_batch_content(instruction: str, items: list[dict], image_max_size: tuple, image_quality: int,
+                         video_sample_rate_hz: int, video_max_frames: int) -> list[dict]:
+    """共享的评估说明只出现一次，随后依次是每个检查项的文字说明及其媒体。"""
+    content = [{"type": "text", "text": instruction}]
+    for item in items:
+        content.append({"type": "text", "text": f"\n### 检查项 id={item['id']}\n{item['prompt']}"})
+        content.extend(_build_media_content(
+            item["media_paths"], image_max_size, image_quality, video_sample_rate_hz, video_max_frames
+        ))
+    content.append({"type": "text", "text": BATCH_OUTPUT_INSTRUCTION.format(count=len(items))})
+    return content
+
+
+@traced("vlm.batch_call", "http", attributes=lambda instruction, items, model_name, *a, **kw: {
+    "model": model_name, "items": len(items)})
+async def acall_vlm_batch_api(
+        instruction: str,
+        items: list[dict],
+        model_name: str,
+        base_url: str,
+        max_tokens: int = 8192,
+        temperature: float = 0.7,
+        image_max_size: tuple = (1024, 1024),
+        image_quality: int = 75,
+        video_sample_rate_hz: int = 1,
+        video_max_frames: int = 20
+) -> str | None:
+    """
+    把多个独立的QA检查项打包为一次对话请求，共享的评估说明只发送一次以节省 prefill。
+
+    Args:
+        instruction (str): 所有检查项共用的评估说明与判定标准。
+        items (list[dict]): 检查项列表，每项为 {"id": str, "prompt": str, "media_paths": list[str]}。
+        其余参数同 acall_vlm_api。
+
+    Returns:
+        str | None: 模型回复 (应为按 id 标注的JSON数组)，用 utils.qa_batcher.parse_batch_verdicts 解析；出错时返回 None。
+    """
+    content = await asyncio.to_thread(
+        _build_batch_content, instruction, items, image_max_size, image_quality, video_sample_rate_hz, video_max_frames
+    )
+    return await _achat_completion(content, model_name, base_url, max_tokens, temperature, False)
+
+
+def call_vlm_batch_api(
+        instruction: str,
+        items: list[dict],
+        model_name: str,
+        base_url: str,
+        max_tokens: int = 8192,
+        temperature: float = 0.7,
+        image_max_size: tuple = (1024, 1024),
+        image_quality: int = 75,
+        video_sample_rate_hz: int = 1,
+        video_max_frames: int = 20
+) -> str | None:
+    """acall_vlm_batch_api 的同步版本。"""
+    return run_sync(acall_vlm_batch_api(
+        instruction, items, model_name, base_url, max_tokens, temperature,
+        image_max_size, image_quality, video_sample_rate_hz, video_max_frames
+    ))
+
+
 # --- 3. 示例用法 ---
 if __name__ == "__main__":
 
@@ -0,0 +1,403 @@
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.checkpoint import atomic_write_json, pin_asset_files
+
+DEFAULT_QUEUE_DB = os.environ.get("BUILDING_AGENT_QUEUE_DB", "work_queue.sqlite")
+DEFAULT_STORE_DIR = os.environ.get("BUILDING_AGENT_STORE_DIR", "asset_store")
+DEFAULT_LEASE_SECONDS = float(os.environ.get("BUILDING_AGENT_LEASE_SECONDS", 60))
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("BUILDING_AGENT_TASK_MAX_ATTEMPTS", 3))
+# 改款任务等待原资产概念图的上限；超时后改为完整生成
+DEFAULT_CONCEPT_WAIT_SECONDS = float(os.environ.get("BUILDING_AGENT_CONCEPT_WAIT_SECONDS", 1800))
+# WAL 模式并发性能最好，但不支持网络文件系统；跨节点共享数据库文件时应设为 DELETE
+QUEUE_JOURNAL_MODE = os.environ.get("BUILDING_AGENT_QUEUE_JOURNAL_MODE", "WAL")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id          TEXT PRIMARY KEY,
+    priority         INTEGER NOT NULL DEFAULT 0,
+    payload          TEXT NOT NULL,
+    status           TEXT NOT NULL DEFAULT 'pending',   -- pending | leased | done | failed
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    max_attempts     INTEGER NOT NULL,
+    lease_owner      TEXT,
+    lease_expires_at REAL,
+    result           TEXT,
+    error            TEXT,
+    created_at       REAL NOT NULL,
+    updated_at       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_ready ON tasks (status, priority, created_at);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class LeasedTask:
+    """一个被 worker 租用的任务。"""
+
+    __slots__ = ("task_id", "payload", "attempts", "lease_expires_at")
+
+    def __init__(self, task_id: str, payload: Dict[str, Any], attempts: int, lease_expires_at: float):
+        self.task_id = task_id
+        self.payload = payload
+        self.attempts = attempts
+        self.lease_expires_at = lease_expires_at
+
+
+class SQLiteTaskQueue:
+    """
+    基于 SQLite 的持久化任务队列，无需任何外部服务。
+
+    - publish: 发布任务 (按 task_id 幂等)
+    - lease: worker 原子地租用一个待处理任务，租约在 lease_seconds 后过期
+    - heartbeat: 续租；worker 进程崩溃后租约自然过期，任务被重新投递给其他 worker
+    - complete / fail: 提交结果；偶发失败的任务在 max_attempts 次以内重新排队，确定性的失败直接标记为失败
+
+    多个进程 (以及共享文件系统上的多个节点) 可同时访问同一个数据库文件。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_QUEUE_DB, journal_mode: str = QUEUE_JOURNAL_MODE):
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接；写事务使用 BEGIN IMMEDIATE 保证租用的原子性。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- 生产者 ---
+
+    def publish(self, task_id: str, payload: Dict[str, Any], priority: int = 0,
+                max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+        """发布一个任务；task_id 已存在时不做任何修改并返回 False。"""
+        now = time.time()
+
+        def insert(conn):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO tasks (task_id, priority, payload, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (task_id, priority, json.dumps(payload, ensure_ascii=False), max_attempts, now, now),
+            )
+            return cursor.rowcount == 1
+
+        return self._write(insert)
+
+    def results(self, task_ids: List[str]) -> Dict[str, Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+        """返回已结束 (done / failed) 任务的 (状态, 结果, 错误)。"""
+        finished = {}
+        conn = self._conn()
+        for start in range(0, len(task_ids), 500):
+            chunk = task_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT task_id, status, result, error FROM tasks "
+                f"WHERE status IN ('done', 'failed') AND task_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                result = json.loads(row["result"]) if row["result"] else None
+                finished[row["task_id"]] = (row["status"], result, row["error"])
+        return finished
+
+    def requeue(self, task_id: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """将一个已失败的任务重新置为待处理 (例如恢复运行时重试)。"""
+        self._write(lambda conn: conn.execute(
+            "UPDATE tasks SET status='pending', attempts=0, max_attempts=?, error=NULL, lease_owner=NULL, "
+            "lease_expires_at=NULL, updated_at=? WHERE task_id=? AND status='failed'",
+            (max_attempts, time.time(), task_id),
+        ))
+
+    def status(self, task_id: str) -> Optional[str]:
+        """任务当前的状态 (pending / leased / done / failed)；任务不存在时返回 None。"""
+        row = self._conn().execute("SELECT status FROM tasks WHERE task_id=?", (task_id,)).fetchone()
+        return row["status"] if row else None
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    # --- 消费者 ---
+
+    def lease(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[LeasedTask]:
+        """
+        租用优先级最高的待处理任务。租约已过期的任务 (worker 崩溃或失联) 会被重新投递；
+        已达到 max_attempts 的过期任务被标记为失败。
+        """
+        def take(conn):
+            now = time.time()
+            conn.execute(
+                "UPDATE tasks SET status='failed', error='lease expired after max attempts', lease_owner=NULL, "
+                "updated_at=? WHERE status='leased' AND lease_expires_at < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            row = conn.execute(
+                "SELECT task_id, payload, attempts FROM tasks "
+                "WHERE status='pending' OR (status='leased' AND lease_expires_at < ?) "
+                "ORDER BY priority, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            expires_at = now + lease_seconds
+            conn.execute(
+                "UPDATE tasks SET status='leased', attempts=attempts+1, lease_owner=?, lease_expires_at=?, "
+                "updated_at=? WHERE task_id=?",
+                (worker_id, expires_at, now, row["task_id"]),
+            )
+            return LeasedTask(row["task_id"], json.loads(row["payload"]), row["attempts"] + 1, expires_at)
+
+        return self._write(take)
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """续租。返回 False 表示租约已丢失 (已过期并被其他 worker 接手)。"""
+        def extend(conn):
+            now = time.time()
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires_at=?, updated_at=? "
+                "WHERE task_id=? AND status='leased' AND lease_owner=?",
+                (now + lease_seconds, now, task_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+        return self._write(extend)
+
+    def complete(self, task_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """提交结果。只有当前租约持有者的提交才生效。"""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE tasks SET status='done', result=?, error=NULL, lease_owner=NULL, updated_at=? "
+            "WHERE task_id=? AND status='leased' AND lease_owner=?",
+            (json.dumps(result, ensure_ascii=False), time.time(), task_id, worker_id),
+        ).rowcount == 1)
+
+    def fail(self, task_id: str, worker_id: str, error: str, retry: bool = True) -> bool:
+        """
+        报告失败。retry 为 True (异常等偶发错误) 且未达到 max_attempts 时任务重新排队，否则标记为失败；
+        确定性的失败 (例如重试策略已放弃的QA失败) 应传 retry=False，避免重新投递后重复消耗GPU。
+        """
+        return self._write(lambda conn: conn.execute(
+            "UPDATE tasks SET status=CASE WHEN ? OR attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+            "error=?, lease_owner=NULL, lease_expires_at=NULL, updated_at=? "
+            "WHERE task_id=? AND status='leased' AND lease_owner=?",
+            (not retry, error, time.time(), task_id, worker_id),
+        ).rowcount == 1)
+
+
+class LeaseHeartbeat:
+    """后台线程定期续租，直到 stop() 被调用；租约丢失时 lost 置为 True。"""
+
+    def __init__(self, queue: SQLiteTaskQueue, task_id: str, worker_id: str,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.queue = queue
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{task_id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.task_id, self.worker_id, self.lease_seconds):
+                    self.lost = True
+                    print(f"   ⚠️ 任务 '{self.task_id}' 的租约已丢失，结果将被丢弃。")
+                    return
+            except sqlite3.Error as e:
+                print(f"   ⚠️ 任务 '{self.task_id}' 续租失败: {e}")
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class SharedAssetStore:
+    """
+    跨节点共享的资产存储 (应位于共享文件系统上)。
+    worker 将生成的资产文件复制到 <root>/<task_id>/ 并写入 asset.json，编排进程从这里读取。
+    每个资产独占一个目录且所有写入均为原子操作，多进程并发写入无需加锁。
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _asset_dir(self, task_id: str) -> str:
+        return os.path.join(self.root, task_id.replace("/", "__"))
+
+    def put(self, task_id: str, asset: Dict[str, Any]) -> Dict[str, Any]:
+        asset_dir = self._asset_dir(task_id)
+        pinned = pin_asset_files(asset, asset_dir)
+        atomic_write_json(os.path.join(asset_dir, "asset.json"), pinned)
+        return pinned
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self._asset_dir(task_id), "asset.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+    # --- 概念图交接 (原资产 -> 改款资产) ---
+
+    def _concept_meta(self, task_id: str) -> str:
+        return os.path.join(self.root, "concepts", task_id.replace("/", "__") + ".json")
+
+    def put_concept(self, task_id: str, image_path: Optional[str]):
+        """
+        发布任务通过2D QA的概念图 (复制到共享存储)；image_path 为 None 表示生成失败。
+        已发布的概念图不会被之后的失败通知覆盖 (重新投递的任务可以用新的概念图覆盖失败通知)。
+        """
+        meta_path = self._concept_meta(task_id)
+        if image_path is None:
+            if self.get_concept(task_id)[1] is None:
+                os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+                atomic_write_json(meta_path, {"image_path": None})
+            return
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        target = meta_path[:-len(".json")] + os.path.splitext(image_path)[1]
+        tmp_path = f"{target}.tmp.{os.getpid()}.{threading.get_ident()}"
+        shutil.copyfile(image_path, tmp_path)
+        os.replace(tmp_path, target)
+        atomic_write_json(meta_path, {"image_path": target})
+
+    def get_concept(self, task_id: str) -> Tuple[bool, Optional[str]]:
+        """返回 (是否已发布, 概念图路径)。"""
+        meta_path = self._concept_meta(task_id)
+        if not os.path.exists(meta_path):
+            return False, None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return True, json.load(f).get("image_path")
+
+
+class SharedConceptChannel:
+    """
+    worker 之间通过共享资产存储交接概念图: 原资产任务在概念图通过QA后发布，
+    改款任务 (可能在另一个节点上) 轮询等待，原资产任务结束仍未发布、失败或超时时返回 None。
+    """
+
+    def __init__(self, queue: SQLiteTaskQueue, store: SharedAssetStore, concept_key: Optional[str],
+                 parent_key: Optional[str], poll_interval: float = 2.0, timeout: float = DEFAULT_CONCEPT_WAIT_SECONDS):
+        self.queue = queue
+        self.store = store
+        self.concept_key = concept_key
+        self.parent_key = parent_key
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._published = False
+
+    def publish(self, image_path: Optional[str]):
+        """发布本任务的概念图；同一任务只有第一次发布生效。"""
+        if self.concept_key is None or self._published:
+            return
+        self.store.put_concept(self.concept_key, image_path)
+        self._published = True
+
+    def wait_parent(self) -> Optional[str]:
+        if self.parent_key is None:
+            return None
+        deadline = time.monotonic() + self.timeout
+        while True:
+            # 先读状态再读概念图: 任务结束时概念图 (如果有) 一定已经发布
+            status = self.queue.status(self.parent_key)
+            published, image_path = self.store.get_concept(self.parent_key)
+            if image_path or (published and status in ("done", "failed")):
+                return image_path
+            if status in (None, "done", "failed") or time.monotonic() > deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+
+class DistributedAssetScheduler:
+    """
+    与 AssetScheduler 接口一致的分布式调度器：把资产任务发布到任务队列，
+    由任意节点上的 asset_worker.py 进程消费，并在结果写回后按完成顺序回调 on_complete。
+    """
+
+    def __init__(self, queue: SQLiteTaskQueue, namespace: str, priority_fn: Optional[Callable[[str], int]] = None,
+                 poll_interval: float = 1.0, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.queue = queue
+        self.namespace = namespace
+        self.priority_fn = priority_fn
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+
+    def task_id(self, key: str) -> str:
+        return f"{self.namespace}/{key}"
+
+    def run(
+            self,
+            tasks: List[Tuple[str, Dict[str, Any]]],
+            on_complete: Optional[Callable[[str, Optional[Dict[str, Any]]], None]] = None
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """发布所有任务并等待它们结束。失败的任务结果为 None。"""
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        if not tasks:
+            return results
+
+        pending = {}
+        for key, task in tasks:
+            task_id = self.task_id(key)
+            # 改款任务与原资产同一优先级、在其之后发布，worker 总是先租到原资产，不会空等尚未开始的原资产
+            parent = task.get("variant_of")
+            priority = self.priority_fn(parent or key) if self.priority_fn else 0
+            payload = {"asset_task": task, "concept_key": task_id}
+            if parent:
+                payload["parent_concept_key"] = self.task_id(parent)
+            if not self.queue.publish(task_id, payload, priority, self.max_attempts):
+                # 恢复运行时重新发布同一批任务：已失败的任务重新排队，其余沿用原状态
+                self.queue.requeue(task_id, self.max_attempts)
+            pending[task_id] = key
+
+        print(f"\n📮 已发布 {len(pending)} 个资产任务到队列 {self.queue.db_path} (命名空间 '{self.namespace}')，"
+              f"等待 worker 处理: python asset_worker.py --queue-db {self.queue.db_path}")
+
+        while pending:
+            finished = self.queue.results(list(pending))
+            for task_id, (status, result, error) in finished.items():
+                key = pending.pop(task_id)
+                if status == "failed":
+                    print(f"   🚨 资产任务 '{key}' 失败: {error}")
+                    result = None
+                results[key] = result
+                if on_complete:
+                    on_complete(key, result)
+            if pending:
+                time.sleep(self.poll_interval)
+
+        return results
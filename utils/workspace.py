@@ -0,0 +1,205 @@
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+DEFAULT_WORKSPACE_ROOT = os.environ.get("BUILDING_AGENT_WORKSPACE_ROOT", "tmp")
+DEFAULT_WORKSPACE_QUOTA = int(float(os.environ.get("BUILDING_AGENT_WORKSPACE_QUOTA_GB", 5)) * 1024 ** 3)
+# 设置后运行结束时保留工作目录 (调试用)；默认删除，检查点已复制恢复所需的文件
+KEEP_WORKSPACE = os.environ.get("BUILDING_AGENT_KEEP_WORKSPACE", "") not in ("", "0")
+
+_OWNER_FILE = ".owner.json"
+
+
+def _path_size(path: str) -> int:
+    if os.path.isdir(path):
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove_path(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_stale_workspaces(root: str = DEFAULT_WORKSPACE_ROOT) -> int:
+    """删除本机上所属进程已退出的工作目录 (崩溃的运行遗留的)，返回删除的目录数。其他主机与仍在运行的工作目录不受影响。"""
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    host = socket.gethostname()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        owner_path = os.path.join(path, _OWNER_FILE)
+        if not os.path.isfile(owner_path):
+            continue
+        try:
+            with open(owner_path, "r", encoding="utf-8") as f:
+                owner = json.load(f)
+        except (ValueError, OSError):
+            continue
+        if owner.get("host") == host and not _pid_alive(int(owner.get("pid", 0))):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    if removed:
+        print(f"🧹 已清理 {removed} 个遗留的工作目录 ({root})")
+    return removed
+
+
+class RunWorkspace:
+    """
+    一次运行独占的工作目录 <root>/<name>-<随机后缀>/，多个运行可以共用同一台主机和同一个 root。
+
+    目录内的产物分两类:
+      - live: 仍被流程引用的文件 (当前合并场景、已通过QA但尚未写入检查点的资产等)，永不回收；
+      - disposable: 已被取代的中间产物 (旧的合并场景、未通过QA的尝试、用过的快照)，
+        在磁盘占用超过配额时按释放顺序回收，配额充足时保留以便排查问题。
+    close() 删除整个目录；恢复所需的文件由 RunCheckpoint 复制到运行目录中。
+    """
+
+    def __init__(self, name: str, root: str = DEFAULT_WORKSPACE_ROOT, quota_bytes: int = DEFAULT_WORKSPACE_QUOTA,
+                 keep: bool = KEEP_WORKSPACE):
+        self.name = name
+        self.path = os.path.join(root, f"{name}-{uuid.uuid4().hex[:8]}")
+        self.quota_bytes = quota_bytes
+        self.keep = keep
+        self._lock = threading.RLock()
+        # 绝对路径 -> {"size", "live", "released_at"}
+        self._artifacts: Dict[str, Dict] = {}
+        self.stats = {"tracked": 0, "evicted": 0, "evicted_bytes": 0, "peak_bytes": 0}
+        self.closed = False
+
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, _OWNER_FILE), "w", encoding="utf-8") as f:
+            json.dump({"host": socket.gethostname(), "pid": os.getpid(), "created_at": time.time()}, f)
+
+    def subdir(self, *parts: str) -> str:
+        """返回工作目录内的子目录 (自动创建)。"""
+        path = os.path.join(self.path, *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def contains(self, path: Optional[str]) -> bool:
+        if not path:
+            return False
+        root = os.path.abspath(self.path)
+        try:
+            return os.path.commonpath([root, os.path.abspath(path)]) == root
+        except ValueError:  # Windows 上位于不同盘符
+            return False
+
+    def adopt(self, path: str, category: str) -> str:
+        """把外部API写出的文件移入工作目录的 category 子目录并登记为 live，返回新路径。"""
+        if not self.contains(path):
+            target = os.path.join(self.subdir(category), os.path.basename(path))
+            shutil.move(path, target)
+            path = target
+        return self.track(path)
+
+    def track(self, path: str) -> str:
+        """登记工作目录内新写出的文件或目录为 live；同一路径被重新写入时覆盖之前的状态。"""
+        if not self.contains(path):
+            return path
+        with self._lock:
+            self._artifacts[os.path.abspath(path)] = {"size": _path_size(path), "live": True, "released_at": None}
+            self.stats["tracked"] += 1
+            self._enforce_quota()
+        return path
+
+    def release(self, *paths: Optional[str]):
+        """标记不再需要的产物为 disposable；工作目录以外的路径 (缓存、检查点、共享存储) 被忽略。"""
+        with self._lock:
+            for path in paths:
+                if not self.contains(path):
+                    continue
+                key = os.path.abspath(path)
+                entry = self._artifacts.get(key)
+                if entry is None:
+                    entry = self._artifacts[key] = {"size": _path_size(path), "live": True, "released_at": None}
+                if entry["live"]:
+                    entry["live"] = False
+                    entry["released_at"] = time.monotonic()
+            self._enforce_quota()
+
+    def usage(self) -> int:
+        with self._lock:
+            return sum(entry["size"] for entry in self._artifacts.values())
+
+    def live_bytes(self) -> int:
+        with self._lock:
+            return sum(entry["size"] for entry in self._artifacts.values() if entry["live"])
+
+    def _enforce_quota(self):
+        usage = sum(entry["size"] for entry in self._artifacts.values())
+        self.stats["peak_bytes"] = max(self.stats["peak_bytes"], usage)
+        if usage <= self.quota_bytes:
+            return
+        disposable = sorted(
+            (key for key, entry in self._artifacts.items() if not entry["live"]),
+            key=lambda key: self._artifacts[key]["released_at"],
+        )
+        for key in disposable:
+            if usage <= self.quota_bytes:
+                break
+            entry = self._artifacts.pop(key)
+            _remove_path(key)
+            usage -= entry["size"]
+            self.stats["evicted"] += 1
+            self.stats["evicted_bytes"] += entry["size"]
+        if usage > self.quota_bytes:
+            print(f"   ⚠️ 工作目录 {self.path} 的 live 产物 ({usage / 1024 ** 2:.1f} MB) 已超过配额 "
+                  f"({self.quota_bytes / 1024 ** 2:.0f} MB)，无可回收的中间产物。")
+
+    def gc(self) -> int:
+        """立即回收所有 disposable 产物，返回释放的字节数。"""
+        with self._lock:
+            freed = 0
+            for key in [key for key, entry in self._artifacts.items() if not entry["live"]]:
+                entry = self._artifacts.pop(key)
+                _remove_path(key)
+                freed += entry["size"]
+                self.stats["evicted"] += 1
+                self.stats["evicted_bytes"] += entry["size"]
+            return freed
+
+    def close(self):
+        """运行结束：删除整个工作目录 (keep=True 时保留)。"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            if not self.keep:
+                shutil.rmtree(self.path, ignore_errors=True)
+
+    def print_report(self):
+        print("\n--- 🧺 工作目录统计 ---")
+        print(f"   目录: {self.path}" + (" (已保留)" if self.keep else " (已删除)" if self.closed else ""))
+        print(f"   峰值占用: {self.stats['peak_bytes'] / 1024 ** 2:.1f} MB / {self.quota_bytes / 1024 ** 2:.0f} MB, "
+              f"登记产物: {self.stats['tracked']}, 回收: {self.stats['evicted']} "
+              f"({self.stats['evicted_bytes'] / 1024 ** 2:.1f} MB)")